@@ -1,22 +1,69 @@
 ﻿# app.py
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
-from flask_session import Session
+import time
+from flask import Flask, Blueprint, render_template, request, redirect, url_for, session, Response, stream_with_context, abort, g, make_response, current_app
 import datetime
 from decimal import Decimal
-from db import fetchone, fetchall, execute, transaction
-from utils import to_int, to_float, currency
+import db
+from db import fetchone, fetchall, execute, transaction, gather
+from utils import to_int, to_float, currency, decode_cursor, split_page
+import search_index
+import keyword_index
+import facets
+import listing_sync
+from cache import analytics_cache
+import rollups
+import export
+import metrics
+import slowlog
+import images
+import assets
+import conditional
+import matching
+import similar
+import jobs
+import session_store
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = Flask(__name__, template_folder="templates", static_folder="static")
-app.secret_key = os.environ.get("SECRET_KEY", "change_this_secret_please")
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+# routes live on a blueprint so create_app() can build the app without
+# touching MySQL; endpoints are named main.<view>
+bp = Blueprint('main', __name__)
+PAGE_SIZE = to_int(os.environ.get("PAGE_SIZE")) or 50
+MAX_PAGE_SIZE = 200
+
+metrics.registry.describe('homescout_analytics_cache_hits', 'counter', 'Analytics cache hits')
+metrics.registry.describe('homescout_analytics_cache_misses', 'counter', 'Analytics cache misses')
+metrics.registry.gauge('homescout_analytics_cache_hits', lambda: analytics_cache.hits)
+metrics.registry.gauge('homescout_analytics_cache_misses', lambda: analytics_cache.misses)
+
+# --- request instrumentation ---
+@bp.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    # in the process that serves, not in a preloading parent about to fork
+    jobs.start()
+    metrics.begin_request((request.endpoint or 'unmatched').rpartition('.')[2])
+    # read-your-writes: a session that wrote recently reads from the primary
+    db.begin_routing(primary_reads=time.time() - session.get('_wrote_at', 0) < db.READ_PIN_SECONDS)
+
+@bp.after_app_request
+def finish_request_metrics(response):
+    started = g.get('request_started')
+    stats = metrics.end_request(response.status_code, time.perf_counter() - started if started else 0.0)
+    if stats is not None:
+        response.headers['X-Query-Count'] = str(stats.queries)
+        response.headers['X-DB-Time-Ms'] = f'{stats.db_seconds * 1000:.1f}'
+    routing = db.end_routing()
+    if routing is not None:
+        response.headers['X-DB-Reads'] = f"primary={routing.reads['primary']}, replica={routing.reads['replica']}"
+        if routing.wrote:
+            session['_wrote_at'] = time.time()
+    return response
 
 # --- ADD CUSTOM FILTER HERE ---
-@app.template_filter('format_price')
+@bp.app_template_filter('format_price')
 def format_price_filter(value):
     """Format price with commas for thousands"""
     try:
@@ -30,22 +77,83 @@ def format_price_filter(value):
 
 # --- helpers ---
 def login_user_row(row):
+    current_app.session_interface.rotate(session)
     session['user_id'] = row['user_id']
     session['username'] = row['username']
     session['role'] = row['role']
 
+def page_size():
+    size = to_int(request.args.get('per_page')) or PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+def next_page_url(endpoint, cursor):
+    if cursor is None:
+        return None
+    args = request.args.to_dict()
+    args['cursor'] = cursor
+    return url_for(endpoint, **args)
+
+def listing_filters(city, min_price, max_price, min_rooms):
+    """SQL conditions and params for the structured /search filters."""
+    sql, params = "", []
+    if city:
+        sql += "AND city=%s "; params.append(city)
+    if min_price:
+        sql += "AND base_price >= %s "; params.append(min_price)
+    if max_price:
+        sql += "AND base_price <= %s "; params.append(max_price)
+    if min_rooms:
+        sql += "AND total_rooms >= %s "; params.append(min_rooms)
+    return sql, params
+
+def keyword_listings(q, city, min_price, max_price, min_rooms, after, limit):
+    """Listings matching every word of q, best match first, each with its 'relevance'."""
+    hits = keyword_index.search(q, city, min_price, max_price, min_rooms, limit=limit, after=after)
+    if hits is not None:
+        if not hits:
+            return []
+        rows = fetchall("SELECT * FROM properties WHERE property_id IN (%s) AND status='Available' AND lifecycle_status='Enlisted'"
+                        % ','.join(['%s'] * len(hits)), tuple(pid for pid, _ in hits))
+        by_id = {r['property_id']: r for r in rows}
+        return [dict(by_id[pid], relevance=score) for pid, score in hits if pid in by_id]
+    # index off: MySQL FULLTEXT, every word required, prefix match for plurals
+    against = ' '.join(f'+{t}*' for t in keyword_index.tokens(q))
+    if not against:
+        return []
+    sql = ("SELECT *, MATCH(title, description) AGAINST (%s IN BOOLEAN MODE) as relevance FROM properties "
+           "WHERE status='Available' AND lifecycle_status='Enlisted' AND MATCH(title, description) AGAINST (%s IN BOOLEAN MODE) ")
+    filters, params = listing_filters(city, min_price, max_price, min_rooms)
+    sql += filters
+    params = [against, against] + params
+    if after:
+        sql += "HAVING relevance < %s OR (relevance = %s AND property_id > %s) "; params += [after[0], after[0], after[1]]
+    sql += "ORDER BY relevance DESC, property_id ASC LIMIT %s"
+    params.append(limit)
+    return fetchall(sql, tuple(params))
+
+def search_facets(q, city, min_price, max_price, min_rooms):
+    """Facet counts for the whole result set of a /search, not just the page shown."""
+    ids = None
+    if q:
+        ids = keyword_index.matching_ids(q)
+        if ids is None:
+            against = ' '.join(f'+{t}*' for t in keyword_index.tokens(q))
+            rows = fetchall("SELECT property_id FROM properties WHERE MATCH(title, description) AGAINST (%s IN BOOLEAN MODE)", (against,))
+            ids = [r['property_id'] for r in rows]
+    return facets.counts(city, min_price, max_price, min_rooms, ids)
+
 def require_roles(*roles):
     def decorator(fn):
         def wrapped(*a, **kw):
             if session.get('role') not in roles:
-                return redirect(url_for('index'))
+                return redirect(url_for('main.index'))
             return fn(*a, **kw)
         wrapped.__name__ = fn.__name__
         return wrapped
     return decorator
 
 # --- routes ---
-@app.route('/')
+@bp.route('/')
 def index():
     success = session.pop('_success', None)
     error = session.pop('_error', None)
@@ -90,7 +198,7 @@ def index():
                          error=error)
 
 # Register (plain password)
-@app.route('/register', methods=['GET','POST'])
+@bp.route('/register', methods=['GET','POST'])
 def register():
     if request.method == 'GET':
         return render_template('register.html')
@@ -101,26 +209,29 @@ def register():
     role = request.form.get('role','buyer')
     if not username or not password:
         session['_error'] = 'Missing username or password'
-        return redirect(url_for('register'))
+        return redirect(url_for('main.register'))
     existing = fetchone('SELECT user_id FROM users WHERE username=%s OR email=%s OR phone=%s', (username, email, phone))
     if existing:
         session['_error'] = 'Username/email/phone already exists'
-        return redirect(url_for('register'))
-    user_id = execute('INSERT INTO users (username,email,phone,password,role) VALUES (%s,%s,%s,%s,%s)', (username, email, phone, password, role))
-    # create role record
-    if role == 'buyer':
-        execute('INSERT INTO buyers (buyer_id, full_name) VALUES (%s,%s)', (user_id, username))
-    elif role == 'seller':
-        execute('INSERT INTO sellers (seller_id, full_name) VALUES (%s,%s)', (user_id, username))
-    elif role == 'employee':
-        execute('INSERT INTO employees (employee_id, display_name) VALUES (%s,%s)', (user_id, username))
-    elif role == 'investor':
-        execute('INSERT INTO investors (investor_id, full_name) VALUES (%s,%s)', (user_id, username))
+        return redirect(url_for('main.register'))
+    with transaction() as (conn, cur):
+        cur.execute('INSERT INTO users (username,email,phone,password,role) VALUES (%s,%s,%s,%s,%s)', (username, email, phone, password, role))
+        user_id = cur.lastrowid
+        # create role record
+        if role == 'buyer':
+            cur.execute('INSERT INTO buyers (buyer_id, full_name) VALUES (%s,%s)', (user_id, username))
+        elif role == 'seller':
+            cur.execute('INSERT INTO sellers (seller_id, full_name) VALUES (%s,%s)', (user_id, username))
+        elif role == 'employee':
+            cur.execute('INSERT INTO employees (employee_id, display_name) VALUES (%s,%s)', (user_id, username))
+        elif role == 'investor':
+            cur.execute('INSERT INTO investors (investor_id, full_name) VALUES (%s,%s)', (user_id, username))
+    analytics_cache.invalidate('users', 'employees')
     session['_success'] = 'Registered. Please login.'
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 # Login (plain password)
-@app.route('/login', methods=['GET','POST'])
+@bp.route('/login', methods=['GET','POST'])
 def login():
     if request.method == 'GET':
         return render_template('login.html')
@@ -129,60 +240,114 @@ def login():
     row = fetchone('SELECT user_id, username, role, password FROM users WHERE username=%s OR email=%s OR phone=%s', (ident, ident, ident))
     if not row or row.get('password') != password:
         session['_error'] = 'Invalid credentials'
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     login_user_row(row)
     session['_success'] = 'Welcome ' + row['username']
     # redirect to role dashboard
     role = row['role']
-    if role == 'admin': return redirect(url_for('admin_dashboard'))
-    if role == 'seller': return redirect(url_for('seller_dashboard'))
-    if role == 'buyer': return redirect(url_for('buyer_dashboard'))
-    if role == 'employee': return redirect(url_for('agent_dashboard'))
-    if role == 'investor': return redirect(url_for('investor_dashboard'))
-    return redirect(url_for('index'))
-
-@app.route('/logout')
+    if role == 'admin': return redirect(url_for('main.admin_dashboard'))
+    if role == 'seller': return redirect(url_for('main.seller_dashboard'))
+    if role == 'buyer': return redirect(url_for('main.buyer_dashboard'))
+    if role == 'employee': return redirect(url_for('main.agent_dashboard'))
+    if role == 'investor': return redirect(url_for('main.investor_dashboard'))
+    return redirect(url_for('main.index'))
+
+@bp.route('/logout')
 def logout():
     session.clear()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 # --- admin ---
-@app.route('/admin')
+@bp.route('/admin')
 @require_roles('admin')
 def admin_dashboard():
-    totals = fetchone('SELECT (SELECT COUNT(*) FROM users) as users, (SELECT COUNT(*) FROM properties) as properties, (SELECT COUNT(*) FROM sales) as sales')
-    top_locations = fetchall('SELECT city, COUNT(*) as cnt FROM properties GROUP BY city ORDER BY cnt DESC LIMIT 10')
-    top_agents = fetchall('SELECT e.employee_id, e.display_name, COALESCE(SUM(s.final_price),0) as total_sales, COUNT(s.sale_id) as sales_count FROM employees e LEFT JOIN sales s ON e.employee_id=s.employee_id GROUP BY e.employee_id ORDER BY total_sales DESC LIMIT 10')
+    totals, top_locations, top_agents = gather(
+        (fetchone, 'SELECT (SELECT COUNT(*) FROM users) as users, (SELECT COUNT(*) FROM properties) as properties, (SELECT COALESCE(SUM(sales_count),0) FROM sales_by_month) as sales'),
+        (fetchall, 'SELECT city, COUNT(*) as cnt FROM properties GROUP BY city ORDER BY cnt DESC LIMIT 10'),
+        (fetchall, 'SELECT e.employee_id, e.display_name, COALESCE(r.total_value,0) as total_sales, COALESCE(r.sales_count,0) as sales_count FROM employees e LEFT JOIN sales_by_agent r ON e.employee_id=r.employee_id ORDER BY total_sales DESC LIMIT 10'),
+    )
     return render_template('admin.html', totals=totals, top_locations=top_locations, top_agents=top_agents)
 
-@app.route('/admin/users')
+@bp.route('/admin/users')
 @require_roles('admin')
 def admin_users():
-    users = fetchall('SELECT user_id, username, email, phone, role, created_at FROM users ORDER BY user_id LIMIT 200')
-    return render_template('admin_users.html', users=users)
-
-@app.route('/admin/properties')
+    size = page_size()
+    after = decode_cursor(request.args.get('cursor'), 1)
+    if after:
+        users = fetchall('SELECT user_id, username, email, phone, role, created_at FROM users WHERE user_id > %s ORDER BY user_id LIMIT %s', (after[0], size + 1))
+    else:
+        users = fetchall('SELECT user_id, username, email, phone, role, created_at FROM users ORDER BY user_id LIMIT %s', (size + 1,))
+    users, cursor = split_page(users, size, lambda u: (u['user_id'],))
+    return render_template('admin_users.html', users=users, next_url=next_page_url('main.admin_users', cursor))
+
+@bp.route('/admin/properties')
 @require_roles('admin')
 def admin_properties():
-    props = fetchall('SELECT p.*, s.full_name as seller_name, e.display_name as agent_name FROM properties p LEFT JOIN sellers s ON p.seller_id=s.seller_id LEFT JOIN employees e ON p.listed_by_employee=e.employee_id ORDER BY p.created_at DESC LIMIT 500')
-    return render_template('admin_properties.html', properties=props)
-
-@app.route('/admin/remove_user/<int:user_id>', methods=['POST'])
+    size = page_size()
+    after = decode_cursor(request.args.get('cursor'), 2)
+    sql = 'SELECT p.*, s.full_name as seller_name, e.display_name as agent_name FROM properties p LEFT JOIN sellers s ON p.seller_id=s.seller_id LEFT JOIN employees e ON p.listed_by_employee=e.employee_id '
+    params = []
+    if after:
+        sql += 'WHERE (p.created_at < %s OR (p.created_at = %s AND p.property_id < %s)) '
+        params += [after[0], after[0], after[1]]
+    sql += 'ORDER BY p.created_at DESC, p.property_id DESC LIMIT %s'
+    params.append(size + 1)
+    props = fetchall(sql, tuple(params))
+    props, cursor = split_page(props, size, lambda p: (p['created_at'], p['property_id']))
+    return render_template('admin_properties.html', properties=props, next_url=next_page_url('main.admin_properties', cursor))
+
+@bp.route('/admin/remove_user/<int:user_id>', methods=['POST'])
 @require_roles('admin')
 def admin_remove_user(user_id):
-    execute('DELETE FROM users WHERE user_id=%s', (user_id,))
+    with transaction() as (conn, cur):
+        # a seller's listings cascade with the user and leave no row behind:
+        # tombstone them so every process drops them from its indexes
+        cur.execute('SELECT property_id FROM properties WHERE seller_id=%s FOR UPDATE', (user_id,))
+        listings = [property_id for (property_id,) in cur.fetchall()]
+        listing_sync.record_deletions(cur, listings)
+        cur.execute('DELETE FROM users WHERE user_id=%s', (user_id,))
+    for property_id in listings:
+        search_index.discard(property_id)
+        keyword_index.discard(property_id)
+        facets.discard(property_id)
+        similar.discard(property_id)
+    # role rows, listings and sales may cascade with the user
+    analytics_cache.invalidate('users', 'employees', 'properties', 'sales')
     session['_success'] = 'User removed'
-    return redirect(url_for('admin_users'))
+    return redirect(url_for('main.admin_users'))
 
-@app.route('/admin/remove_property/<int:property_id>', methods=['POST'])
+@bp.route('/admin/remove_property/<int:property_id>', methods=['POST'])
 @require_roles('admin')
 def admin_remove_property(property_id):
     execute('UPDATE properties SET lifecycle_status=%s, status=%s WHERE property_id=%s', ('Removed','Inactive',property_id))
+    search_index.refresh(property_id)
+    keyword_index.refresh(property_id)
+    facets.refresh(property_id)
+    similar.refresh(property_id)
+    analytics_cache.invalidate('properties')
     session['_success'] = 'Property removed'
-    return redirect(url_for('admin_properties'))
+    return redirect(url_for('main.admin_properties'))
+
+@bp.route('/admin/export/<name>')
+@require_roles('admin')
+def admin_export(name):
+    """Stream a full extract as CSV or NDJSON (?format=, ?from=, ?to=, ?city=)"""
+    fmt = request.args.get('format', 'csv')
+    if name not in export.EXPORTS or fmt not in export.FORMATS:
+        abort(404)
+    chunks = export.stream(name, fmt, request.args.get('from'), request.args.get('to'), request.args.get('city'))
+    filename = f'{name}-{datetime.date.today().isoformat()}.{fmt}'
+    return Response(stream_with_context(chunks), mimetype=export.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@bp.route('/admin/slow_queries')
+@require_roles('admin')
+def admin_slow_queries():
+    return render_template('slow_queries.html', offenders=slowlog.log.offenders(),
+                           threshold_ms=slowlog.log.threshold * 1000)
 
 # --- seller ---
-@app.route('/seller')
+@bp.route('/seller')
 @require_roles('seller')
 def seller_dashboard():
     seller_id = session.get('user_id')
@@ -190,7 +355,7 @@ def seller_dashboard():
     properties = fetchall('SELECT * FROM properties WHERE seller_id=%s ORDER BY created_at DESC', (seller_id,))
     return render_template('seller.html', requests=requests, properties=properties)
 
-@app.route('/seller/new_request', methods=['GET','POST'])
+@bp.route('/seller/new_request', methods=['GET','POST'])
 @require_roles('seller')
 def seller_new_request():
     if request.method == 'GET':
@@ -204,10 +369,10 @@ def seller_new_request():
     notes = request.form.get('notes')
     execute('INSERT INTO seller_requests (seller_id, approx_location, approx_city, approx_price, approx_floor, approx_rooms, notes) VALUES (%s,%s,%s,%s,%s,%s,%s)', (seller_id, approx_location, approx_city, approx_price, approx_floor, approx_rooms, notes))
     session['_success'] = 'Request submitted'
-    return redirect(url_for('seller_dashboard'))
+    return redirect(url_for('main.seller_dashboard'))
 
 # --- property completion (agent/admin) ---
-@app.route('/property/complete/<int:property_id>', methods=['GET','POST'])
+@bp.route('/property/complete/<int:property_id>', methods=['GET','POST'])
 @require_roles('admin','employee')
 def property_complete(property_id):
     if request.method == 'GET':
@@ -232,43 +397,109 @@ def property_complete(property_id):
                parking_type=%s, base_price=%s, estimated_market_value=%s, lifecycle_status=%s, status=%s
                WHERE property_id=%s""",
             (listed_by_employee, title, description, area_sqft, floor, total_rooms, bathrooms, balcony_count, facing, has_lift, open_kitchen, parking_type, base_price, est_val, 'Enlisted', 'Available', property_id))
+    search_index.refresh(property_id)
+    keyword_index.refresh(property_id)
+    facets.refresh(property_id)
+    similar.refresh(property_id)
+    analytics_cache.invalidate('properties')
+    matching.enqueue(property_id)
     session['_success'] = 'Property completed & enlisted'
-    return redirect(url_for('admin_properties') if session.get('role')=='admin' else url_for('agent_dashboard'))
+    return redirect(url_for('main.admin_properties') if session.get('role')=='admin' else url_for('main.agent_dashboard'))
 
 # --- buyer ---
-@app.route('/buyer')
+@bp.route('/buyer')
 @require_roles('buyer')
 def buyer_dashboard():
     properties = fetchall("SELECT * FROM properties WHERE status='Available' AND lifecycle_status='Enlisted' ORDER BY created_at DESC LIMIT 10")
-    return render_template('buyer.html', properties=properties)
+    saved_searches = fetchall('SELECT * FROM saved_searches WHERE buyer_id=%s ORDER BY created_at DESC', (session.get('user_id'),))
+    return render_template('buyer.html', properties=properties, saved_searches=saved_searches)
 
-@app.route('/search')
+@bp.route('/search/save', methods=['POST'])
+@require_roles('buyer')
+def save_search():
+    matching.save_search(session.get('user_id'), request.form.get('city'), request.form.get('min_price'),
+                         request.form.get('max_price'), request.form.get('min_rooms'))
+    session['_success'] = 'Search saved. An agent will contact you when a matching property is listed.'
+    return redirect(url_for('main.buyer_dashboard'))
+
+@bp.route('/search/saved/<int:search_id>/delete', methods=['POST'])
+@require_roles('buyer')
+def delete_saved_search(search_id):
+    matching.delete_search(session.get('user_id'), search_id)
+    session['_success'] = 'Saved search removed'
+    return redirect(url_for('main.buyer_dashboard'))
+
+@bp.route('/search')
 def search_results():
     city = request.args.get('city')
     min_price = request.args.get('min_price')
     max_price = request.args.get('max_price')
     min_rooms = request.args.get('min_rooms')
-    sql = "SELECT * FROM properties WHERE status='Available' AND lifecycle_status='Enlisted' "
-    params = []
-    if city:
-        sql += "AND city=%s "; params.append(city)
-    if min_price:
-        sql += "AND base_price >= %s "; params.append(min_price)
-    if max_price:
-        sql += "AND base_price <= %s "; params.append(max_price)
-    if min_rooms:
-        sql += "AND total_rooms >= %s "; params.append(min_rooms)
-    sql += "ORDER BY base_price ASC LIMIT 200"
-    properties = fetchall(sql, tuple(params))
-    return render_template('search_results.html', properties=properties, filters=request.args)
-
-@app.route('/property/<int:property_id>')
+    q = (request.args.get('q') or '').strip()
+    if not keyword_index.tokens(q):
+        q = ''   # nothing but stopwords: plain filtered search
+    etag = last_modified = None
+    if conditional.cacheable_page():
+        # validated by the tables themselves, so every worker tags the same state alike
+        mark = listing_sync.watermark()
+        last_modified = listing_sync.latest(mark)
+        etag = conditional.page_etag('search', sorted(request.args.items(multi=True)), *mark)
+        not_modified = conditional.check(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        # the page is built from in-process indexes: bring them up to that state first
+        if q:
+            keyword_index.catch_up(mark)
+        else:
+            search_index.catch_up(mark)
+        facets.catch_up(mark)
+    size = page_size()
+    after = decode_cursor(request.args.get('cursor'), 2)
+    if q:
+        # ranked by relevance, so pages continue from (relevance, property_id)
+        properties = keyword_listings(q, city, min_price, max_price, min_rooms, after, size + 1)
+        page_key = lambda p: (p['relevance'], p['property_id'])
+    else:
+        properties = search_index.search(city, min_price, max_price, min_rooms, limit=size + 1, after=after)
+        page_key = lambda p: (p['base_price'], p['property_id'])
+    if properties is None:
+        filters, params = listing_filters(city, min_price, max_price, min_rooms)
+        sql = "SELECT * FROM properties WHERE status='Available' AND lifecycle_status='Enlisted' " + filters
+        if after and after[0] is None:
+            # NULL prices sort first; continue within them, then the priced rows
+            sql += "AND (base_price IS NOT NULL OR property_id > %s) "; params.append(after[1])
+        elif after:
+            sql += "AND (base_price > %s OR (base_price = %s AND property_id > %s)) "; params += [after[0], after[0], after[1]]
+        sql += "ORDER BY base_price ASC, property_id ASC LIMIT %s"
+        params.append(size + 1)
+        properties = fetchall(sql, tuple(params))
+    properties, cursor = split_page(properties, size, page_key)
+    response = make_response(render_template('search_results.html', properties=properties, filters=request.args,
+                                             facets=search_facets(q, city, min_price, max_price, min_rooms),
+                                             next_url=next_page_url('main.search_results', cursor)))
+    return conditional.tag(response, etag, last_modified) if etag else response
+
+@bp.route('/property/<int:property_id>')
 def property_detail(property_id):
+    etag = last_modified = None
+    if conditional.cacheable_page():
+        probe = fetchone('SELECT p.updated_at, (SELECT MAX(uploaded_at) FROM property_photos ph WHERE ph.property_id=p.property_id) as photos_at, (SELECT COUNT(*) FROM property_photos ph WHERE ph.property_id=p.property_id) as photo_count FROM properties p WHERE p.property_id=%s', (property_id,))
+        if probe:
+            # the similar-listings panel changes with any listing, deletes included
+            mark = listing_sync.watermark()
+            similar.catch_up(mark)
+            etag = conditional.page_etag('property', property_id, probe['updated_at'], probe['photos_at'], probe['photo_count'], *mark)
+            last_modified = max(filter(None, [probe['updated_at'], probe['photos_at']]), default=None)
+            not_modified = conditional.check(etag, last_modified)
+            if not_modified is not None:
+                return not_modified
     prop = fetchone('SELECT p.*, s.full_name as seller_name, e.display_name as agent_name FROM properties p LEFT JOIN sellers s ON p.seller_id=s.seller_id LEFT JOIN employees e ON p.listed_by_employee=e.employee_id WHERE p.property_id=%s', (property_id,))
     photos = fetchall('SELECT * FROM property_photos WHERE property_id=%s ORDER BY is_primary DESC, uploaded_at DESC', (property_id,))
-    return render_template('property_detail.html', prop=prop, photos=photos)
+    similar_props = similar.similar(property_id) if prop else []
+    response = make_response(render_template('property_detail.html', prop=prop, photos=photos, similar_props=similar_props))
+    return conditional.tag(response, etag, last_modified) if etag else response
 
-@app.route('/enquiry', methods=['POST'])
+@bp.route('/enquiry', methods=['POST'])
 @require_roles('buyer')
 def create_enquiry():
     property_id = int(request.form.get('property_id'))
@@ -276,16 +507,16 @@ def create_enquiry():
     agent = fetchone('SELECT employee_id FROM employees WHERE status=%s LIMIT 1', ('Active',))
     if not agent:
         session['_error'] = 'No agent available'
-        return redirect(url_for('property_detail', property_id=property_id))
+        return redirect(url_for('main.property_detail', property_id=property_id))
     employee_id = agent['employee_id']
     enquiry_date = datetime.date.today()
     notes = request.form.get('notes')
     execute('INSERT INTO enquiries (property_id, buyer_id, employee_id, enquiry_date, notes) VALUES (%s,%s,%s,%s,%s)', (property_id, buyer_id, employee_id, enquiry_date, notes))
     session['_success'] = 'Enquiry created'
-    return redirect(url_for('property_detail', property_id=property_id))
+    return redirect(url_for('main.property_detail', property_id=property_id))
 
 # --- agent ---
-@app.route('/agent')
+@bp.route('/agent')
 @require_roles('employee')
 def agent_dashboard():
     emp_id = session.get('user_id')
@@ -293,26 +524,26 @@ def agent_dashboard():
     properties = fetchall('SELECT * FROM properties WHERE listed_by_employee=%s', (emp_id,))
     return render_template('agent.html', enquiries=enquiries, properties=properties)
 
-@app.route('/agent/update_enquiry/<int:enquiry_id>', methods=['POST'])
+@bp.route('/agent/update_enquiry/<int:enquiry_id>', methods=['POST'])
 @require_roles('employee')
 def update_enquiry(enquiry_id):
     status = request.form.get('status')
     notes = request.form.get('notes')
     execute('UPDATE enquiries SET status=%s, notes=CONCAT(COALESCE(notes,""),%s) WHERE enquiry_id=%s', (status, '\n'+(notes or ''), enquiry_id))
     session['_success'] = 'Enquiry updated'
-    return redirect(url_for('agent_dashboard'))
+    return redirect(url_for('main.agent_dashboard'))
 
 # --- sale completion ---
-@app.route('/sale/complete', methods=['POST'])
+@bp.route('/sale/complete', methods=['POST'])
 @require_roles('employee','admin')
 def sale_complete():
     property_id = int(request.form.get('property_id'))
     buyer_id = int(request.form.get('buyer_id'))
     final_price = Decimal(request.form.get('final_price') or 0)
-    prop = fetchone('SELECT seller_id, listed_by_employee FROM properties WHERE property_id=%s', (property_id,))
+    prop = fetchone('SELECT seller_id, listed_by_employee, city FROM properties WHERE property_id=%s', (property_id,))
     if not prop:
         session['_error'] = 'Property not found'
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     seller_id = prop['seller_id']
     employee_id = prop['listed_by_employee'] or session.get('user_id')
     emp_comm = (final_price * Decimal('0.002'))  # 0.2%
@@ -322,19 +553,29 @@ def sale_complete():
         with transaction() as (conn, cur):
             cur.execute('INSERT INTO sales (property_id,buyer_id,seller_id,employee_id,final_price,employee_commission,company_commission,sale_date) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)', (property_id, buyer_id, seller_id, employee_id, float(final_price), float(emp_comm), float(comp_comm), sale_date))
             sale_id = cur.lastrowid
-            cur.execute('INSERT INTO payments (sale_id, from_user_id, to_user_id, payment_type, amount, notes) VALUES (%s,%s,%s,%s,%s,%s)', (sale_id, buyer_id, 1, 'BuyerToCompany', float(final_price), 'Buyer paid company'))
             payout_to_seller = float(final_price - (emp_comm + comp_comm))
-            cur.execute('INSERT INTO payments (sale_id, from_user_id, to_user_id, payment_type, amount, notes) VALUES (%s,%s,%s,%s,%s,%s)', (sale_id, 1, seller_id, 'CompanyToSeller', payout_to_seller, 'Payout to seller'))
-            cur.execute('INSERT INTO payments (sale_id, from_user_id, to_user_id, payment_type, amount, notes) VALUES (%s,%s,%s,%s,%s,%s)', (sale_id, 1, employee_id, 'CompanyToEmployee', float(emp_comm), 'Agent commission'))
+            # one multi-row INSERT for the three payment legs
+            cur.executemany('INSERT INTO payments (sale_id, from_user_id, to_user_id, payment_type, amount, notes) VALUES (%s,%s,%s,%s,%s,%s)', [
+                (sale_id, buyer_id, 1, 'BuyerToCompany', float(final_price), 'Buyer paid company'),
+                (sale_id, 1, seller_id, 'CompanyToSeller', payout_to_seller, 'Payout to seller'),
+                (sale_id, 1, employee_id, 'CompanyToEmployee', float(emp_comm), 'Agent commission'),
+            ])
             cur.execute('UPDATE properties SET status=%s, lifecycle_status=%s WHERE property_id=%s', ('Sold','Sold', property_id))
+            # rollups commit with the sale, so the dashboard shown next already counts it
+            rollups.record_sale(cur, employee_id, prop['city'], sale_date, final_price, emp_comm, comp_comm)
     except Exception as e:
         session['_error'] = f'Sale failed: {e}'
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
+    search_index.refresh(property_id)
+    keyword_index.refresh(property_id)
+    facets.refresh(property_id)
+    similar.refresh(property_id)
+    analytics_cache.invalidate('sales', 'properties')
     session['_success'] = 'Sale completed'
-    return redirect(url_for('admin_dashboard') if session.get('role')=='admin' else url_for('agent_dashboard'))
+    return redirect(url_for('main.admin_dashboard') if session.get('role')=='admin' else url_for('main.agent_dashboard'))
 
 # --- investor ---
-@app.route('/investor')
+@bp.route('/investor')
 @require_roles('investor')
 def investor_dashboard():
     investor_id = session.get('user_id')
@@ -362,7 +603,7 @@ def investor_dashboard():
                          investor_info=investor_info,
                          properties=available_properties)
 
-@app.route('/invest', methods=['POST'])
+@bp.route('/invest', methods=['POST'])
 @require_roles('investor')
 def invest():
     """Handle investment form submission"""
@@ -373,44 +614,56 @@ def invest():
         cur.execute('INSERT INTO property_investments (property_id, investor_id, invested_amount) VALUES (%s,%s,%s)', (property_id, investor_id, float(amount)))
         cur.execute('UPDATE investors SET total_invested = COALESCE(total_invested,0)+%s WHERE investor_id=%s', (float(amount), investor_id))
     session['_success'] = 'Investment recorded'
-    return redirect(url_for('investor_dashboard'))
+    return redirect(url_for('main.investor_dashboard'))
 
 # --- reports / complex queries (admin) ---
-@app.route('/reports')
+@bp.route('/reports')
 @require_roles('admin')
 def reports():
     return render_template('reports.html')
 
 # API ENDPOINTS
-@app.route('/api/best_employees')
+def chart_json(key, data_fn):
+    """Serve a cached chart; a matching If-None-Match is answered from the cache entry's hash"""
+    not_modified = conditional.check(analytics_cache.etag(key))
+    if not_modified is not None:
+        return not_modified
+    data = data_fn()
+    return conditional.json_response(data, analytics_cache.etag(key))
+
+def best_employees_data():
+    return analytics_cache.get_or_load('best_employees', lambda: fetchall('SELECT e.employee_id, e.display_name, COALESCE(r.sales_count,0) as sales_count, COALESCE(r.total_value,0) as total_value FROM employees e LEFT JOIN sales_by_agent r ON e.employee_id=r.employee_id ORDER BY sales_count DESC, total_value DESC LIMIT 20'), tags=('sales', 'employees'))
+
+@bp.route('/api/best_employees')
 @require_roles('admin')
 def api_best_employees():
-    rows = fetchall('SELECT e.employee_id, e.display_name, COUNT(s.sale_id) as sales_count, COALESCE(SUM(s.final_price),0) as total_value FROM employees e LEFT JOIN sales s ON e.employee_id=s.employee_id GROUP BY e.employee_id ORDER BY sales_count DESC, total_value DESC LIMIT 20')
-    return jsonify(rows)
+    return chart_json('best_employees', best_employees_data)
+
+def top_locations_data():
+    return analytics_cache.get_or_load('top_locations', lambda: fetchall('SELECT city, COUNT(*) as total_props, ROUND(AVG(base_price),2) as avg_price FROM properties GROUP BY city ORDER BY total_props DESC LIMIT 20'), tags=('properties',))
 
-@app.route('/api/top_locations')
+@bp.route('/api/top_locations')
 @require_roles('admin')
 def api_top_locations():
-    rows = fetchall('SELECT city, COUNT(*) as total_props, ROUND(AVG(base_price),2) as avg_price FROM properties GROUP BY city ORDER BY total_props DESC LIMIT 20')
-    return jsonify(rows)
+    return chart_json('top_locations', top_locations_data)
 
-@app.route('/api/user_distribution')
-@require_roles('admin')
-def api_user_distribution():
-    """Get user role distribution for pie chart"""
-    distribution = fetchall('''
+def user_distribution_data():
+    distribution = analytics_cache.get_or_load('user_distribution', lambda: fetchall('''
         SELECT role, COUNT(*) as count 
         FROM users 
         GROUP BY role 
         ORDER BY count DESC
-    ''')
-    return jsonify(distribution)
+    '''), tags=('users',))
+    return distribution
 
-@app.route('/api/district_properties')
+@bp.route('/api/user_distribution')
 @require_roles('admin')
-def api_district_properties():
-    """Get property count by Bangladeshi districts"""
-    districts = fetchall('''
+def api_user_distribution():
+    """Get user role distribution for pie chart"""
+    return chart_json('user_distribution', user_distribution_data)
+
+def district_properties_data():
+    districts = analytics_cache.get_or_load('district_properties', lambda: fetchall('''
         SELECT city as district, COUNT(*) as properties, 
                AVG(base_price) as avg_price
         FROM properties 
@@ -418,7 +671,7 @@ def api_district_properties():
         GROUP BY city 
         ORDER BY properties DESC 
         LIMIT 10
-    ''')
+    '''), tags=('properties',))
     
     if not districts:
         districts = [
@@ -434,21 +687,21 @@ def api_district_properties():
             {'district': "Cox's Bazar", 'properties': 12, 'avg_price': 7500000}
         ]
     
-    return jsonify(districts)
+    return districts
 
-@app.route('/api/monthly_revenue')
+@bp.route('/api/district_properties')
 @require_roles('admin')
-def api_monthly_revenue():
-    """Get monthly revenue trend"""
-    monthly_data = fetchall('''
-        SELECT DATE_FORMAT(sale_date, '%Y-%m') as month,
-               SUM(final_price) as revenue,
-               COUNT(*) as sales
-        FROM sales 
-        WHERE sale_date >= DATE_SUB(NOW(), INTERVAL 12 MONTH)
-        GROUP BY DATE_FORMAT(sale_date, '%Y-%m')
+def api_district_properties():
+    """Get property count by Bangladeshi districts"""
+    return chart_json('district_properties', district_properties_data)
+
+def monthly_revenue_data():
+    monthly_data = analytics_cache.get_or_load('monthly_revenue', lambda: fetchall('''
+        SELECT month, revenue, sales_count as sales
+        FROM sales_by_month 
+        WHERE month >= DATE_FORMAT(DATE_SUB(NOW(), INTERVAL 12 MONTH), '%Y-%m')
         ORDER BY month
-    ''')
+    '''), tags=('sales',))
     
     if not monthly_data:
         monthly_data = [
@@ -466,20 +719,68 @@ def api_monthly_revenue():
             {'month': '2024-12', 'revenue': 62000000, 'sales': 35}
         ]
     
-    return jsonify(monthly_data)
+    return monthly_data
 
-@app.route('/api/property_status_stats')
+@bp.route('/api/monthly_revenue')
 @require_roles('admin')
-def api_property_status_stats():
-    """Get property status statistics"""
-    stats = fetchall('''
+def api_monthly_revenue():
+    """Get monthly revenue trend"""
+    return chart_json('monthly_revenue', monthly_revenue_data)
+
+def property_status_stats_data():
+    stats = analytics_cache.get_or_load('property_status_stats', lambda: fetchall('''
         SELECT status, COUNT(*) as count 
         FROM properties 
         GROUP BY status
-    ''')
-    return jsonify(stats)
+    '''), tags=('properties',))
+    return stats
+
+@bp.route('/api/property_status_stats')
+@require_roles('admin')
+def api_property_status_stats():
+    """Get property status statistics"""
+    return chart_json('property_status_stats', property_status_stats_data)
+
+@bp.route('/api/reports_bundle')
+@require_roles('admin')
+def api_reports_bundle():
+    """Every chart's data in one response, computed concurrently"""
+    parts = {
+        'best_employees': best_employees_data,
+        'top_locations': top_locations_data,
+        'user_distribution': user_distribution_data,
+        'district_properties': district_properties_data,
+        'monthly_revenue': monthly_revenue_data,
+        'property_status_stats': property_status_stats_data,
+    }
+    etags = [analytics_cache.etag(key) for key in parts]
+    if all(etags):
+        not_modified = conditional.check(conditional.make_etag(*etags))
+        if not_modified is not None:
+            return not_modified
+    results = gather(*[(fn,) for fn in parts.values()])
+    etags = [analytics_cache.etag(key) for key in parts]
+    return conditional.json_response(dict(zip(parts, results)), conditional.make_etag(*etags) if all(etags) else None)
+
+@bp.route('/api/cache_stats')
+@require_roles('admin')
+def api_cache_stats():
+    """Hit/miss counters for the analytics cache"""
+    return conditional.json_response(analytics_cache.stats())
+
+@bp.route('/api/db_stats')
+@require_roles('admin')
+def api_db_stats():
+    """Connection pools, replica lag and read routing settings"""
+    return conditional.json_response(db.stats())
+
+@bp.route('/api/job_stats')
+@require_roles('admin')
+def api_job_stats():
+    """Background job queue depth and oldest waiting job"""
+    return conditional.json_response(jobs.stats())
 
-@app.route('/api/weekly_summary')
+@bp.route('/api/weekly_summary')
 @require_roles('admin')
 def api_weekly_summary():
     """Get weekly performance summary"""
@@ -493,9 +794,9 @@ def api_weekly_summary():
         'sales_completed': 7,
         'sales_change': 15
     }
-    return jsonify(summary)
+    return conditional.json_response(summary)
 
-@app.route('/api/financial_overview')
+@bp.route('/api/financial_overview')
 @require_roles('admin')
 def api_financial_overview():
     """Get financial overview"""
@@ -506,9 +807,20 @@ def api_financial_overview():
         'net_profit': 7500000,
         'expenses': 750000
     }
-    return jsonify(overview)
+    return conditional.json_response(overview)
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(403)
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
-@app.route('/testdb')
+@bp.route('/assets/<path:filename>')
+def serve_asset(filename):
+    return assets.serve(filename)
+
+@bp.route('/testdb')
 def testdb():
     try:
         r = fetchone('SELECT 1 as ok')
@@ -516,5 +828,14 @@ def testdb():
     except Exception as e:
         return f'DB error: {e}', 500
 
+def create_app():
+    """Build the Flask app; nothing here connects to MySQL or starts threads."""
+    app = Flask(__name__, template_folder="templates", static_folder="static")
+    app.secret_key = os.environ.get("SECRET_KEY", "change_this_secret_please")
+    session_store.init_app(app)
+    app.register_blueprint(bp)
+    app.jinja_env.globals.update(image_srcset=images.image_srcset, image_url=images.image_url, asset_url=assets.asset_url)
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
+    create_app().run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
@@ -0,0 +1,147 @@
+# assets.py
+# Fingerprinted static assets.
+#   python assets.py build
+# copies every file under static/ to static/dist/ with a content hash in its
+# name, writes .gz (and .br when the brotli module is installed) next to
+# compressible files, and records the mapping in static/dist/manifest.json.
+# asset_url() resolves to the hashed copy, served from /assets/ with
+# immutable cache headers; without a manifest it falls back to url_for().
+import os
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import mimetypes
+import threading
+from flask import url_for, send_from_directory, abort, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST = os.path.join(DIST_DIR, 'manifest.json')
+# image derivatives already carry a content hash in their names
+PREHASHED = ('images/derived/',)
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.json', '.txt', '.map', '.ico')
+MAX_AGE = 365 * 24 * 3600
+
+_manifest = {'mtime': None, 'data': {}}
+_lock = threading.Lock()
+
+def manifest():
+    try:
+        mtime = os.path.getmtime(MANIFEST)
+    except OSError:
+        return {}
+    with _lock:
+        if _manifest['mtime'] != mtime:
+            with open(MANIFEST, encoding='utf-8') as f:
+                _manifest['data'] = json.load(f)
+            _manifest['mtime'] = mtime
+        return _manifest['data']
+
+def asset_url(endpoint, **values):
+    """Drop-in for url_for() that points static files at their hashed copy."""
+    if endpoint == 'static':
+        hashed = manifest().get(values.get('filename'))
+        if hashed:
+            values['filename'] = hashed
+            return url_for('main.serve_asset', **values)
+    return url_for(endpoint, **values)
+
+def accepted_encodings(header):
+    out = set()
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q=') and q[2:].strip() in ('0', '0.0', '0.00', '0.000'):
+            continue
+        if token:
+            out.add(token.strip().lower())
+    return out
+
+def serve(filename):
+    """Send a hashed asset, preferring a precompressed variant."""
+    if not os.path.isfile(os.path.join(DIST_DIR, filename)):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding'))
+    send_name, encoding = filename, None
+    for enc, ext in (('br', '.br'), ('gzip', '.gz')):
+        if enc in accepted and os.path.isfile(os.path.join(DIST_DIR, filename + ext)):
+            send_name, encoding = filename + ext, enc
+            break
+    response = send_from_directory(DIST_DIR, send_name, mimetype=mimetype, max_age=MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f'public, max-age={MAX_AGE}, immutable'
+    return response
+
+# --- build step ---
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()[:10]
+
+def hashed_name(rel, digest):
+    if rel.startswith(PREHASHED):
+        return rel
+    stem, ext = os.path.splitext(rel)
+    return f'{stem}.{digest}{ext}'
+
+def source_files():
+    for root, dirs, files in os.walk(STATIC_DIR):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != DIST_DIR]
+        for name in files:
+            if name.endswith('.tmp'):
+                continue
+            yield os.path.relpath(os.path.join(root, name), STATIC_DIR).replace(os.sep, '/')
+
+def write_compressed(dest, data):
+    with gzip.open(dest + '.gz', 'wb', compresslevel=9) as f:
+        f.write(data)
+    if brotli is not None:
+        with open(dest + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+def build():
+    os.makedirs(DIST_DIR, exist_ok=True)
+    data, written = {}, set()
+    for rel in sorted(source_files()):
+        src = os.path.join(STATIC_DIR, rel)
+        target = hashed_name(rel, file_digest(src))
+        data[rel] = target
+        dest = os.path.join(DIST_DIR, target)
+        written.update({dest, dest + '.gz', dest + '.br'})
+        if os.path.exists(dest):
+            continue
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(src, dest)
+        if rel.lower().endswith(COMPRESSIBLE):
+            with open(src, 'rb') as f:
+                write_compressed(dest, f.read())
+        print(f'{rel} -> {target}')
+    tmp = MANIFEST + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, MANIFEST)
+    # remove outdated hashed copies
+    for root, dirs, files in os.walk(DIST_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            if path != MANIFEST and path not in written:
+                os.remove(path)
+    print(f'{len(data)} assets' + ('' if brotli else ' (brotli not installed, gzip only)'))
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['build']:
+        print('usage: python assets.py build')
+        sys.exit(2)
+    build()
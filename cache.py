@@ -0,0 +1,115 @@
+# cache.py
+# Read-through TTL cache with a byte budget, LRU eviction and tag invalidation.
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+def fingerprint(value):
+    """(approximate size in bytes, content hash) of a cached value."""
+    try:
+        raw = json.dumps(value, default=str, sort_keys=True)
+    except (TypeError, ValueError):
+        raw = repr(value)
+    return len(raw), hashlib.sha1(raw.encode()).hexdigest()[:32]
+
+
+class TTLCache:
+    def __init__(self, ttl=60, max_bytes=8 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # key -> (expires_at, size, tags, value, etag)
+        self.tag_versions = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop(self, key):
+        self.bytes -= self.entries.pop(key)[1]
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None, False
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[3], True
+
+    def etag(self, key):
+        """Content hash of a live entry, or None; does not count as a hit."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[4]
+
+    def _versions(self, tags):
+        return tuple(self.tag_versions.get(t, 0) for t in tags)
+
+    def set(self, key, value, tags=(), versions=None):
+        size, etag = fingerprint(value)
+        with self.lock:
+            # an invalidation raced with the load; don't store stale data
+            if versions is not None and versions != self._versions(tags):
+                return
+            if size > self.max_bytes:
+                return
+            if key in self.entries:
+                self._drop(key)
+            while self.entries and self.bytes + size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+            self.entries[key] = (time.monotonic() + self.ttl, size, tuple(tags), value, etag)
+            self.bytes += size
+
+    def get_or_load(self, key, loader, tags=()):
+        value, hit = self.get(key)
+        if hit:
+            return value
+        with self.lock:
+            versions = self._versions(tags)
+        value = loader()
+        self.set(key, value, tags, versions)
+        return value
+
+    def invalidate(self, *tags):
+        with self.lock:
+            for t in tags:
+                self.tag_versions[t] = self.tag_versions.get(t, 0) + 1
+            stale = [k for k, e in self.entries.items() if set(e[2]) & set(tags)]
+            for k in stale:
+                self._drop(k)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+analytics_cache = TTLCache(
+    ttl=int(os.getenv("ANALYTICS_CACHE_TTL", "60")),
+    max_bytes=int(os.getenv("ANALYTICS_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+)
@@ -0,0 +1,60 @@
+# conditional.py
+# ETag / Last-Modified helpers: answer If-None-Match / If-Modified-Since with
+# a 304 before the page is rendered or the JSON is serialized.
+import hashlib
+import datetime
+from flask import request, session, make_response, jsonify
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:32]
+
+def page_etag(*parts):
+    """ETag for an HTML page; the navbar differs per user, so the user is part of it."""
+    return make_etag(session.get('user_id'), session.get('role'), *parts)
+
+def cacheable_page():
+    # flash messages are popped while rendering, so those views must render
+    return '_success' not in session and '_error' not in session
+
+def _http_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.replace(microsecond=0)
+
+def is_fresh(etag, last_modified=None):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    last_modified = _http_date(last_modified)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+def tag(response, etag, last_modified=None, private=True):
+    response.set_etag(etag)
+    last_modified = _http_date(last_modified)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # always revalidate; private because pages and admin data depend on the session
+    response.headers['Cache-Control'] = ('private' if private else 'public') + ', no-cache'
+    if private:
+        response.vary.add('Cookie')
+    return response
+
+def check(etag, last_modified=None, private=True):
+    """A 304 response when the client's copy is current, else None."""
+    if etag is None or not is_fresh(etag, last_modified):
+        return None
+    return tag(make_response('', 304), etag, last_modified, private)
+
+def json_response(data, etag=None, private=True):
+    """jsonify() with validators; without a precomputed etag the body is hashed."""
+    response = make_response(jsonify(data))
+    etag = etag or make_etag(response.get_data())
+    not_modified = check(etag, private=private)
+    if not_modified is not None:
+        return not_modified
+    return tag(response, etag, private=private)
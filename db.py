@@ -1,23 +1,199 @@
 ﻿# db.py
 import os
+import time
+import logging
+import threading
+import contextvars
 import mysql.connector
 from mysql.connector import Error
 from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+from itertools import islice
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import metrics
+import slowlog
 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = int(os.getenv("DB_PORT", "3306"))
 DB_USER = os.getenv("DB_USER", "root")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "1234")
 DB_NAME = os.getenv("DB_NAME", "homescout1_new")
+# keep below pool_size so fan-out cannot starve ordinary requests
+FANOUT_WORKERS = int(os.getenv("DB_FANOUT_WORKERS", "4"))
+# read replicas: comma-separated host[:port], same credentials and schema
+DB_REPLICAS = [h.strip() for h in os.getenv("DB_REPLICAS", "").split(",") if h.strip()]
+# after a session writes, its reads stay on the primary for this long
+READ_PIN_SECONDS = float(os.getenv("DB_READ_PIN_SECONDS", "5"))
+REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "30"))
+LAG_CHECK_SECONDS = 5
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+# a checkout waits up to POOL_TIMEOUT for a free connection; beyond
+# POOL_MAX_WAITERS queued checkouts fail at once instead of piling up
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+POOL_MAX_WAITERS = int(os.getenv("DB_POOL_MAX_WAITERS", "50"))
+# connections held longer than this are reported with the route holding them
+LEAK_SECONDS = float(os.getenv("DB_LEAK_SECONDS", "10"))
+# iterate() keeps its connection for the whole stream (an export download),
+# so those leases are measured against their own, longer limit
+STREAM_LEAK_SECONDS = float(os.getenv("DB_STREAM_LEAK_SECONDS", "600"))
+# identical fetchone/fetchall calls running at the same time share one execution
+SINGLE_FLIGHT = os.getenv("DB_SINGLE_FLIGHT", "1") == "1"
+
+metrics.registry.describe('homescout_db_pool_in_use', 'gauge', 'Connections checked out, by pool')
+metrics.registry.describe('homescout_db_pool_waiting', 'gauge', 'Checkouts waiting for a free connection, by pool')
+metrics.registry.describe('homescout_db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting, by pool')
+metrics.registry.describe('homescout_db_connection_hold_seconds', 'histogram', 'How long a route keeps a connection checked out')
+metrics.registry.describe('homescout_db_connection_leaks_total', 'counter', 'Connections held longer than DB_LEAK_SECONDS (DB_STREAM_LEAK_SECONDS when streaming), by route')
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class Lease:
+    """A checked-out connection; close() returns it to the pool exactly once."""
+
+    def __init__(self, pool, conn, route):
+        self._pool = pool
+        self._conn = conn
+        self.route = route
+        self.thread = threading.current_thread().name
+        self.started = time.monotonic()
+        self.leak_seconds = LEAK_SECONDS
+
+    def streaming(self):
+        """Mark the connection as held for a streamed result (STREAM_LEAK_SECONDS applies)."""
+        self.leak_seconds = STREAM_LEAK_SECONDS
+        self._pool.track(self)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(self, conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __del__(self):
+        # dropped without close(): still give the slot back
+        if self.__dict__.get('_conn') is not None:
+            log.warning('connection from %s was never closed', self.route)
+            self.close()
+
+
+_inherited = []
+
 
-# Connection pool
-pool = pooling.MySQLConnectionPool(
-    pool_name="homescout_pool",
-    pool_size=10,
+class BoundedPool:
+    """MySQLConnectionPool with a bounded, timed wait for a free connection.
+
+    mysql-connector's pool raises as soon as it is empty; here checkouts queue
+    on a semaphore for up to POOL_TIMEOUT. The underlying pool pings each
+    connection on checkout and reconnects it if the server dropped it. It is
+    opened on the first checkout, so importing db needs no database and a
+    forked worker opens its own.
+    """
+
+    def __init__(self, name, size=POOL_SIZE, **config):
+        self.name = name
+        self.size = size
+        self.config = config
+        self.reset()
+        metrics.registry.gauge('homescout_db_pool_in_use', lambda: len(self.leases), pool=name)
+        metrics.registry.gauge('homescout_db_pool_waiting', lambda: self.waiting, pool=name)
+
+    def reset(self):
+        """Forget every connection, e.g. in a child process after fork()."""
+        if getattr(self, 'pool', None) is not None:
+            # the parent still uses these sockets: keep the objects alive
+            # (closing or collecting them would end the parent's sessions)
+            _inherited.append(self.pool)
+        self.pool = None
+        self.slots = threading.BoundedSemaphore(self.size)
+        self.lock = threading.Lock()
+        self.waiting = 0
+        # id(lease) -> (route, thread, started, leak_seconds); not the lease
+        # itself, so a lease that is dropped without close() can still be collected
+        self.leases = {}
+
+    def _connector(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = pooling.MySQLConnectionPool(pool_name=self.name, pool_size=self.size, **self.config)
+            return self.pool
+
+    def get_connection(self, timeout=None):
+        timeout = POOL_TIMEOUT if timeout is None else timeout
+        with self.lock:
+            if self.waiting >= POOL_MAX_WAITERS:
+                metrics.registry.inc('homescout_db_pool_timeouts_total', pool=self.name)
+                raise PoolTimeout(f'{self.name}: {self.waiting} checkouts already waiting')
+            self.waiting += 1
+        try:
+            acquired = self.slots.acquire(timeout=timeout)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+        if not acquired:
+            metrics.registry.inc('homescout_db_pool_timeouts_total', pool=self.name)
+            held = ', '.join(f'{l["route"]} {l["held_seconds"]}s' for l in self.held(0)) or 'nobody'
+            raise PoolTimeout(f'{self.name}: no connection free after {timeout}s (held by {held})')
+        try:
+            connector = self._connector()
+            try:
+                conn = connector.get_connection()
+            except Error:
+                # the reconnect of a dropped connection failed; try once more
+                conn = connector.get_connection()
+        except Exception:
+            self.slots.release()
+            raise
+        stats = metrics.current()
+        lease = Lease(self, conn, stats.route if stats else 'background')
+        self.track(lease)
+        return lease
+
+    def track(self, lease):
+        with self.lock:
+            self.leases[id(lease)] = (lease.route, lease.thread, lease.started, lease.leak_seconds)
+
+    def release(self, lease, conn):
+        held = time.monotonic() - lease.started
+        metrics.registry.observe('homescout_db_connection_hold_seconds', held, route=lease.route)
+        if held > lease.leak_seconds:
+            metrics.registry.inc('homescout_db_connection_leaks_total', route=lease.route)
+            log.warning('%s (%s) held a %s connection for %.1fs', lease.route, lease.thread, self.name, held)
+        try:
+            conn.close()
+        finally:
+            with self.lock:
+                self.leases.pop(id(lease), None)
+            self.slots.release()
+
+    def held(self, threshold=None):
+        """Checked-out connections older than threshold (default: their own leak limit), longest first."""
+        now = time.monotonic()
+        with self.lock:
+            leases = list(self.leases.values())
+        rows = [{'route': route, 'thread': thread, 'held_seconds': round(now - started, 1)}
+                for route, thread, started, limit in leases
+                if now - started >= (limit if threshold is None else threshold)]
+        return sorted(rows, key=lambda r: -r['held_seconds'])
+
+    def stats(self):
+        return {'name': self.name, 'size': self.size, 'in_use': len(self.leases), 'waiting': self.waiting,
+                'held_too_long': self.held()}
+
+
+# Connection pool, connected on first use
+pool = BoundedPool(
+    "homescout_pool",
     host=DB_HOST,
     port=DB_PORT,
     user=DB_USER,
@@ -27,47 +203,503 @@ pool = pooling.MySQLConnectionPool(
 )
 
 def get_conn():
-    return pool.get_connection()
+    started = time.perf_counter()
+    conn = pool.get_connection()
+    metrics.record_pool_wait(time.perf_counter() - started)
+    return conn
+
+
+# --- read routing ---
+class Replica:
+    def __init__(self, address, index):
+        host, _, port = address.partition(':')
+        self.name = address
+        self.host = host
+        self.port = int(port or DB_PORT)
+        self.index = index
+        self.pool = None
+        self.lag = None          # seconds behind the primary; None when unknown or broken
+        self.checked = 0.0
+
+    def connect(self):
+        # created on first use so an unreachable replica doesn't stop the app starting
+        if self.pool is None:
+            self.pool = BoundedPool(
+                f"homescout_replica_{self.index}",
+                host=self.host,
+                port=self.port,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                database=DB_NAME,
+                autocommit=True,
+                connection_timeout=5
+            )
+        return self.pool.get_connection()
+
+    def check_lag(self):
+        """Refresh lag from SHOW REPLICA STATUS (0 for a stand-in that isn't replicating)."""
+        self.checked = time.monotonic()
+        try:
+            conn = self.connect()
+        except Error:
+            self.lag = None
+            return
+        cur = conn.cursor(dictionary=True)
+        try:
+            try:
+                cur.execute('SHOW REPLICA STATUS')
+            except Error:
+                cur.execute('SHOW SLAVE STATUS')   # MySQL < 8.0.22
+            row = cur.fetchone()
+            if row is None:
+                self.lag = 0.0
+            else:
+                lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+                self.lag = None if lag is None else float(lag)
+        except Error:
+            self.lag = None
+        finally:
+            cur.close()
+            conn.close()
+
+    def usable(self):
+        return self.lag is not None and self.lag <= REPLICA_MAX_LAG
+
+
+class Routing:
+    """Read routing state for one request or job."""
+
+    def __init__(self, primary_reads=False):
+        self.primary_reads = primary_reads   # session is inside its read-your-writes window
+        self.wrote = False
+        self.reads = {'primary': 0, 'replica': 0}
+
+
+replicas = [Replica(address, i) for i, address in enumerate(DB_REPLICAS)]
+_routing = contextvars.ContextVar('homescout_db_routing', default=None)
+_replica_lock = threading.Lock()
+_next_replica = 0
+
+metrics.registry.describe('homescout_db_reads_total', 'counter', 'Reads by target (primary/replica) and routing reason')
+metrics.registry.describe('homescout_db_replica_lag_seconds', 'gauge', 'Replication lag of each replica at its last check (-1: unknown)')
+for _replica in replicas:
+    metrics.registry.gauge('homescout_db_replica_lag_seconds', lambda r=_replica: -1 if r.lag is None else r.lag, replica=_replica.name)
+
+def begin_routing(primary_reads=False):
+    """Start routing for a request or job; primary_reads pins every read to the primary."""
+    routing = Routing(primary_reads)
+    _routing.set(routing)
+    return routing
+
+def end_routing():
+    routing = _routing.get()
+    _routing.set(None)
+    return routing
+
+@contextmanager
+def on_primary():
+    """Send the reads made inside the block to the primary, whatever the routing."""
+    routing = _routing.get()
+    if routing is None:
+        token = _routing.set(Routing(primary_reads=True))
+        try:
+            yield
+        finally:
+            _routing.reset(token)
+    else:
+        pinned, routing.primary_reads = routing.primary_reads, True
+        try:
+            yield
+        finally:
+            routing.primary_reads = pinned
+
+def _mark_write():
+    routing = _routing.get()
+    if routing is not None:
+        routing.wrote = True
+
+def _pick_replica():
+    global _next_replica
+    with _replica_lock:
+        now = time.monotonic()
+        for replica in replicas:
+            if now - replica.checked > LAG_CHECK_SECONDS:
+                # probe in the background: a slow or dead replica must not
+                # hold up reads; until it answers the last known lag stands
+                replica.checked = now
+                threading.Thread(target=replica.check_lag, name=f'lag-check-{replica.index}', daemon=True).start()
+        usable = [r for r in replicas if r.usable()]
+        if not usable:
+            return None
+        _next_replica += 1
+        return usable[_next_replica % len(usable)]
+
+def read_conn():
+    """(connection, replica or None) for a read, following the routing rules."""
+    routing = _routing.get()
+    replica = None
+    if not replicas:
+        reason = 'no_replica'
+    elif routing is not None and routing.wrote:
+        reason = 'own_write'
+    elif routing is not None and routing.primary_reads:
+        reason = 'pinned'
+    else:
+        replica = _pick_replica()
+        reason = 'default' if replica else 'lagging'
+    target = 'replica' if replica else 'primary'
+    metrics.registry.inc('homescout_db_reads_total', target=target, reason=reason)
+    if routing is not None:
+        routing.reads[target] += 1
+    if replica is None:
+        return get_conn(), None
+    started = time.perf_counter()
+    try:
+        conn = replica.connect()
+    except Error:
+        replica.lag = None
+        return get_conn(), None
+    metrics.record_pool_wait(time.perf_counter() - started)
+    return conn, replica
+
+def stats():
+    return {
+        'pools': [p.stats() for p in [pool] + [r.pool for r in replicas if r.pool is not None]],
+        'single_flight': flights.stats(),
+        'replicas': [{'name': r.name, 'lag_seconds': r.lag, 'usable': r.usable(),
+                      'checked_seconds_ago': round(time.monotonic() - r.checked, 1) if r.checked else None}
+                     for r in replicas],
+        'read_pin_seconds': READ_PIN_SECONDS,
+        'max_lag_seconds': REPLICA_MAX_LAG,
+    }
+
+def observe(sql, params, started, rows=0):
+    """Account one finished statement to the current request."""
+    seconds = time.perf_counter() - started
+    metrics.record_query(seconds, rows)
+    slowlog.log.record(sql, params, seconds, explain)
+
+def explain(sql, params=None):
+    """EXPLAIN a statement on its own connection, bypassing instrumentation."""
+    if isinstance(params, list) and params and isinstance(params[0], (tuple, list, dict)):
+        params = params[0]
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        try:
+            cur.execute('EXPLAIN ' + sql, params or ())
+            return cur.fetchall()
+        finally:
+            cur.close()
+    finally:
+        conn.close()
+
+
+class TimedCursor:
+    """Cursor proxy that accounts every statement run inside transaction()/connection()."""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    def execute(self, sql, params=None):
+        started = time.perf_counter()
+        self._cur.execute(sql, params or ())
+        observe(sql, params, started)
+
+    def executemany(self, sql, seq_params):
+        started = time.perf_counter()
+        self._cur.executemany(sql, seq_params)
+        observe(sql, seq_params, started)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+class Flight:
+    __slots__ = ('done', 'result', 'error', 'followers')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Coalesces identical concurrent reads.
+
+    The first caller with a key runs the query; callers arriving with the
+    same key while it is in flight wait for it and get a copy of its result
+    (or its exception) instead of running the query again. Nothing is kept
+    once the query finishes, so this never serves a result that was already
+    complete when the caller asked.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key, fn, copy):
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                self.executions += 1
+                leader = True
+            else:
+                flight.followers += 1
+                self.shared += 1
+                leader = False
+        if not leader:
+            flight.done.wait()
+            metrics.registry.inc('homescout_db_reads_coalesced_total')
+            if flight.error is not None:
+                raise flight.error
+            return copy(flight.result)
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        # rows are mutable dicts: once shared, the leader gets its own copy too
+        return copy(flight.result) if flight.followers else flight.result
+
+    def stats(self):
+        with self.lock:
+            return {'enabled': SINGLE_FLIGHT, 'executions': self.executions, 'saved': self.shared,
+                    'in_flight': len(self.flights)}
+
+
+flights = SingleFlight()
+metrics.registry.describe('homescout_db_reads_coalesced_total', 'counter',
+                          'Reads answered by an identical query already in flight instead of running again')
+
+def flight_key(kind, sql, params):
+    """Key for coalescing a read, or None when it must run on its own."""
+    if not SINGLE_FLIGHT:
+        return None
+    routing = _routing.get()
+    if routing is not None and (routing.wrote or routing.primary_reads):
+        # a query already in flight may predate this session's own write
+        return None
+    if isinstance(params, dict):
+        params = tuple(sorted(params.items()))
+    elif params is not None:
+        params = tuple(params)
+    key = (kind, ' '.join(sql.split()), params)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+def _copy_row(row):
+    return None if row is None else dict(row)
+
+def _copy_rows(rows):
+    return [dict(r) for r in rows]
 
 def fetchone(sql, params=None):
-    conn = get_conn()
-    cur = conn.cursor(dictionary=True)
-    cur.execute(sql, params or ())
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
-    return row
+    key = flight_key('one', sql, params)
+    if key is None:
+        return _fetchone(sql, params)
+    return flights.do(key, lambda: _fetchone(sql, params), _copy_row)
 
 def fetchall(sql, params=None):
-    conn = get_conn()
-    cur = conn.cursor(dictionary=True)
-    cur.execute(sql, params or ())
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    key = flight_key('all', sql, params)
+    if key is None:
+        return _fetchall(sql, params)
+    return flights.do(key, lambda: _fetchall(sql, params), _copy_rows)
+
+def _fetchone(sql, params=None):
+    conn, _ = read_conn()
+    try:
+        cur = conn.cursor(dictionary=True)
+        try:
+            started = time.perf_counter()
+            cur.execute(sql, params or ())
+            row = cur.fetchone()
+            observe(sql, params, started, 1 if row else 0)
+        finally:
+            cur.close()
+    finally:
+        conn.close()
+    return row
+
+def _fetchall(sql, params=None):
+    conn, _ = read_conn()
+    try:
+        cur = conn.cursor(dictionary=True)
+        try:
+            started = time.perf_counter()
+            cur.execute(sql, params or ())
+            rows = cur.fetchall()
+            observe(sql, params, started, len(rows))
+        finally:
+            cur.close()
+    finally:
+        conn.close()
     return rows
 
 def execute(sql, params=None):
+    _mark_write()
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(sql, params or ())
-    last_id = cur.lastrowid
-    conn.commit()
-    cur.close()
-    conn.close()
+    try:
+        cur = conn.cursor()
+        try:
+            started = time.perf_counter()
+            cur.execute(sql, params or ())
+            observe(sql, params, started)
+            last_id = cur.lastrowid
+            conn.commit()
+        finally:
+            cur.close()
+    finally:
+        conn.close()
     return last_id
 
+def execute_many(sql, seq_params, batch_size=1000):
+    """Run one statement for every parameter tuple on a single checkout.
+
+    seq_params may be any iterable (including a generator for bulk loads);
+    it is sent in batches of batch_size, which mysql-connector rewrites
+    into multi-row INSERTs. Returns the number of affected rows.
+    """
+    _mark_write()
+    conn = get_conn()
+    total = 0
+    try:
+        cur = conn.cursor()
+        try:
+            it = iter(seq_params)
+            while True:
+                chunk = list(islice(it, batch_size))
+                if not chunk:
+                    break
+                started = time.perf_counter()
+                cur.executemany(sql, chunk)
+                observe(sql, chunk, started)
+                total += cur.rowcount
+            conn.commit()
+        finally:
+            cur.close()
+    finally:
+        conn.close()
+    return total
+
+# Several statements on one pooled connection, committed as they run
+@contextmanager
+def connection(dictionary=False):
+    _mark_write()
+    conn = get_conn()
+    try:
+        cur = TimedCursor(conn.cursor(dictionary=dictionary))
+        try:
+            yield conn, cur
+        finally:
+            cur.close()
+    finally:
+        conn.close()
+
+def iterate(sql, params=None, batch_size=1000):
+    """Yield rows one at a time from an unbuffered server-side cursor.
+
+    Rows are streamed from MySQL in batches instead of being loaded into a
+    list, so memory stays flat however large the result is.
+    """
+    conn, replica = read_conn()
+    try:
+        conn.streaming()
+        cur = conn.cursor(dictionary=True, buffered=False)
+    except Exception:
+        conn.close()
+        raise
+    done = False
+    timed = False
+    started = time.perf_counter()
+    try:
+        cur.execute(sql, params or ())
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not timed:
+                # the query's latency ends with its first batch; the rest of
+                # the time is the consumer (e.g. a client downloading an export)
+                observe(sql, params, started, len(rows))
+                timed = True
+            if not rows:
+                break
+            for row in rows:
+                yield row
+        done = True
+    finally:
+        if not timed:
+            observe(sql, params, started)
+        if not done:
+            # stop the server sending the rest before draining the connection;
+            # the KILL has to go to the server running the query
+            try:
+                killer = replica.connect() if replica else get_conn()
+                try:
+                    kill = killer.cursor()
+                    kill.execute('KILL QUERY %s' % int(conn.connection_id))
+                    kill.close()
+                finally:
+                    killer.close()
+            except Error:
+                pass
+            try:
+                conn.consume_results()
+            except Error:
+                pass
+        cur.close()
+        conn.close()
+
+_fanout = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='db-fanout')
+
+def _after_fork():
+    """A forked worker gets fresh pools, locks and fan-out threads of its own."""
+    global _fanout, _replica_lock, flights
+    pool.reset()
+    for replica in replicas:
+        if replica.pool is not None:
+            replica.pool.reset()
+        replica.checked = 0.0
+    _replica_lock = threading.Lock()
+    # a flight the parent had running will never finish here
+    flights = SingleFlight()
+    _fanout = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='db-fanout')
+
+os.register_at_fork(after_in_child=_after_fork)
+
+def gather(*calls):
+    """Run independent reads concurrently, each on its own pooled connection.
+
+    Each call is (fn, *args), e.g. (fetchall, sql, params); results come back
+    in the same order. Calls must not themselves use gather().
+    """
+    futures = [_fanout.submit(contextvars.copy_context().run, fn, *args) for fn, *args in calls]
+    return [f.result() for f in futures]
+
 # Transaction helper
 @contextmanager
 def transaction():
+    _mark_write()
     conn = get_conn()
-    cur = conn.cursor()
     try:
-        yield conn, cur
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
+        cur = TimedCursor(conn.cursor())
+        try:
+            yield conn, cur
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cur.close()
     finally:
-        cur.close()
         conn.close()
@@ -0,0 +1,68 @@
+# export.py
+# Streaming CSV / NDJSON extracts for finance and ops.
+import io
+import csv
+import json
+from db import iterate
+
+# name -> (select, date column, city column)
+EXPORTS = {
+    'properties': ('SELECT p.* FROM properties p', 'p.created_at', 'p.city'),
+    'sales': ('SELECT s.*, p.city FROM sales s LEFT JOIN properties p ON s.property_id=p.property_id',
+              's.sale_date', 'p.city'),
+    'payments': ('SELECT pay.*, s.sale_date, p.city FROM payments pay JOIN sales s ON pay.sale_id=s.sale_id LEFT JOIN properties p ON s.property_id=p.property_id',
+                 's.sale_date', 'p.city'),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+def build_query(name, date_from=None, date_to=None, city=None):
+    select, date_col, city_col = EXPORTS[name]
+    where, params = [], []
+    if date_from:
+        where.append(date_col + ' >= %s'); params.append(date_from)
+    if date_to:
+        # inclusive of the whole end day
+        where.append(date_col + ' < DATE_ADD(%s, INTERVAL 1 DAY)'); params.append(date_to)
+    if city:
+        where.append(city_col + ' = %s'); params.append(city)
+    sql = select
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return sql, tuple(params)
+
+def csv_lines(rows):
+    buf = io.StringIO()
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buf, fieldnames=list(row.keys()), extrasaction='ignore')
+            writer.writeheader()
+        writer.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, default=str) + '\n'
+
+def stream(name, fmt, date_from=None, date_to=None, city=None, batch_size=1000):
+    """Generator of encoded chunks for one export."""
+    sql, params = build_query(name, date_from, date_to, city)
+    rows = iterate(sql, params, batch_size)
+    lines = csv_lines(rows) if fmt == 'csv' else ndjson_lines(rows)
+    chunk, size, first = [], 0, True
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        # flush the first row at once so the download starts immediately
+        if first or size >= 64 * 1024:
+            first = False
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
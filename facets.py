@@ -0,0 +1,290 @@
+# facets.py
+# Facet counts for /search (city, price band, rooms, lift, parking) from a
+# columnar in-process copy of the Available/Enlisted listings. Each facet is
+# a small integer code per listing; a query builds one filter mask, takes the
+# matching slots once and counts every facet with np.bincount over them,
+# instead of a GROUP BY query per facet.
+# Built on first use and patched listing by listing, here or (via
+# listing_sync) in another process, like similar.py.
+#   python facets.py bench      # count latency at 10k / 100k / 1M listings
+import os
+import sys
+import time
+import threading
+import numpy as np
+from db import fetchone, iterate
+from search_index import city_key, is_listed
+from listing_sync import ListingSync
+
+ENABLED = os.getenv("SEARCH_FACETS", "1") == "1"
+
+LISTED_SQL = ("SELECT property_id, city, base_price, total_rooms, has_lift, parking_type "
+              "FROM properties WHERE status='Available' AND lifecycle_status='Enlisted'")
+CHANGED_COLUMNS = "property_id, city, base_price, total_rooms, has_lift, parking_type, status, lifecycle_status, updated_at"
+
+# price bands as [low, high) in taka; the last one is open ended
+PRICE_BANDS = (0, 2_500_000, 5_000_000, 10_000_000, 20_000_000, 50_000_000)
+MAX_ROOMS = 6             # 6 and more share one bucket
+# facet columns hold code + 1, so 0 counts the listings with the column NULL
+UNKNOWN = 0
+COLUMNS = {'alive': (bool, False), 'ids': (np.int64, 0), 'price': (np.float64, np.nan),
+           'rooms': (np.float64, np.nan), 'city': (np.int32, UNKNOWN), 'band': (np.int8, UNKNOWN),
+           'rooms_bucket': (np.int8, UNKNOWN), 'lift': (np.int8, UNKNOWN), 'parking': (np.int32, UNKNOWN)}
+
+
+def price_band(price):
+    if price is None:
+        return UNKNOWN
+    return max(int(np.searchsorted(PRICE_BANDS, float(price), side='right')), 1)
+
+def band_max(band):
+    """The largest base_price (DECIMAL(18,2)) inside a band, for its max_price link."""
+    if band + 1 == len(PRICE_BANDS):
+        return None
+    # the band ends just below the next floor: its last cent, not the last whole taka
+    return round(PRICE_BANDS[band + 1] - 0.01, 2)
+
+def band_label(band):
+    low = PRICE_BANDS[band]
+    if band == 0:
+        return f'under {PRICE_BANDS[1]:,}'
+    if band + 1 == len(PRICE_BANDS):
+        return f'{low:,}+'
+    return f'{low:,} - {PRICE_BANDS[band + 1]:,}'
+
+
+class FacetIndex:
+    def __init__(self, capacity=1024):
+        self.lock = threading.RLock()
+        self.loading = threading.Lock()
+        self.loaded = False
+        self.sync = ListingSync(CHANGED_COLUMNS)
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        for name, (dtype, fill) in COLUMNS.items():
+            setattr(self, name, np.full(capacity, fill, dtype=dtype))
+        # property_id -> slot, as an array so a set of ids maps in one step
+        self.slot_by_id = np.full(capacity, -1, dtype=np.int64)
+        self.size = 0
+        self.free = []
+        self.cities = {}          # folded city -> code
+        self.city_names = []      # code -> city as first seen
+        self.parkings = {}
+        self.parking_names = []
+
+    def _grow(self):
+        capacity = len(self.alive) * 2
+        for name, (dtype, fill) in COLUMNS.items():
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    @staticmethod
+    def _code(codes, names, key, value):
+        code = codes.get(key)
+        if code is None:
+            names.append(value)
+            code = codes[key] = len(names)
+        return code
+
+    def load(self):
+        """Build fresh columns outside the lock and swap them in."""
+        self.sync.start()
+        fresh = FacetIndex()
+        for row in iterate(LISTED_SQL):
+            fresh._place(row)
+        with self.lock:
+            for name in STATE:
+                setattr(self, name, getattr(fresh, name))
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self.loading:
+                if not self.loaded:
+                    self.load()
+        elif self.sync.due():
+            self.sync.apply(self.upsert, self.discard)
+
+    def catch_up(self, mark):
+        """Apply other processes' changes now unless the index is at mark (listing_sync.watermark())."""
+        if self.loaded and self.sync.behind(mark):
+            self.sync.apply(self.upsert, self.discard, wait=True, mark=mark)
+
+    def _place(self, row):
+        pid = row['property_id']
+        i = self.slot_by_id[pid] if pid < len(self.slot_by_id) else -1
+        if i < 0:
+            if self.free:
+                i = self.free.pop()
+            else:
+                if self.size == len(self.alive):
+                    self._grow()
+                i = self.size
+                self.size += 1
+            if pid >= len(self.slot_by_id):
+                grown = np.full(max(pid + 1, len(self.slot_by_id) * 2), -1, dtype=np.int64)
+                grown[:len(self.slot_by_id)] = self.slot_by_id
+                self.slot_by_id = grown
+            self.slot_by_id[pid] = i
+        rooms = row.get('total_rooms')
+        self.alive[i] = True
+        self.ids[i] = pid
+        self.price[i] = np.nan if row.get('base_price') is None else float(row['base_price'])
+        self.rooms[i] = np.nan if rooms is None else float(rooms)
+        self.rooms_bucket[i] = UNKNOWN if rooms is None else min(max(int(rooms), 0), MAX_ROOMS) + 1
+        self.band[i] = price_band(row.get('base_price'))
+        city = row.get('city')
+        self.city[i] = UNKNOWN if city is None else self._code(self.cities, self.city_names, city_key(city), city.rstrip())
+        self.lift[i] = UNKNOWN if row.get('has_lift') is None else int(bool(row['has_lift'])) + 1
+        parking = row.get('parking_type') or 'None'
+        self.parking[i] = self._code(self.parkings, self.parking_names, parking, parking)
+
+    def _remove(self, property_id):
+        if property_id >= len(self.slot_by_id) or self.slot_by_id[property_id] < 0:
+            return
+        i = int(self.slot_by_id[property_id])
+        self.slot_by_id[property_id] = -1
+        self.alive[i] = False
+        self.free.append(i)
+
+    def upsert(self, row):
+        with self.lock:
+            if is_listed(row):
+                self._place(row)
+            else:
+                self._remove(row['property_id'])
+
+    def discard(self, property_id):
+        with self.lock:
+            self._remove(property_id)
+
+    def refresh(self, property_id):
+        if not self.loaded:
+            return
+        row = fetchone('SELECT property_id, city, base_price, total_rooms, has_lift, parking_type, status, lifecycle_status '
+                       'FROM properties WHERE property_id=%s', (property_id,))
+        if row is None:
+            self.discard(property_id)
+        else:
+            self.upsert(row)
+
+    def counts(self, city=None, min_price=None, max_price=None, min_rooms=None, ids=None):
+        """Facet counts over the listings that pass the filters (and are in ids, when given)."""
+        with self.lock:
+            n = self.size
+            if ids is not None:
+                ids = ids[ids < len(self.slot_by_id)]
+                slots = self.slot_by_id[ids]
+                mask = np.zeros(n, dtype=bool)
+                mask[slots[slots >= 0]] = True
+                mask &= self.alive[:n]
+            else:
+                mask = self.alive[:n].copy()
+            if city:
+                code = self.cities.get(city_key(city))
+                if code is None:
+                    mask[:] = False
+                else:
+                    mask &= self.city[:n] == code
+            # NaN (a NULL column) fails every comparison, as in SQL
+            if min_price is not None:
+                mask &= self.price[:n] >= min_price
+            if max_price is not None:
+                mask &= self.price[:n] <= max_price
+            if min_rooms is not None:
+                mask &= self.rooms[:n] >= min_rooms
+            # the matching slots are found once and every facet is counted over them
+            hits = np.flatnonzero(mask)
+            total = len(hits)
+            if total > n // 2:
+                # most listings match: a boolean mask reads the columns in order
+                hits = mask[:n]
+            city_n = np.bincount(self.city[:n][hits], minlength=len(self.city_names) + 1)
+            band_n = np.bincount(self.band[:n][hits], minlength=len(PRICE_BANDS) + 1)
+            rooms_n = np.bincount(self.rooms_bucket[:n][hits], minlength=MAX_ROOMS + 2)
+            lift_n = np.bincount(self.lift[:n][hits], minlength=3)
+            parking_n = np.bincount(self.parking[:n][hits], minlength=len(self.parking_names) + 1)
+            city_names, parking_names = list(self.city_names), list(self.parking_names)
+        return {
+            'total': total,
+            'city': sorted(({'value': name, 'count': int(c)} for name, c in zip(city_names, city_n[1:]) if c),
+                           key=lambda f: (-f['count'], f['value'].casefold())),
+            'price': [{'value': band, 'label': band_label(band), 'min_price': PRICE_BANDS[band],
+                       'max_price': band_max(band), 'count': int(c)}
+                      for band, c in enumerate(band_n[1:]) if c],
+            'total_rooms': [{'value': r, 'label': f'{r}+' if r == MAX_ROOMS else str(r), 'count': int(c)}
+                            for r, c in enumerate(rooms_n[1:]) if c],
+            'has_lift': [{'value': v, 'label': 'Lift' if v else 'No lift', 'count': int(c)}
+                         for v, c in ((1, lift_n[2]), (0, lift_n[1])) if c],
+            'parking_type': sorted(({'value': name, 'count': int(c)} for name, c in zip(parking_names, parking_n[1:]) if c),
+                                   key=lambda f: -f['count']),
+        }
+
+
+# what load() builds and swaps in
+STATE = tuple(COLUMNS) + ('slot_by_id', 'size', 'free', 'cities', 'city_names', 'parkings', 'parking_names')
+
+index = FacetIndex()
+
+def _number(value):
+    if value is None or value == '':
+        return None
+    return float(value)
+
+def counts(city=None, min_price=None, max_price=None, min_rooms=None, ids=None):
+    """Facet counts for a /search query, limited to ids when given (keyword
+    matches); None when facets are off or a filter doesn't parse."""
+    if not ENABLED:
+        return None
+    try:
+        min_price, max_price, min_rooms = _number(min_price), _number(max_price), _number(min_rooms)
+    except (TypeError, ValueError):
+        return None
+    index.ensure_loaded()
+    if ids is not None:
+        ids = np.asarray(ids, dtype=np.int64)
+    return index.counts(city or None, min_price, max_price, min_rooms, ids)
+
+def catch_up(mark):
+    if ENABLED:
+        index.catch_up(mark)
+
+def refresh(property_id):
+    if ENABLED:
+        index.refresh(property_id)
+
+def discard(property_id):
+    if ENABLED:
+        index.discard(property_id)
+
+
+def bench(sizes=(10_000, 100_000, 1_000_000), queries=100):
+    import similar
+    cases = [{}, {'city': 'Dhaka'}, {'min_price': 5_000_000, 'max_price': 15_000_000, 'min_rooms': 3}]
+    for n in sizes:
+        idx = FacetIndex()
+        started = time.perf_counter()
+        with idx.lock:
+            for row in similar.synthetic_rows(n):
+                idx._place(row)
+            idx.loaded = True
+        build = time.perf_counter() - started
+        for filters in cases:
+            samples = []
+            for _ in range(queries):
+                t = time.perf_counter()
+                result = idx.counts(**filters)
+                samples.append((time.perf_counter() - t) * 1000)
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            print(f'{n:>9,} listings  build {build:6.2f}s  {str(filters):<62} {result["total"]:>9,} hits  '
+                  f'p50 {p50:6.2f}ms  p95 {p95:6.2f}ms  p99 {p99:6.2f}ms')
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['bench']:
+        print('usage: python facets.py bench [N ...]')
+        sys.exit(2)
+    sizes = tuple(int(a) for a in sys.argv[2:]) or (10_000, 100_000, 1_000_000)
+    bench(sizes)
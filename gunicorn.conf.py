@@ -0,0 +1,20 @@
+# gunicorn.conf.py
+# gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_WORKERS", "4"))
+# keep threads at or below DB_POOL_SIZE so a worker's requests rarely queue for a connection
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "8"))
+preload_app = True
+# every worker keeps its own in-memory listing indexes (search_index,
+# keyword_index, facets, similar); listing_sync brings each one up to date
+# with the other workers' writes within INDEX_SYNC_SECONDS
+accesslog = "-"
+
+def post_fork(server, worker):
+    # db.py drops the master's pools via os.register_at_fork; job workers
+    # would otherwise wait for this worker's first request
+    import jobs
+    jobs.start()
@@ -0,0 +1,158 @@
+# images.py
+# Responsive image derivatives.
+#   python images.py build [--no-photos] [--workers N]
+# writes card/detail/retina JPEG + WebP variants of every image in
+# static/images (and of local property_photos files) under
+# static/images/derived/ with content-hashed names, plus a manifest that
+# the image_srcset()/image_url() template helpers read.
+import os
+import sys
+import json
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+SOURCE_DIR = os.path.join(STATIC_DIR, 'images')
+DERIVED = 'images/derived'
+MANIFEST = os.path.join(STATIC_DIR, DERIVED, 'manifest.json')
+
+# card thumbnail, detail view, retina detail
+WIDTHS = (400, 800, 1600)
+FORMATS = {'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+           'webp': ('webp', {'quality': 80, 'method': 6})}
+SOURCE_EXTS = ('.jpg', '.jpeg', '.png', '.webp')
+PHOTO_COLUMNS = ('photo_path', 'file_path', 'image_path', 'photo_url', 'url')
+
+# --- runtime helpers (no Pillow needed) ---
+_manifest = {'mtime': None, 'data': {}}
+_lock = threading.Lock()
+
+def manifest():
+    try:
+        mtime = os.path.getmtime(MANIFEST)
+    except OSError:
+        return {}
+    with _lock:
+        if _manifest['mtime'] != mtime:
+            with open(MANIFEST, encoding='utf-8') as f:
+                _manifest['data'] = json.load(f)
+            _manifest['mtime'] = mtime
+        return _manifest['data']
+
+def _static_url(path):
+    from assets import asset_url
+    return asset_url('static', filename=path)
+
+def image_srcset(path, fmt='jpeg'):
+    """'url 400w, url 800w' for a static image, or '' when not built."""
+    entry = manifest().get(path)
+    if not entry:
+        return ''
+    return ', '.join(f"{_static_url(v['path'])} {v['width']}w" for v in entry['variants'] if v['format'] == fmt)
+
+def image_url(path, width=400, fmt='jpeg'):
+    """Smallest derivative at least width wide, falling back to the original."""
+    entry = manifest().get(path)
+    if entry:
+        variants = sorted((v for v in entry['variants'] if v['format'] == fmt), key=lambda v: v['width'])
+        for v in variants:
+            if v['width'] >= width:
+                return _static_url(v['path'])
+        if variants:
+            return _static_url(variants[-1]['path'])
+    return _static_url(path)
+
+# --- build pipeline ---
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()[:12]
+
+def plan_variants(rel, digest, source_width):
+    stem = os.path.splitext(os.path.basename(rel))[0]
+    widths = [w for w in WIDTHS if w <= source_width] or [source_width]
+    out = []
+    for fmt, (ext, _) in FORMATS.items():
+        for w in widths:
+            out.append({'width': w, 'format': fmt, 'path': f'{DERIVED}/{stem}-{digest}-{w}.{ext}'})
+    return out
+
+def render(src, variants):
+    """Worker: write every missing variant of one source image."""
+    from PIL import Image
+    with Image.open(src) as img:
+        img = img.convert('RGB')
+        for v in variants:
+            dest = os.path.join(STATIC_DIR, v['path'])
+            if os.path.exists(dest):
+                continue
+            height = round(img.height * v['width'] / img.width)
+            resized = img if v['width'] == img.width else img.resize((v['width'], height), Image.LANCZOS)
+            _, options = FORMATS[v['format']]
+            tmp = dest + '.tmp'
+            resized.save(tmp, v['format'].upper(), **options)
+            os.replace(tmp, dest)
+    return src
+
+def source_images():
+    for name in sorted(os.listdir(SOURCE_DIR)):
+        if name.lower().endswith(SOURCE_EXTS):
+            yield f'images/{name}'
+
+def photo_images():
+    """Local files referenced by property_photos."""
+    from db import iterate
+    for row in iterate('SELECT * FROM property_photos'):
+        for col in PHOTO_COLUMNS:
+            value = row.get(col)
+            if not value or '://' in value:
+                continue
+            rel = value.lstrip('/')
+            if rel.startswith('static/'):
+                rel = rel[len('static/'):]
+            if os.path.isfile(os.path.join(STATIC_DIR, rel)):
+                yield rel
+                break
+
+def build(include_photos=True, workers=None):
+    from PIL import Image
+    os.makedirs(os.path.join(STATIC_DIR, DERIVED), exist_ok=True)
+    sources = list(source_images())
+    if include_photos:
+        sources += [p for p in photo_images() if p not in sources]
+    data, jobs = {}, []
+    for rel in sources:
+        src = os.path.join(STATIC_DIR, rel)
+        digest = file_digest(src)
+        with Image.open(src) as img:
+            width = img.width
+        variants = plan_variants(rel, digest, width)
+        data[rel] = {'hash': digest, 'width': width, 'variants': variants}
+        if not all(os.path.exists(os.path.join(STATIC_DIR, v['path'])) for v in variants):
+            jobs.append((src, variants))
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for src in pool.map(render, *zip(*jobs)):
+                print(f'built {os.path.relpath(src, STATIC_DIR)}')
+    tmp = MANIFEST + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, MANIFEST)
+    # drop derivatives of sources that changed or disappeared
+    keep = {os.path.basename(v['path']) for e in data.values() for v in e['variants']}
+    keep.add(os.path.basename(MANIFEST))
+    for name in os.listdir(os.path.join(STATIC_DIR, DERIVED)):
+        if name not in keep:
+            os.remove(os.path.join(STATIC_DIR, DERIVED, name))
+    print(f'{len(sources)} images, {len(jobs)} rebuilt, {len(sources) - len(jobs)} up to date')
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if not args or args[0] != 'build':
+        print('usage: python images.py build [--no-photos] [--workers N]')
+        sys.exit(2)
+    workers = int(args[args.index('--workers') + 1]) if '--workers' in args else None
+    build(include_photos='--no-photos' not in args, workers=workers)
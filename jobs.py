@@ -0,0 +1,203 @@
+# jobs.py
+# Durable background jobs in a MySQL table, run by worker threads.
+# Requests enqueue follow-up work (saved-search matching) and return;
+# workers in every app process (or a dedicated `python jobs.py work`) claim
+# jobs with SELECT ... FOR UPDATE SKIP LOCKED, retry failures with
+# backoff and keep done rows for a while so idempotency keys keep deduping.
+#   python jobs.py work    # run workers in the foreground
+#   python jobs.py stats   # queue depth and oldest waiting job
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import db
+from db import fetchone, fetchall, execute, transaction
+import metrics
+
+WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+LEASE_SECONDS = 300        # a running job whose worker died is reclaimed after this
+RETENTION_DAYS = 7
+STATUSES = ('queued', 'running', 'failed')
+# while the database is down every worker fails every poll; report that this often
+ERROR_LOG_SECONDS = 60
+
+log = logging.getLogger(__name__)
+
+handlers = {}
+_wake = threading.Event()
+_workers = []
+_start_lock = threading.Lock()
+
+metrics.registry.describe('homescout_jobs_total', 'counter', 'Background jobs finished by name and outcome')
+metrics.registry.describe('homescout_job_wait_seconds', 'histogram', 'Time from enqueue to a worker picking the job up')
+metrics.registry.describe('homescout_job_run_seconds', 'histogram', 'Background job run time')
+metrics.registry.describe('homescout_job_queue_depth', 'gauge', 'Jobs not yet done, by status')
+metrics.registry.describe('homescout_job_oldest_seconds', 'gauge', 'Age of the oldest queued job')
+
+def handler(name):
+    """Register fn(cur, payload) for a job name.
+
+    The handler runs inside a transaction that also marks the job done, so
+    whatever it writes through cur is applied exactly once.
+    """
+    def register(fn):
+        handlers[name] = fn
+        return fn
+    return register
+
+def enqueue(name, payload=None, key=None, delay=0, cur=None):
+    """Queue a job; a second enqueue with the same key is a no-op.
+
+    Pass the cursor of an open transaction() to queue the job atomically
+    with the rows that caused it, and call wake() after the commit.
+    """
+    sql = """INSERT INTO jobs (name, payload, idempotency_key, max_attempts, run_after)
+             VALUES (%s,%s,%s,%s,NOW(6) + INTERVAL %s SECOND)
+             ON DUPLICATE KEY UPDATE job_id=job_id"""
+    params = (name, json.dumps(payload or {}, default=str), key, MAX_ATTEMPTS, delay)
+    if cur is not None:
+        cur.execute(sql, params)
+        return
+    execute(sql, params)
+    wake()
+
+def wake():
+    _wake.set()
+
+def claim():
+    """Lease the next runnable job, or None."""
+    with transaction() as (conn, cur):
+        cur.execute("""SELECT job_id, name, payload, attempts, max_attempts,
+                              TIMESTAMPDIFF(MICROSECOND, created_at, NOW(6)) / 1000000
+                       FROM jobs WHERE status IN ('queued','running') AND run_after <= NOW(6)
+                       ORDER BY run_after, job_id LIMIT 1 FOR UPDATE SKIP LOCKED""")
+        row = cur.fetchone()
+        if row is None:
+            return None
+        job_id, name, payload, attempts, max_attempts, waited = row
+        cur.execute("""UPDATE jobs SET status='running', attempts=attempts+1,
+                       run_after=NOW(6) + INTERVAL %s SECOND WHERE job_id=%s""", (LEASE_SECONDS, job_id))
+    return {'job_id': job_id, 'name': name, 'payload': json.loads(payload), 'attempt': attempts + 1,
+            'max_attempts': max_attempts, 'waited': float(waited or 0)}
+
+def run(job):
+    name = job['name']
+    if job['attempt'] == 1:
+        metrics.registry.observe('homescout_job_wait_seconds', job['waited'], job=name)
+    started = time.perf_counter()
+    try:
+        fn = handlers.get(name)
+        if fn is None:
+            raise LookupError(f'no handler registered for job {name!r}')
+        with transaction() as (conn, cur):
+            fn(cur, job['payload'])
+            cur.execute("UPDATE jobs SET status='done', finished_at=NOW(6), last_error=NULL WHERE job_id=%s", (job['job_id'],))
+        outcome = 'done'
+    except Exception as e:
+        outcome = 'failed' if job['attempt'] >= job['max_attempts'] else 'retry'
+        # exponential backoff: 2s, 4s, 8s, ... capped at 10 minutes
+        backoff = min(600, 2 ** job['attempt'])
+        execute("""UPDATE jobs SET status=%s, last_error=%s, run_after=NOW(6) + INTERVAL %s SECOND,
+                   finished_at=IF(%s='failed', NOW(6), NULL) WHERE job_id=%s""",
+                ('failed' if outcome == 'failed' else 'queued', f'{type(e).__name__}: {e}', backoff, outcome, job['job_id']))
+        log.log(logging.ERROR if outcome == 'failed' else logging.WARNING, 'job %s (%s) attempt %s failed: %s',
+                job['job_id'], name, job['attempt'], e)
+    metrics.registry.observe('homescout_job_run_seconds', time.perf_counter() - started, job=name)
+    metrics.registry.inc('homescout_jobs_total', job=name, outcome=outcome)
+    return outcome
+
+def purge(days=RETENTION_DAYS):
+    return execute("DELETE FROM jobs WHERE status='done' AND finished_at < NOW(6) - INTERVAL %s DAY", (days,))
+
+def work_once():
+    """Run one job if any is due; True when a job ran."""
+    job = claim()
+    if job is None:
+        return False
+    run(job)
+    return True
+
+def _loop():
+    # handlers act on rows written moments ago, so read them from the primary
+    db.begin_routing(primary_reads=True)
+    last_purge = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_purge > 3600:
+                last_purge = time.monotonic()
+                purge()
+            if work_once():
+                continue
+        except Exception as e:
+            _worker_error(e)
+        _wake.wait(POLL_SECONDS)
+        _wake.clear()
+
+_errors = {'logged': 0.0, 'suppressed': 0}
+_errors_lock = threading.Lock()
+
+def _worker_error(e):
+    with _errors_lock:
+        now = time.monotonic()
+        if now - _errors['logged'] < ERROR_LOG_SECONDS:
+            _errors['suppressed'] += 1
+            return
+        suppressed, _errors['suppressed'], _errors['logged'] = _errors['suppressed'], 0, now
+    if suppressed:
+        log.error('job worker error: %s (%d more since the last report)', e, suppressed)
+    else:
+        log.error('job worker error: %s', e)
+
+def start(workers=WORKERS):
+    """Start the worker threads for this process (idempotent, cheap to repeat)."""
+    if sum(t.is_alive() for t in _workers) >= workers:
+        return
+    with _start_lock:
+        # threads inherited through fork() are not running in this process
+        _workers[:] = [t for t in _workers if t.is_alive()]
+        while len(_workers) < workers:
+            t = threading.Thread(target=_loop, name=f'job-worker-{len(_workers)}', daemon=True)
+            t.start()
+            _workers.append(t)
+
+
+_depth = {'at': 0.0, 'counts': {}, 'oldest': 0.0}
+_depth_lock = threading.Lock()
+
+def stats(max_age=5.0):
+    """Queue depth by status and the oldest queued job's age, cached for max_age seconds."""
+    with _depth_lock:
+        if time.monotonic() - _depth['at'] > max_age:
+            rows = fetchall("SELECT status, COUNT(*) as n FROM jobs WHERE status IN ('queued','running','failed') GROUP BY status")
+            oldest = fetchone("""SELECT TIMESTAMPDIFF(MICROSECOND, MIN(created_at), NOW(6)) / 1000000 as age
+                                 FROM jobs WHERE status='queued' AND run_after <= NOW(6)""")
+            _depth.update(at=time.monotonic(), counts={r['status']: r['n'] for r in rows},
+                          oldest=float(oldest['age'] or 0) if oldest else 0.0)
+        return {'depth': {s: _depth['counts'].get(s, 0) for s in STATUSES}, 'oldest_seconds': _depth['oldest']}
+
+for _status in STATUSES:
+    metrics.registry.gauge('homescout_job_queue_depth', lambda s=_status: stats()['depth'][s], status=_status)
+metrics.registry.gauge('homescout_job_oldest_seconds', lambda: stats()['oldest_seconds'])
+
+if __name__ == '__main__':
+    command = sys.argv[1:]
+    if command not in (['work'], ['stats']):
+        print('usage: python jobs.py work|stats')
+        sys.exit(2)
+    if command == ['stats']:
+        print(json.dumps(stats(max_age=0), indent=2))
+    else:
+        # handlers register on the importable module, not on __main__
+        import jobs
+        import matching
+        jobs.start(max(1, WORKERS))
+        print(f'{len(jobs._workers)} job workers running; Ctrl+C to stop')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,401 @@
+# keyword_index.py
+# Keyword search for /search?q=: an in-process inverted index over the title
+# and description of Available/Enlisted listings, ranked with BM25. Built on
+# first use and patched listing by listing after writes, here or (via
+# listing_sync) in another process, like similar.py.
+# Every word of the query must match; title words count TITLE_WEIGHT times.
+# With KEYWORD_SEARCH=0, search() returns None and the caller falls back to
+# MySQL's FULLTEXT index.
+#   python keyword_index.py bench      # build time and query latency at 10k / 100k / 1M listings
+import os
+import re
+import sys
+import time
+import threading
+from array import array
+from collections import Counter
+import numpy as np
+from db import fetchone, iterate
+from listing_sync import ListingSync
+
+ENABLED = os.getenv("KEYWORD_SEARCH", "1") == "1"
+
+LISTED_SQL = ("SELECT property_id, title, description, city, base_price, total_rooms "
+              "FROM properties WHERE status='Available' AND lifecycle_status='Enlisted'")
+CHANGED_COLUMNS = "property_id, title, description, city, base_price, total_rooms, status, lifecycle_status, updated_at"
+
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 3
+WORD = re.compile(r'\w+')
+STOPWORDS = frozenset('a an and are as at be by for from has have in is it its of on or the this to with'.split())
+
+
+_terms = {}
+
+def term(word):
+    """Index term for a lower-cased word, or None for a stopword."""
+    found = _terms.get(word, False)
+    if found is False:
+        found = word
+        if word in STOPWORDS:
+            found = None
+        elif len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            found = word[:-1]
+        if len(_terms) < 500_000:
+            _terms[word] = found
+    return found
+
+def tokens(text):
+    """Lower-cased words without stopwords; a plural 's' is dropped so 'schools' finds 'school'."""
+    return [t for t in map(term, WORD.findall((text or '').casefold())) if t is not None]
+
+def city_key(city):
+    # same folding as search_index, so both paths agree on what a city matches
+    return None if city is None else city.rstrip().casefold()
+
+
+class KeywordIndex:
+    """Postings are append-only per term: a changed listing gets a new slot and
+    its old slot is marked dead, so every posting list stays sorted by slot.
+    Dead slots are squeezed out once they pass a quarter of the index."""
+
+    def __init__(self, capacity=1024):
+        self.lock = threading.RLock()
+        self.loading = threading.Lock()
+        self.loaded = False
+        self.sync = ListingSync(CHANGED_COLUMNS)
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.length = np.zeros(capacity, dtype=np.float32)
+        self.price = np.full(capacity, np.nan, dtype=np.float64)
+        self.rooms = np.full(capacity, np.nan, dtype=np.float64)
+        self.city = np.full(capacity, -1, dtype=np.int32)
+        self.size = 0
+        self.postings = {}      # term -> (array('i') slots, array('f') weighted term frequency)
+        self.df = {}            # term -> live listings containing it
+        self.slot_of = {}       # property_id -> slot
+        self.terms_of = {}      # slot -> terms, to keep df right on removal
+        self.codes = {}
+        self.live = 0
+        self.dead = 0
+        self.total_length = 0.0
+
+    def _grow(self):
+        capacity = len(self.alive) * 2
+        for name, fill in (('alive', False), ('ids', 0), ('length', 0.0), ('price', np.nan), ('rooms', np.nan), ('city', -1)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def load(self):
+        """Build a fresh index outside the lock (a minute at 1M listings) and swap it in."""
+        self.sync.start()
+        fresh = KeywordIndex()
+        for row in iterate(LISTED_SQL):
+            fresh._add(row)
+        with self.lock:
+            for name in STATE:
+                setattr(self, name, getattr(fresh, name))
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self.loading:
+                if not self.loaded:
+                    self.load()
+        elif self.sync.due():
+            self.sync.apply(self.upsert, self.discard)
+
+    def catch_up(self, mark):
+        """Apply other processes' changes now unless the index is at mark (listing_sync.watermark())."""
+        if self.loaded and self.sync.behind(mark):
+            self.sync.apply(self.upsert, self.discard, wait=True, mark=mark)
+
+    def _add(self, row):
+        counts = Counter(tokens(row.get('description')))
+        for word in tokens(row.get('title')):
+            counts[word] += TITLE_WEIGHT
+        if self.size == len(self.alive):
+            self._grow()
+        i = self.size
+        self.size += 1
+        for term, tf in counts.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = (array('i'), array('f'))
+            posting[0].append(i)
+            posting[1].append(tf)
+            self.df[term] = self.df.get(term, 0) + 1
+        length = float(sum(counts.values()))
+        self.alive[i] = True
+        self.ids[i] = row['property_id']
+        self.length[i] = length
+        self.price[i] = np.nan if row.get('base_price') is None else float(row['base_price'])
+        self.rooms[i] = np.nan if row.get('total_rooms') is None else float(row['total_rooms'])
+        self.city[i] = self.codes.setdefault(city_key(row.get('city')), len(self.codes))
+        self.slot_of[row['property_id']] = i
+        self.terms_of[i] = tuple(counts)
+        self.live += 1
+        self.total_length += length
+
+    def _remove(self, property_id):
+        i = self.slot_of.pop(property_id, None)
+        if i is None:
+            return
+        self.alive[i] = False
+        for term in self.terms_of.pop(i):
+            self.df[term] -= 1
+        self.live -= 1
+        self.dead += 1
+        self.total_length -= self.length[i]
+
+    def _compact(self):
+        """Renumber live slots from 0 and drop dead postings (no database access)."""
+        n = self.size
+        alive = self.alive[:n]
+        remap = np.cumsum(alive, dtype=np.int64) - 1
+        for term in list(self.postings):
+            slots = np.frombuffer(self.postings[term][0], dtype=np.int32)
+            tf = np.frombuffer(self.postings[term][1], dtype=np.float32)
+            keep = alive[slots]
+            if not keep.any():
+                del self.postings[term]
+                self.df.pop(term, None)
+                continue
+            new_slots, new_tf = array('i'), array('f')
+            new_slots.frombytes(remap[slots[keep]].astype(np.int32).tobytes())
+            new_tf.frombytes(tf[keep].tobytes())
+            del slots, tf
+            self.postings[term] = (new_slots, new_tf)
+        live = np.flatnonzero(alive)
+        for name in ('ids', 'length', 'price', 'rooms', 'city'):
+            arr = getattr(self, name)
+            arr[:len(live)] = arr[live]
+        self.terms_of = {int(remap[i]): terms for i, terms in self.terms_of.items()}
+        self.slot_of = {pid: int(remap[i]) for pid, i in self.slot_of.items()}
+        self.alive[:] = False
+        self.alive[:len(live)] = True
+        self.size = len(live)
+        self.dead = 0
+
+    def upsert(self, row):
+        with self.lock:
+            self._remove(row['property_id'])
+            if row.get('status', 'Available') == 'Available' and row.get('lifecycle_status', 'Enlisted') == 'Enlisted':
+                self._add(row)
+            if self.dead > max(1024, self.live // 4):
+                self._compact()
+
+    def discard(self, property_id):
+        with self.lock:
+            self._remove(property_id)
+
+    def refresh(self, property_id):
+        if not self.loaded:
+            return
+        row = fetchone('SELECT property_id, title, description, city, base_price, total_rooms, status, lifecycle_status '
+                       'FROM properties WHERE property_id=%s', (property_id,))
+        if row is None:
+            self.discard(property_id)
+        else:
+            self.upsert(row)
+
+    def search(self, text, city=None, min_price=None, max_price=None, min_rooms=None, limit=200, after=None):
+        """[(property_id, score)] matching every query word, best first.
+
+        after is the (score, property_id) of the last result already shown.
+        """
+        terms = list(dict.fromkeys(tokens(text)))
+        if not terms:
+            return []
+        with self.lock:
+            slots, score = self._score(terms, city, min_price, max_price, min_rooms)
+            if after is not None:
+                tied = np.flatnonzero(score == after[0])
+                later = score < after[0]
+                later[tied[self.ids[slots[tied]] > after[1]]] = True
+                slots, score = slots[later], score[later]
+            if len(score) > limit:
+                # keep everything tied with the limit-th score so the id tie-break is exact
+                cut = np.partition(score, len(score) - limit)[len(score) - limit]
+                near = score >= cut
+                slots, score = slots[near], score[near]
+            ids = self.ids[slots]
+            del slots   # may still be a view of a posting list
+        order = np.lexsort((ids, -score))[:limit]
+        return [(int(ids[j]), float(score[j])) for j in order]
+
+    def matching_ids(self, text):
+        """Property ids of every live listing containing all words of text."""
+        terms = list(dict.fromkeys(tokens(text)))
+        if not terms:
+            return np.zeros(0, dtype=np.int64)
+        with self.lock:
+            found = self._intersect(terms)
+            ids = self.ids[found[1]] if found else np.zeros(0, dtype=np.int64)
+            del found
+        return ids
+
+    def _intersect(self, terms):
+        """(postings, slots, per-term frequencies) of the live listings containing
+        every term, or None.
+
+        Runs under the lock; callers must drop the results before releasing
+        it: an array('i') cannot grow while a NumPy view of its buffer is alive.
+        """
+        lists = []
+        for term in terms:
+            if not self.df.get(term):
+                return None
+            slots, tf = self.postings[term]
+            lists.append((term, np.frombuffer(slots, dtype=np.int32), np.frombuffer(tf, dtype=np.float32)))
+        # intersect starting from the rarest word
+        lists.sort(key=lambda entry: len(entry[1]))
+        _, slots, tf = lists[0]
+        freqs = [tf]
+        if self.dead:
+            keep = self.alive[slots]
+            slots = slots[keep]
+            freqs = [tf[keep]]
+        if len(lists) > 1:
+            # scatter each longer list into a dense slot -> tf array and read the
+            # candidates back: two linear passes instead of a binary search each
+            dense = np.zeros(self.size, dtype=np.float32)
+            for _, other, other_tf in lists[1:]:
+                dense[other] = other_tf
+                f = dense[slots]
+                hit = f > 0
+                slots = slots[hit]
+                freqs = [g[hit] for g in freqs] + [f[hit]]
+                dense[other] = 0
+        return lists, slots, freqs
+
+    def _score(self, terms, city, min_price, max_price, min_rooms):
+        """(slots, BM25 scores) of the live listings matching all terms and filters."""
+        none = np.zeros(0, dtype=np.int32), np.zeros(0)
+        found = self._intersect(terms)
+        if found is None:
+            return none
+        lists, slots, freqs = found
+        mask = None
+        if city:
+            code = self.codes.get(city_key(city))
+            if code is None:
+                return none
+            mask = self.city[slots] == code
+        # NaN (a NULL column) fails every comparison, as in SQL
+        if min_price is not None or max_price is not None:
+            price = self.price[slots]
+            if min_price is not None:
+                mask = price >= min_price if mask is None else mask & (price >= min_price)
+            if max_price is not None:
+                mask = price <= max_price if mask is None else mask & (price <= max_price)
+        if min_rooms is not None:
+            mask = self.rooms[slots] >= min_rooms if mask is None else mask & (self.rooms[slots] >= min_rooms)
+        if mask is not None:
+            slots = slots[mask]
+            freqs = [f[mask] for f in freqs]
+        avgdl = self.total_length / self.live
+        norm = (K1 * (1 - B) + (K1 * B / avgdl) * self.length[slots]).astype(np.float32)
+        score = np.zeros(len(slots), dtype=np.float32)
+        for (term, _, _), f in zip(lists, freqs):
+            df = self.df[term]
+            idf = np.float32(np.log(1 + (self.live - df + 0.5) / (df + 0.5)) * (K1 + 1))
+            score += idf * f / (f + norm)
+        return slots, score.astype(np.float64)
+
+# what load() builds and swaps in
+STATE = ('alive', 'ids', 'length', 'price', 'rooms', 'city', 'size', 'postings', 'df', 'slot_of', 'terms_of',
+         'codes', 'live', 'dead', 'total_length')
+
+index = KeywordIndex()
+
+def _number(value):
+    if value is None or value == '':
+        return None
+    return float(value)
+
+def search(text, city=None, min_price=None, max_price=None, min_rooms=None, limit=200, after=None):
+    """[(property_id, score)] from memory, or None to fall back to MySQL."""
+    if not ENABLED:
+        return None
+    try:
+        min_price, max_price, min_rooms = _number(min_price), _number(max_price), _number(min_rooms)
+        if after is not None:
+            after = (float(after[0]), int(after[1]))
+    except (TypeError, ValueError):
+        return None
+    index.ensure_loaded()
+    return index.search(text, city or None, min_price, max_price, min_rooms, limit, after)
+
+def matching_ids(text):
+    """Ids of the listings containing every word of text, or None when the index is off."""
+    if not ENABLED:
+        return None
+    index.ensure_loaded()
+    return index.matching_ids(text)
+
+def catch_up(mark):
+    if ENABLED:
+        index.catch_up(mark)
+
+def refresh(property_id):
+    if ENABLED:
+        index.refresh(property_id)
+
+def discard(property_id):
+    if ENABLED:
+        index.discard(property_id)
+
+
+VOCABULARY = ('lake view', 'near school', 'quiet street', 'corner plot', 'rooftop garden', 'south facing',
+              'newly renovated', 'gas connection', 'close to market', 'river view', 'gated community',
+              'servant quarter', 'generator backup', 'near hospital', 'park view', 'open kitchen')
+
+def synthetic_rows(n, seed=11):
+    rng = np.random.default_rng(seed)
+    cities = ['Dhaka', 'Chattogram', 'Sylhet', 'Khulna', 'Rajshahi', 'Barishal', 'Rangpur', 'Mymensingh']
+    picks = rng.integers(0, len(VOCABULARY), (n, 4))
+    rooms = rng.integers(1, 7, n)
+    for i in range(n):
+        phrases = [VOCABULARY[j] for j in picks[i]]
+        yield {'property_id': i + 1, 'title': f'{rooms[i]} bed flat with {phrases[0]}',
+               'description': f'Spacious home in block {i % 500}, {phrases[1]}, {phrases[2]} and {phrases[3]}. '
+                              f'Lift, parking and {rooms[i]} bedrooms.',
+               'city': cities[i % len(cities)], 'base_price': float(3_000_000 + (i % 97) * 100_000),
+               'total_rooms': int(rooms[i])}
+
+def bench(sizes=(10_000, 100_000, 1_000_000), queries=100):
+    cases = [('lake view', {}), ('near school', {'city': 'Dhaka'}), ('gated community generator', {'min_rooms': 3}),
+             ('river view', {'city': 'Sylhet', 'min_price': 4_000_000, 'max_price': 9_000_000})]
+    for n in sizes:
+        idx = KeywordIndex()
+        started = time.perf_counter()
+        with idx.lock:
+            for row in synthetic_rows(n):
+                idx._add(row)
+            idx.loaded = True
+        build = time.perf_counter() - started
+        for text, filters in cases:
+            samples = []
+            for _ in range(queries):
+                t = time.perf_counter()
+                hits = idx.search(text, limit=51, **filters)
+                samples.append((time.perf_counter() - t) * 1000)
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            print(f'{n:>9,} listings  build {build:6.2f}s  {text!r:<30} {len(hits):>3} hits  p50 {p50:6.2f}ms  p95 {p95:6.2f}ms  p99 {p99:6.2f}ms')
+        t = time.perf_counter()
+        idx.upsert(dict(next(synthetic_rows(1)), property_id=1))
+        print(f'{n:>9,} listings  patch {(time.perf_counter() - t) * 1000:.3f}ms')
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['bench']:
+        print('usage: python keyword_index.py bench [N ...]')
+        sys.exit(2)
+    sizes = tuple(int(a) for a in sys.argv[2:]) or (10_000, 100_000, 1_000_000)
+    bench(sizes)
@@ -0,0 +1,127 @@
+# listing_sync.py
+# Change feed that keeps the in-process listing indexes (similar,
+# keyword_index, facets, search_index) in step with writes made by other
+# processes. Each index remembers the newest change it has applied, and
+# every INDEX_SYNC_SECONDS re-reads only what changed since then: rows by
+# properties.updated_at (idx_properties_updated_at, migration 0002;
+# microseconds since 0006, so two changes to a listing within a second stay
+# apart) and deleted listings from the listing_deletions tombstones (0007),
+# since a cascading DELETE leaves no row to find. The writing process still
+# patches itself at once through refresh() / discard().
+# The feed reads the primary: pages validated against the primary's
+# watermark must not be built from an index synced off a lagging replica.
+import os
+import time
+import datetime
+import threading
+import db
+from db import fetchone, fetchall, iterate
+
+SYNC_SECONDS = float(os.getenv("INDEX_SYNC_SECONDS", "5"))
+# updated_at is stamped when a statement runs but only seen once it commits,
+# so a slow transaction can land behind rows already applied: each sync
+# re-reads this much history and skips the row versions it has applied.
+# A full load may read a replica, which is at most DB_REPLICA_MAX_LAG behind
+# (plus one lag check); the overlap covers what it missed as well.
+OVERLAP = datetime.timedelta(seconds=max(60.0, 2 * db.REPLICA_MAX_LAG))
+# for the same reason a write can commit without moving MAX(updated_at):
+# the watermark also folds in every row version stamped this close to it
+SETTLE_SECONDS = 10
+EPOCH = datetime.datetime(1970, 1, 2)
+
+
+def watermark():
+    """(newest properties.updated_at, checksum of the row versions stamped within
+    SETTLE_SECONDS of it, newest deletion), read on the primary. Every listing
+    insert, update and delete changes it."""
+    with db.on_primary():
+        row = fetchone("""SELECT m.updated_at,
+                          (SELECT BIT_XOR(CRC32(CONCAT(p.property_id, '@', p.updated_at))) FROM properties p
+                           WHERE p.updated_at >= m.updated_at - INTERVAL %s SECOND) as settling,
+                          (SELECT MAX(deleted_at) FROM listing_deletions) as deleted_at
+                          FROM (SELECT MAX(updated_at) as updated_at FROM properties) m""", (SETTLE_SECONDS,))
+    return row['updated_at'], row['settling'], row['deleted_at']
+
+def latest(mark):
+    """The newest change in a watermark, or None while there has been none."""
+    updated_at, _, deleted_at = mark
+    return max(filter(None, (updated_at, deleted_at)), default=None)
+
+def record_deletions(cur, property_ids):
+    """Leave a tombstone per listing, in the transaction that deletes them."""
+    if property_ids:
+        cur.executemany('INSERT INTO listing_deletions (property_id) VALUES (%s) '
+                        'ON DUPLICATE KEY UPDATE deleted_at=CURRENT_TIMESTAMP(6)',
+                        [(property_id,) for property_id in property_ids])
+
+
+class ListingSync:
+    def __init__(self, columns):
+        # columns must include status, lifecycle_status and updated_at
+        self.sql = f'SELECT {columns} FROM properties WHERE updated_at >= %s ORDER BY updated_at'
+        self.lock = threading.Lock()
+        self.seen = None        # newest updated_at / deleted_at applied
+        self.applied = {}       # property_id -> updated_at applied, inside the overlap
+        self.deleted = {}       # property_id -> deleted_at applied, inside the overlap
+        self.mark = None        # the last watermark caught up to
+        self.checked = 0.0
+
+    def start(self):
+        """Call before a full load: changes made while it runs come in with the next sync."""
+        mark = watermark()
+        with self.lock:
+            self.seen = latest(mark) or EPOCH
+            self.mark = mark
+            self.applied = {}
+            self.deleted = {}
+            self.checked = time.monotonic()
+
+    def due(self):
+        return self.seen is not None and time.monotonic() - self.checked >= SYNC_SECONDS
+
+    def behind(self, mark):
+        """True unless the index has caught up to mark, a watermark()."""
+        return self.seen is not None and mark != self.mark
+
+    def apply(self, upsert, discard, wait=False, mark=None):
+        """Pass every listing deleted since the last sync to discard, then
+        every row changed since to upsert, oldest first.
+
+        Only one thread syncs at a time; without wait, a thread that finds a
+        sync running goes on with what the index has. mark is a watermark()
+        read before the call, which the index has caught up to afterwards.
+        """
+        if not self.lock.acquire(blocking=wait):
+            return 0
+        try:
+            self.checked = time.monotonic()
+            since = self.seen - OVERLAP
+            applied = 0
+            with db.on_primary():
+                for row in fetchall('SELECT property_id, deleted_at FROM listing_deletions WHERE deleted_at >= %s', (since,)):
+                    pid, at = row['property_id'], row['deleted_at']
+                    if self.deleted.get(pid) == at:
+                        continue
+                    discard(pid)
+                    self.deleted[pid] = at
+                    # a row under this id below is newer than the deletion
+                    self.applied.pop(pid, None)
+                    self.seen = max(self.seen, at)
+                    applied += 1
+                # streamed: after a bulk update or a seed this is most of the table
+                for row in iterate(self.sql, (since,)):
+                    pid, at = row['property_id'], row['updated_at']
+                    if self.applied.get(pid) == at:
+                        continue
+                    upsert(row)
+                    self.applied[pid] = at
+                    self.seen = max(self.seen, at)
+                    applied += 1
+            cutoff = self.seen - OVERLAP
+            self.applied = {pid: at for pid, at in self.applied.items() if at >= cutoff}
+            self.deleted = {pid: at for pid, at in self.deleted.items() if at >= cutoff}
+            if mark is not None:
+                self.mark = mark
+            return applied
+        finally:
+            self.lock.release()
@@ -0,0 +1,347 @@
+# loadtest.py
+# Synthetic data at scale and a load driver with per-route latency percentiles.
+#   python loadtest.py seed 100000                  # properties (users, sales, ... scale with it)
+#   python loadtest.py run [--url URL] [--concurrency N] [--duration S] [--out FILE]
+#   python loadtest.py compare OLD.json NEW.json
+# Seeded accounts share the password "loadtest"; `run` logs in with them.
+import sys
+import json
+import time
+import random
+import datetime
+import threading
+import subprocess
+import http.cookiejar
+import urllib.error
+import urllib.parse
+import urllib.request
+import numpy as np
+
+PASSWORD = 'loadtest'
+BATCH = 5000
+CITIES = ['Dhaka', 'Chattogram', 'Sylhet', 'Khulna', 'Rajshahi', 'Barishal', 'Rangpur', 'Mymensingh', 'Cumilla', "Cox's Bazar"]
+CITY_WEIGHTS = [30, 18, 8, 8, 7, 5, 5, 5, 6, 8]
+AREAS = ['Gulshan', 'Dhanmondi', 'Banani', 'Uttara', 'Mirpur', 'Agrabad', 'Zindabazar', 'Sonadanga', 'Kazla', 'Kolatoli']
+KINDS = ['Apartment', 'Flat', 'Duplex', 'Penthouse', 'House']
+PARKING = ['None', 'Street', 'Covered', 'Garage']
+FACING = ['North', 'South', 'East', 'West']
+ENQUIRY_STATUS = ['Pending', 'Visit1', 'Visit2', 'Negotiating', 'Confirmed']
+
+# rows per property
+RATIOS = {'seller': 0.2, 'buyer': 0.5, 'investor': 0.01, 'employee': 0.002, 'enquiry': 1.0, 'sale': 0.1}
+
+# persona -> (share of virtual users, [(route, weight)])
+PERSONAS = {
+    'visitor': (0.6, [('/search', 5), ('/property/<id>', 4), ('/', 1)]),
+    'buyer': (0.2, [('/buyer', 2), ('/search', 4), ('/property/<id>', 4)]),
+    'agent': (0.1, [('/agent', 3), ('/property/<id>', 1)]),
+    'admin': (0.1, [('/admin', 2), ('/reports', 1), ('/admin/properties', 1), ('/api/reports_bundle', 2),
+                    ('/api/best_employees', 1), ('/api/monthly_revenue', 1), ('/api/top_locations', 1),
+                    ('/api/property_status_stats', 1)]),
+}
+LOGIN_ROLE = {'buyer': 'buyer', 'agent': 'employee', 'admin': 'admin'}
+
+
+# --- seeding ---
+def scale(properties):
+    counts = {k: max(1, int(properties * r)) for k, r in RATIOS.items()}
+    counts['employee'] = max(5, counts['employee'])
+    counts['property'] = properties
+    counts['admin'] = 1
+    return counts
+
+def _max_id(table, column):
+    from db import fetchone
+    return fetchone(f'SELECT COALESCE(MAX({column}), 0) as id FROM {table}')['id']
+
+def _timed(label, fn, *args):
+    started = time.perf_counter()
+    rows = fn(*args)
+    seconds = time.perf_counter() - started
+    print(f'  {label:<12} {rows:>10,} rows  {seconds:7.2f}s  {rows / seconds if seconds else 0:>10,.0f} rows/s')
+    return rows
+
+def seed(properties, seed_value=None):
+    """Bulk-load a synthetic dataset sized by the number of properties."""
+    from db import execute_many, iterate
+    import rollups
+    rng = random.Random(seed_value)
+    counts = scale(properties)
+    tag = time.strftime('%y%m%d%H%M%S')
+    today = datetime.date.today()
+    started = time.perf_counter()
+    print(f'seeding {properties:,} properties (tag {tag})')
+
+    first_user = _max_id('users', 'user_id')
+    roles = [(r, counts[r]) for r in ('admin', 'employee', 'seller', 'buyer', 'investor')]
+    _timed('users', execute_many, 'INSERT INTO users (username,email,phone,password,role) VALUES (%s,%s,%s,%s,%s)',
+           ((f'lt{tag}_{role}_{i}', f'lt{tag}_{role}_{i}@example.com', None, PASSWORD, role)
+            for role, n in roles for i in range(n)), BATCH)
+    ids = {role: [] for role, _ in roles}
+    for r in iterate('SELECT user_id, role FROM users WHERE user_id > %s ORDER BY user_id', (first_user,)):
+        ids[r['role']].append(r['user_id'])
+    _timed('employees', execute_many, 'INSERT INTO employees (employee_id, display_name, status) VALUES (%s,%s,%s)',
+           ((i, f'Agent {i}', 'Active') for i in ids['employee']), BATCH)
+    _timed('sellers', execute_many, 'INSERT INTO sellers (seller_id, full_name) VALUES (%s,%s)',
+           ((i, f'Seller {i}') for i in ids['seller']), BATCH)
+    _timed('buyers', execute_many, 'INSERT INTO buyers (buyer_id, full_name) VALUES (%s,%s)',
+           ((i, f'Buyer {i}') for i in ids['buyer']), BATCH)
+    _timed('investors', execute_many, 'INSERT INTO investors (investor_id, full_name) VALUES (%s,%s)',
+           ((i, f'Investor {i}') for i in ids['investor']), BATCH)
+
+    def property_rows():
+        sold = set(rng.sample(range(properties), counts['sale']))
+        for i in range(properties):
+            rooms = rng.choices([1, 2, 3, 4, 5, 6], [5, 20, 35, 25, 10, 5])[0]
+            area = int(rng.gauss(400 + rooms * 350, 150))
+            area = max(350, area)
+            city = rng.choices(CITIES, CITY_WEIGHTS)[0]
+            price = round(area * rng.uniform(4000, 15000) * (1.6 if city == 'Dhaka' else 1.0), -3)
+            status, lifecycle = ('Sold', 'Sold') if i in sold else rng.choices(
+                [('Available', 'Enlisted'), ('Inactive', 'Removed')], [97, 3])[0]
+            yield (rng.choice(ids['seller']), rng.choice(ids['employee']), f'{rooms}-room {rng.choice(KINDS)} in {rng.choice(AREAS)}',
+                   'Synthetic listing for load testing.', city, rng.choice(AREAS), area, rng.randint(0, 20), rooms,
+                   max(1, rooms - rng.randint(0, 1)), rng.randint(0, 3), rng.choice(FACING), int(rng.random() < 0.5),
+                   int(rng.random() < 0.6), rng.choice(PARKING), price, price, lifecycle, status)
+    first_property = _max_id('properties', 'property_id')
+    _timed('properties', execute_many,
+           """INSERT INTO properties (seller_id, listed_by_employee, title, description, city, location, area_sqft, floor,
+              total_rooms, bathrooms, balcony_count, facing, has_lift, open_kitchen, parking_type, base_price,
+              estimated_market_value, lifecycle_status, status)
+              VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)""", property_rows(), BATCH)
+    listed, sold = [], []
+    for r in iterate('SELECT property_id, seller_id, listed_by_employee, base_price, status FROM properties WHERE property_id > %s', (first_property,)):
+        (sold if r['status'] == 'Sold' else listed).append(r)
+
+    def enquiry_rows():
+        for _ in range(counts['enquiry']):
+            p = rng.choice(listed or sold)
+            yield (p['property_id'], rng.choice(ids['buyer']), p['listed_by_employee'],
+                   today - datetime.timedelta(days=rng.randint(0, 365)), 'Synthetic enquiry', rng.choice(ENQUIRY_STATUS))
+    _timed('enquiries', execute_many,
+           'INSERT INTO enquiries (property_id, buyer_id, employee_id, enquiry_date, notes, status) VALUES (%s,%s,%s,%s,%s,%s)',
+           enquiry_rows(), BATCH)
+
+    def sale_rows():
+        for p in sold:
+            price = round(float(p['base_price']) * rng.uniform(0.9, 1.05), 2)
+            yield (p['property_id'], rng.choice(ids['buyer']), p['seller_id'], p['listed_by_employee'], price,
+                   round(price * 0.002, 2), round(price * 0.02, 2), today - datetime.timedelta(days=rng.randint(0, 730)))
+    first_sale = _max_id('sales', 'sale_id')
+    _timed('sales', execute_many,
+           """INSERT INTO sales (property_id,buyer_id,seller_id,employee_id,final_price,employee_commission,company_commission,sale_date)
+              VALUES (%s,%s,%s,%s,%s,%s,%s,%s)""", sale_rows(), BATCH)
+
+    def payment_rows():
+        for s in iterate('SELECT sale_id, buyer_id, seller_id, employee_id, final_price, employee_commission, company_commission FROM sales WHERE sale_id > %s', (first_sale,)):
+            price, emp, comp = s['final_price'], s['employee_commission'], s['company_commission']
+            yield (s['sale_id'], s['buyer_id'], 1, 'BuyerToCompany', price, 'Buyer paid company')
+            yield (s['sale_id'], 1, s['seller_id'], 'CompanyToSeller', price - emp - comp, 'Payout to seller')
+            yield (s['sale_id'], 1, s['employee_id'], 'CompanyToEmployee', emp, 'Agent commission')
+    _timed('payments', execute_many,
+           'INSERT INTO payments (sale_id, from_user_id, to_user_id, payment_type, amount, notes) VALUES (%s,%s,%s,%s,%s,%s)',
+           payment_rows(), BATCH)
+    started_rollups = time.perf_counter()
+    rollups.rebuild()
+    print(f'  rollups rebuilt in {time.perf_counter() - started_rollups:.2f}s')
+    print(f'seeded in {time.perf_counter() - started:.1f}s')
+
+
+# --- load driver ---
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One virtual user: its own cookie jar, redirects reported rather than followed."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+
+    def request(self, path, form=None):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        try:
+            with self.opener.open(self.base_url + path, data, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def login(self, username):
+        return self.request('/login', {'identifier': username, 'password': PASSWORD}) in (200, 302)
+
+
+class Workload:
+    def __init__(self, rng, property_ids):
+        self.rng = rng
+        self.property_ids = property_ids
+
+    def path(self, route):
+        if route == '/property/<id>':
+            return f'/property/{self.rng.choice(self.property_ids)}'
+        if route == '/search':
+            args = {}
+            if self.rng.random() < 0.8:
+                args['city'] = self.rng.choices(CITIES, CITY_WEIGHTS)[0]
+            if self.rng.random() < 0.6:
+                low = self.rng.choice([1, 2, 3, 5, 8]) * 1_000_000
+                args.update(min_price=low, max_price=low * self.rng.choice([2, 3, 5]))
+            if self.rng.random() < 0.4:
+                args['min_rooms'] = self.rng.randint(1, 4)
+            return '/search?' + urllib.parse.urlencode(args)
+        return route
+
+
+def personas(concurrency, credentials):
+    """Spread virtual users over personas by share; roles with no account become visitors."""
+    names = []
+    for name, (share, _) in PERSONAS.items():
+        if name != 'visitor' and credentials.get(LOGIN_ROLE[name]):
+            names += [name] * round(share * concurrency)
+    names = names[:concurrency]
+    return names + ['visitor'] * (concurrency - len(names))
+
+def load_fixtures():
+    """Property ids to visit and seeded usernames per role."""
+    from db import fetchone, fetchall
+    bounds = fetchone("SELECT MIN(property_id) as lo, MAX(property_id) as hi FROM properties WHERE status='Available' AND lifecycle_status='Enlisted'")
+    rng = random.Random(1)
+    ids = []
+    if bounds and bounds['lo'] is not None:
+        ids = [rng.randint(bounds['lo'], bounds['hi']) for _ in range(10000)]
+    credentials = {}
+    for role in set(LOGIN_ROLE.values()):
+        credentials[role] = [r['username'] for r in fetchall('SELECT username FROM users WHERE role=%s AND password=%s LIMIT 200', (role, PASSWORD))]
+    return ids, credentials
+
+def drive(base_url, concurrency, duration, warmup, property_ids, credentials):
+    samples = []              # (route, status, seconds) after warmup
+    lock = threading.Lock()
+    deadline_warm = time.monotonic() + warmup
+    deadline = deadline_warm + duration
+    roster = personas(concurrency, credentials)
+
+    def user(n, persona):
+        rng = random.Random(n)
+        client = Client(base_url)
+        role = LOGIN_ROLE.get(persona)
+        if role and not client.login(rng.choice(credentials[role])):
+            persona = 'visitor'
+        routes, weights = zip(*PERSONAS[persona][1])
+        workload = Workload(rng, property_ids or [1])
+        local = []
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            route = rng.choices(routes, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = client.request(workload.path(route))
+            except Exception:
+                status = 0
+            if now >= deadline_warm:
+                local.append((route, status, time.perf_counter() - started))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=user, args=(n, p), daemon=True) for n, p in enumerate(roster)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, roster
+
+def summarize(samples, duration):
+    by_route = {}
+    for route, status, seconds in samples:
+        by_route.setdefault(route, []).append((status, seconds))
+    by_route['*'] = [(status, seconds) for _, status, seconds in samples]
+    report = {}
+    for route, rows in sorted(by_route.items()):
+        latencies = np.array([s for _, s in rows]) * 1000
+        statuses = {}
+        for status, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0, 0, 0)
+        report[route] = {
+            'requests': len(rows),
+            'errors': sum(1 for status, _ in rows if status == 0 or status >= 400),
+            'statuses': statuses,
+            'throughput_rps': round(len(rows) / duration, 2),
+            'mean_ms': round(float(latencies.mean()), 2) if len(latencies) else 0,
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2),
+            'max_ms': round(float(latencies.max()), 2) if len(latencies) else 0,
+        }
+    return report
+
+def print_report(routes):
+    print(f'{"route":<30} {"reqs":>8} {"err":>6} {"rps":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    for route, r in routes.items():
+        print(f'{route:<30} {r["requests"]:>8} {r["errors"]:>6} {r["throughput_rps"]:>8} {r["p50_ms"]:>8} {r["p95_ms"]:>8} {r["p99_ms"]:>8}')
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def run(url, concurrency, duration, warmup, out):
+    from db import fetchone
+    property_ids, credentials = load_fixtures()
+    dataset = {t: fetchone(f'SELECT COUNT(*) as n FROM {t}')['n'] for t in ('users', 'properties', 'enquiries', 'sales', 'payments')}
+    print(f'driving {url} with {concurrency} users for {duration}s (+{warmup}s warmup)')
+    samples, roster = drive(url, concurrency, duration, warmup, property_ids, credentials)
+    routes = summarize(samples, duration)
+    result = {
+        'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'config': {'url': url, 'concurrency': concurrency, 'duration': duration, 'warmup': warmup,
+                   'personas': {p: roster.count(p) for p in PERSONAS}},
+        'dataset': dataset,
+        'routes': routes,
+    }
+    print_report(routes)
+    with open(out, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f'results saved to {out}')
+    return result
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f'{old.get("commit")} -> {new.get("commit")}')
+    print(f'{"route":<30} {"rps":>16} {"p50 ms":>18} {"p95 ms":>18} {"p99 ms":>18}')
+    for route, r in new['routes'].items():
+        o = old['routes'].get(route)
+        if o is None:
+            continue
+        cells = [f'{o[k]:>7} -> {r[k]:<7}' for k in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')]
+        print(f'{route:<30} ' + ' '.join(cells))
+
+def option(args, name, default):
+    return type(default)(args[args.index(name) + 1]) if name in args else default
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['seed'] and len(args) >= 2:
+        seed(int(args[1]), option(args, '--seed', 0) if '--seed' in args else None)
+    elif args[:1] == ['run']:
+        run(option(args, '--url', 'http://127.0.0.1:5000'), option(args, '--concurrency', 16),
+            option(args, '--duration', 60), option(args, '--warmup', 5),
+            option(args, '--out', time.strftime('loadtest-%Y%m%d-%H%M%S.json')))
+    elif args[:1] == ['compare'] and len(args) == 3:
+        compare(args[1], args[2])
+    else:
+        print('usage: python loadtest.py seed PROPERTIES [--seed N]\n'
+              '       python loadtest.py run [--url URL] [--concurrency N] [--duration S] [--warmup S] [--out FILE]\n'
+              '       python loadtest.py compare OLD.json NEW.json')
+        sys.exit(2)
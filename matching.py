@@ -0,0 +1,178 @@
+# matching.py
+# Saved-search matching: when a listing is enlisted, find every buyer whose
+# saved criteria it satisfies and open an enquiry (lead) for an agent.
+import math
+import datetime
+import threading
+from utils import to_float, to_int
+from db import fetchone, fetchall, execute, execute_many
+import jobs
+
+# price axis split into log-scale bands; a search is filed under every band
+# its [min_price, max_price] interval overlaps
+BANDS_PER_DECADE = 4
+MAX_BAND = 12 * BANDS_PER_DECADE
+
+def price_band(price):
+    if price is None or price <= 1:
+        return 0
+    return min(MAX_BAND, int(math.log10(price) * BANDS_PER_DECADE))
+
+def city_key(city):
+    return city.rstrip().casefold() if city else None
+
+def matches(search, listing):
+    price = listing.get('base_price')
+    if search['city'] and city_key(search['city']) != city_key(listing.get('city')):
+        return False
+    if search['min_price'] is not None and (price is None or price < search['min_price']):
+        return False
+    if search['max_price'] is not None and (price is None or price > search['max_price']):
+        return False
+    rooms = listing.get('total_rooms')
+    if search['min_rooms'] is not None and (rooms is None or rooms < search['min_rooms']):
+        return False
+    return True
+
+
+class SearchMatcher:
+    """Inverted index of saved searches keyed by (city, price band)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.searches = {}
+        self.postings = {}   # (city key or None, band or None) -> set of search ids
+        self.last_id = 0
+
+    def _slots(self, search):
+        ck = city_key(search['city'])
+        if search['min_price'] is None and search['max_price'] is None:
+            # no price filter: one posting matched by any price (including NULL)
+            return [(ck, None)]
+        lo = price_band(search['min_price'])
+        hi = MAX_BAND if search['max_price'] is None else price_band(search['max_price'])
+        return [(ck, band) for band in range(lo, hi + 1)]
+
+    def add(self, search):
+        search = dict(search)
+        for k in ('min_price', 'max_price'):
+            search[k] = None if search.get(k) is None else float(search[k])
+        with self.lock:
+            self._remove(search['search_id'])
+            self.searches[search['search_id']] = search
+            for slot in self._slots(search):
+                self.postings.setdefault(slot, set()).add(search['search_id'])
+            self.last_id = max(self.last_id, search['search_id'])
+
+    def _remove(self, search_id):
+        search = self.searches.pop(search_id, None)
+        if search is None:
+            return
+        for slot in self._slots(search):
+            ids = self.postings.get(slot)
+            if ids:
+                ids.discard(search_id)
+                if not ids:
+                    del self.postings[slot]
+
+    def remove(self, search_id):
+        with self.lock:
+            self._remove(search_id)
+
+    def sync(self):
+        """Pick up searches saved by other processes since the last sync."""
+        rows = fetchall('SELECT * FROM saved_searches WHERE search_id > %s ORDER BY search_id', (self.last_id,))
+        for row in rows:
+            self.add(row)
+
+    def candidates(self, listing):
+        price = listing.get('base_price')
+        price = None if price is None else float(price)
+        ck = city_key(listing.get('city'))
+        slots = [(ck, None), (None, None)]
+        if price is not None:
+            band = price_band(price)
+            slots += [(ck, band), (None, band)]
+        with self.lock:
+            ids = set()
+            for slot in slots:
+                ids |= self.postings.get(slot, set())
+            return [self.searches[i] for i in ids]
+
+    def match(self, listing):
+        listing = dict(listing)
+        if listing.get('base_price') is not None:
+            listing['base_price'] = float(listing['base_price'])
+        return [s for s in self.candidates(listing) if matches(s, listing)]
+
+
+matcher = SearchMatcher()
+_loaded = False
+
+def ensure_loaded():
+    global _loaded
+    if not _loaded:
+        matcher.sync()
+        _loaded = True
+
+def save_search(buyer_id, city, min_price, max_price, min_rooms):
+    search = {'buyer_id': buyer_id, 'city': city or None, 'min_price': to_float(min_price),
+              'max_price': to_float(max_price), 'min_rooms': to_int(min_rooms)}
+    search['search_id'] = execute('INSERT INTO saved_searches (buyer_id, city, min_price, max_price, min_rooms) VALUES (%s,%s,%s,%s,%s)',
+                                  (buyer_id, search['city'], search['min_price'], search['max_price'], search['min_rooms']))
+    if _loaded:
+        matcher.add(search)
+    return search['search_id']
+
+def delete_search(buyer_id, search_id):
+    execute('DELETE FROM saved_searches WHERE search_id=%s AND buyer_id=%s', (search_id, buyer_id))
+    matcher.remove(search_id)
+
+def create_leads(property_id, cur=None):
+    """Match one enlisted listing and open an enquiry per matching buyer.
+
+    Pass the cursor of an open transaction to write the enquiries in it.
+    """
+    listing = fetchone("SELECT property_id, city, base_price, total_rooms, listed_by_employee FROM properties WHERE property_id=%s AND status='Available' AND lifecycle_status='Enlisted'", (property_id,))
+    if not listing:
+        return 0
+    ensure_loaded()
+    matcher.sync()
+    found = matcher.match(listing)
+    if not found:
+        return 0
+    # drop searches deleted by another process, and buyers already in touch
+    ids = [s['search_id'] for s in found]
+    live = {r['search_id'] for r in fetchall('SELECT search_id FROM saved_searches WHERE search_id IN (%s)' % ','.join(['%s'] * len(ids)), tuple(ids))}
+    for search_id in set(ids) - live:
+        matcher.remove(search_id)
+    contacted = {r['buyer_id'] for r in fetchall('SELECT buyer_id FROM enquiries WHERE property_id=%s', (property_id,))}
+    buyers = sorted({s['buyer_id'] for s in found if s['search_id'] in live} - contacted)
+    if not buyers:
+        return 0
+    employee_id = listing['listed_by_employee']
+    if employee_id is None:
+        agent = fetchone('SELECT employee_id FROM employees WHERE status=%s LIMIT 1', ('Active',))
+        if not agent:
+            return 0
+        employee_id = agent['employee_id']
+    today = datetime.date.today()
+    sql = 'INSERT INTO enquiries (property_id, buyer_id, employee_id, enquiry_date, notes) VALUES (%s,%s,%s,%s,%s)'
+    leads = [(property_id, b, employee_id, today, 'Matched a saved search') for b in buyers]
+    if cur is not None:
+        cur.executemany(sql, leads)
+        return len(leads)
+    return execute_many(sql, leads)
+
+@jobs.handler('match_saved_searches')
+def _match_job(cur, payload):
+    # the leads commit with the job's own done mark, so a retry can't duplicate them
+    create_leads(payload['property_id'], cur=cur)
+
+def enqueue(property_id):
+    """Match a listing off the request thread (on the job queue)."""
+    row = fetchone('SELECT updated_at FROM properties WHERE property_id=%s', (property_id,))
+    # one job per version of the listing (updated_at is to the microsecond):
+    # enlisting it again unchanged queues nothing
+    key = f'match:{property_id}:{row["updated_at"] if row else None}'
+    jobs.enqueue('match_saved_searches', {'property_id': property_id}, key=key)
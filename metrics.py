@@ -0,0 +1,151 @@
+# metrics.py
+# Per-request DB accounting and process-wide counters in Prometheus text format.
+import threading
+import contextvars
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_request = contextvars.ContextVar('homescout_request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self, route):
+        self.route = route
+        self.lock = threading.Lock()   # gather() may account from worker threads
+        self.queries = 0
+        self.rows = 0
+        self.db_seconds = 0.0
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}     # (name, labels) -> value
+        self.histograms = {}   # (name, labels) -> Histogram
+        self.gauges = {}       # (name, labels) -> callable
+        self.help = {}
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def gauge(self, name, fn, **labels):
+        """Register a callable sampled at scrape time."""
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = fn
+
+    def render(self):
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {k: (list(h.counts), h.count, h.sum, h.buckets) for k, h in self.histograms.items()}
+            gauges = dict(self.gauges)
+        names = sorted({k[0] for k in counters} | {k[0] for k in histograms} | {k[0] for k in gauges})
+        for name in names:
+            kind, text = self.help.get(name, ('untyped', name))
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f'{name}{_labels(labels)} {_num(value)}')
+            for (n, labels), fn in sorted(gauges.items()):
+                if n == name:
+                    try:
+                        lines.append(f'{name}{_labels(labels)} {_num(fn())}')
+                    except Exception:
+                        pass
+            for (n, labels), (counts, count, total, buckets) in sorted(histograms.items()):
+                if n != name:
+                    continue
+                for bound, c in zip(buckets, counts):
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", _num(bound)),))} {c}')
+                lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {count}')
+                lines.append(f'{name}_sum{_labels(labels)} {_num(total)}')
+                lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _num(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def _labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for k, v in labels:
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{k}="{v}"')
+    return '{' + ','.join(parts) + '}'
+
+
+registry = Registry()
+registry.describe('homescout_http_request_duration_seconds', 'histogram', 'Route latency')
+registry.describe('homescout_http_requests_total', 'counter', 'Requests by route and status')
+registry.describe('homescout_db_queries_total', 'counter', 'Statements sent to MySQL by route')
+registry.describe('homescout_db_rows_total', 'counter', 'Rows returned by MySQL by route')
+registry.describe('homescout_db_seconds_total', 'counter', 'Cumulative MySQL time by route')
+registry.describe('homescout_db_queries_per_request', 'histogram', 'Statements per request by route')
+registry.describe('homescout_db_pool_wait_seconds', 'histogram', 'Time spent waiting for a pooled connection')
+
+def begin_request(route):
+    stats = RequestStats(route)
+    _request.set(stats)
+    return stats
+
+def current():
+    return _request.get()
+
+def end_request(status, seconds):
+    stats = _request.get()
+    if stats is None:
+        return None
+    _request.set(None)
+    registry.observe('homescout_http_request_duration_seconds', seconds, route=stats.route)
+    registry.inc('homescout_http_requests_total', route=stats.route, status=status)
+    registry.observe('homescout_db_queries_per_request', stats.queries, buckets=COUNT_BUCKETS, route=stats.route)
+    return stats
+
+def record_query(seconds, rows=0):
+    stats = _request.get()
+    route = stats.route if stats else 'background'
+    if stats is not None:
+        with stats.lock:
+            stats.queries += 1
+            stats.rows += rows
+            stats.db_seconds += seconds
+    registry.inc('homescout_db_queries_total', route=route)
+    registry.inc('homescout_db_rows_total', rows, route=route)
+    registry.inc('homescout_db_seconds_total', seconds, route=route)
+
+def record_pool_wait(seconds):
+    registry.observe('homescout_db_pool_wait_seconds', seconds)
@@ -0,0 +1,295 @@
+# migrate.py
+# Versioned schema migrations (migrations/NNNN_name.sql or .py) and an
+# EXPLAIN-based index check for the statements app.py issues.
+#   python migrate.py up       # apply pending migrations in order
+#   python migrate.py status   # applied / pending / edited-after-apply
+#   python migrate.py check    # EXPLAIN every app.py query, fail on full scans
+# Run `check` against realistically sized data (python loadtest.py seed ...):
+# on near-empty tables MySQL picks a full scan whatever indexes exist.
+import os
+import re
+import sys
+import ast
+import hashlib
+import datetime
+import importlib.util
+from mysql.connector import Error
+from db import fetchall, execute, explain
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS_DIR = os.path.join(BASE_DIR, 'migrations')
+APP_FILE = os.path.join(BASE_DIR, 'app.py')
+
+# errors meaning a statement's object already exists: adopting a database
+# that predates the migrations, or re-running one that was interrupted
+ALREADY_APPLIED = {1050: 'table exists', 1060: 'column exists', 1061: 'index exists'}
+
+TABLES = [
+    """CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT NOT NULL PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        checksum CHAR(40) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )""",
+]
+
+def ensure_tables():
+    for ddl in TABLES:
+        execute(ddl)
+
+def discover():
+    """[(version, name, path)] sorted by version."""
+    found = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        m = re.match(r'^(\d+)_(\w+)\.(sql|py)$', filename)
+        if m:
+            found.append((int(m.group(1)), filename, os.path.join(MIGRATIONS_DIR, filename)))
+    versions = [v for v, _, _ in found]
+    if len(versions) != len(set(versions)):
+        raise SystemExit('duplicate migration version in ' + MIGRATIONS_DIR)
+    return found
+
+def checksum(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def statements(path):
+    with open(path, encoding='utf-8') as f:
+        lines = [line for line in f if not line.lstrip().startswith('--')]
+    return [s.strip() for s in ''.join(lines).split(';') if s.strip()]
+
+def applied():
+    ensure_tables()
+    return {r['version']: r for r in fetchall('SELECT version, name, checksum, applied_at FROM schema_migrations')}
+
+UNIQUE_INDEX = re.compile(r'ALTER\s+TABLE\s+`?(\w+)`?\s+ADD\s+UNIQUE\s+(?:INDEX|KEY)\s+`?(\w+)`?\s*\(([^)]*)\)'
+                          r'|CREATE\s+UNIQUE\s+INDEX\s+`?(\w+)`?\s+ON\s+`?(\w+)`?\s*\(([^)]*)\)', re.IGNORECASE)
+# duplicate values listed per index before giving up
+DUPLICATES_SHOWN = 20
+
+def unique_indexes(sql):
+    """[(table, index, [columns])] a statement adds a UNIQUE index on."""
+    found = []
+    for m in UNIQUE_INDEX.finditer(sql):
+        table, index, columns = m.group(1, 2, 3) if m.group(1) else (m.group(5), m.group(4), m.group(6))
+        found.append((table, index, [c.strip().strip('`') for c in columns.split(',')]))
+    return found
+
+def duplicates(table, index, columns, limit=DUPLICATES_SHOWN):
+    """Values that would break a new UNIQUE index, with the ids of the rows holding them."""
+    exists = fetchall("""SELECT 1 FROM information_schema.STATISTICS
+                         WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND INDEX_NAME=%s LIMIT 1""", (table, index))
+    if exists:
+        return []
+    pk = [r['column_name'] for r in fetchall("""SELECT COLUMN_NAME as column_name FROM information_schema.KEY_COLUMN_USAGE
+                                                WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND CONSTRAINT_NAME='PRIMARY'
+                                                ORDER BY ORDINAL_POSITION""", (table,))]
+    ids = f"GROUP_CONCAT(CONCAT_WS('/', {', '.join(pk)}) ORDER BY {', '.join(pk)})" if pk else "''"
+    cols = ', '.join(columns)
+    # rows with a NULL in the key never conflict
+    return fetchall(f"""SELECT {cols}, COUNT(*) as n, {ids} as ids FROM {table}
+                        WHERE {' AND '.join(c + ' IS NOT NULL' for c in columns)}
+                        GROUP BY {cols} HAVING COUNT(*) > 1 ORDER BY n DESC LIMIT %s""", (limit,))
+
+def check_unique(name, sqls):
+    """Refuse to start a migration whose UNIQUE indexes the existing rows would break."""
+    problems = 0
+    for sql in sqls:
+        for table, index, columns in unique_indexes(sql):
+            for row in duplicates(table, index, columns):
+                problems += 1
+                value = ', '.join(f'{c}={row[c]!r}' for c in columns)
+                print(f'    {table}.{index}: {value} held by {row["n"]} rows (ids {row["ids"]})')
+    if problems:
+        raise SystemExit(f'{name} not applied: resolve the duplicate rows above, then run it again')
+
+def apply(version, name, path):
+    if path.endswith('.py'):
+        spec = importlib.util.spec_from_file_location(f'migration_{version}', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.up()
+    else:
+        sqls = statements(path)
+        check_unique(name, sqls)
+        for sql in sqls:
+            try:
+                execute(sql)
+            except Error as e:
+                if e.errno not in ALREADY_APPLIED:
+                    raise
+                print(f'    skipped ({ALREADY_APPLIED[e.errno]}): {" ".join(sql.split())[:90]}')
+    execute('INSERT INTO schema_migrations (version, name, checksum) VALUES (%s,%s,%s)', (version, name, checksum(path)))
+
+def up():
+    done = applied()
+    pending = [m for m in discover() if m[0] not in done]
+    for version, name, path in pending:
+        print(f'applying {name}')
+        apply(version, name, path)
+    print(f'{len(pending)} migration(s) applied' if pending else 'schema is up to date')
+
+def status():
+    done = applied()
+    for version, name, path in discover():
+        row = done.get(version)
+        if row is None:
+            state = 'pending'
+        elif row['checksum'] != checksum(path):
+            state = f'applied {row["applied_at"]} (file edited since)'
+        else:
+            state = f'applied {row["applied_at"]}'
+        print(f'{name:<40} {state}')
+
+
+# --- index check ---
+QUERY_FUNCS = ('fetchone', 'fetchall', 'execute', 'executemany', 'iterate')
+
+# statements app.py assembles at runtime, in their widest shapes
+DYNAMIC = [
+    ("/search city + price + cursor",
+     "SELECT * FROM properties WHERE status='Available' AND lifecycle_status='Enlisted' AND city=%s AND base_price >= %s "
+     "AND base_price <= %s AND total_rooms >= %s AND (base_price > %s OR (base_price = %s AND property_id > %s)) "
+     "ORDER BY base_price ASC, property_id ASC LIMIT %s",
+     ('Dhaka', 1000000, 9000000, 2, 2000000, 2000000, 1, 51)),
+    ("/search without filters",
+     "SELECT * FROM properties WHERE status='Available' AND lifecycle_status='Enlisted' "
+     "ORDER BY base_price ASC, property_id ASC LIMIT %s", (51,)),
+    ("/search?q= with KEYWORD_SEARCH=0",
+     "SELECT *, MATCH(title, description) AGAINST (%s IN BOOLEAN MODE) as relevance FROM properties "
+     "WHERE status='Available' AND lifecycle_status='Enlisted' AND MATCH(title, description) AGAINST (%s IN BOOLEAN MODE) "
+     "AND city=%s ORDER BY relevance DESC, property_id ASC LIMIT %s",
+     ('+lake* +view*', '+lake* +view*', 'Dhaka', 51)),
+    ("/search?q= listing rows",
+     "SELECT * FROM properties WHERE property_id IN (%s,%s,%s) AND status='Available' AND lifecycle_status='Enlisted'",
+     (1, 2, 3)),
+    ("listing_sync change feed (every INDEX_SYNC_SECONDS)",
+     "SELECT * FROM properties WHERE updated_at >= %s ORDER BY updated_at",
+     (datetime.datetime(2030, 1, 1),)),
+    ("listing_sync watermark (cacheable /search and /property)",
+     "SELECT m.updated_at, (SELECT BIT_XOR(CRC32(CONCAT(p.property_id, '@', p.updated_at))) FROM properties p "
+     "WHERE p.updated_at >= m.updated_at - INTERVAL %s SECOND) as settling, "
+     "(SELECT MAX(deleted_at) FROM listing_deletions) as deleted_at "
+     "FROM (SELECT MAX(updated_at) as updated_at FROM properties) m",
+     (10,)),
+    ("listing_sync deleted listings",
+     "SELECT property_id, deleted_at FROM listing_deletions WHERE deleted_at >= %s",
+     (datetime.datetime(2030, 1, 1),)),
+    ("/admin/properties next page",
+     "SELECT p.*, s.full_name as seller_name, e.display_name as agent_name FROM properties p "
+     "LEFT JOIN sellers s ON p.seller_id=s.seller_id LEFT JOIN employees e ON p.listed_by_employee=e.employee_id "
+     "WHERE (p.created_at < %s OR (p.created_at = %s AND p.property_id < %s)) "
+     "ORDER BY p.created_at DESC, p.property_id DESC LIMIT %s",
+     (datetime.datetime(2030, 1, 1), datetime.datetime(2030, 1, 1), 1000000, 51)),
+]
+
+# one row per agent / month / city: scanning them is bounded by design
+BOUNDED_TABLES = {'employees', 'sales_by_agent', 'sales_by_month', 'sales_by_city'}
+
+def app_queries(path=APP_FILE):
+    """(line, sql) for every literal statement passed to a db helper in app.py."""
+    with open(path, encoding='utf-8-sig') as f:
+        tree = ast.parse(f.read())
+    found = []
+    for node in ast.walk(tree):
+        sql = None
+        if isinstance(node, ast.Call) and node.args:
+            func = node.func
+            name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+            if name in QUERY_FUNCS:
+                sql = node.args[0]
+        elif isinstance(node, ast.Tuple) and len(node.elts) >= 2:
+            # gather((fetchall, 'SELECT ...'), ...)
+            if getattr(node.elts[0], 'id', None) in QUERY_FUNCS:
+                sql = node.elts[1]
+        if isinstance(sql, ast.Constant) and isinstance(sql.value, str):
+            found.append((node.lineno, ' '.join(sql.value.split())))
+    seen = set()
+    return [(line, sql) for line, sql in sorted(found) if not (sql in seen or seen.add(sql))]
+
+def sample_value(before):
+    """A plausible parameter for the placeholder that follows `before`."""
+    keyword = before.rstrip().upper()
+    if keyword.endswith(('LIMIT', 'OFFSET')):
+        return 10
+    if keyword.endswith('INTERVAL'):
+        return 1
+    m = re.search(r'(\w+)\s*(?:=|>=|<=|<>|!=|<|>)\s*$', before)
+    column = m.group(1).lower() if m else ''
+    if column.endswith('_date'):
+        return datetime.date(2024, 1, 1)
+    if column.endswith('_at'):
+        return datetime.datetime(2024, 1, 1)
+    if column.endswith(('_id', '_employee')) or column in ('total_rooms', 'floor'):
+        return 1
+    if 'price' in column or 'amount' in column:
+        return 1000000
+    if column == 'status':
+        return 'Active'
+    if column == 'city':
+        return 'Dhaka'
+    return 'x'
+
+def sample_params(sql):
+    parts = sql.split('%s')
+    return tuple(sample_value(''.join(parts[:i + 1])) for i in range(len(parts) - 1))
+
+def aliases(sql):
+    """{alias or table name: table name} for the FROM / JOIN clauses."""
+    found = {}
+    for table, alias in re.findall(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.IGNORECASE):
+        found[table] = table
+        if alias and alias.upper() not in ('WHERE', 'JOIN', 'LEFT', 'RIGHT', 'INNER', 'ON', 'GROUP', 'ORDER', 'LIMIT', 'SET'):
+            found[alias] = table
+    return found
+
+def full_scans(sql, plan):
+    """Plan rows that read a whole table (or a whole non-covering index without a LIMIT)."""
+    names = aliases(sql)
+    bad = []
+    for row in plan:
+        table = row.get('table') or ''
+        if not table or table.startswith('<') or names.get(table, table) in BOUNDED_TABLES:
+            continue
+        access = (row.get('type') or '').lower()
+        extra = row.get('Extra') or ''
+        if access == 'all':
+            bad.append(row)
+        elif access == 'index' and 'Using index' not in extra and ' LIMIT ' not in sql.upper():
+            bad.append(row)
+    return bad
+
+def check():
+    shapes = [(f'app.py:{line}', sql, sample_params(sql)) for line, sql in app_queries()
+              if sql.split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE')]
+    shapes += DYNAMIC
+    failures = 0
+    for label, sql, params in shapes:
+        try:
+            plan = explain(sql, params)
+        except Error as e:
+            failures += 1
+            print(f'ERROR {label}: {e}\n      {sql[:160]}')
+            continue
+        bad = full_scans(sql, plan)
+        if bad:
+            failures += 1
+            tables = ', '.join(f'{r["table"]} ({r["type"]}, ~{r.get("rows")} rows)' for r in bad)
+            print(f'SCAN  {label}: {tables}\n      {sql[:160]}')
+        else:
+            used = ', '.join(f'{r["table"]}:{r.get("key") or r.get("type")}' for r in plan if r.get('table'))
+            print(f'ok    {label}: {used}')
+    print(f'{len(shapes)} statements checked, {failures} problem(s)')
+    return failures == 0
+
+if __name__ == '__main__':
+    command = sys.argv[1:]
+    if command not in (['up'], ['status'], ['check']):
+        print('usage: python migrate.py up|status|check')
+        sys.exit(2)
+    if command == ['up']:
+        up()
+    elif command == ['status']:
+        status()
+    elif not check():
+        sys.exit(1)
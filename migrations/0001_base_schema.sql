@@ -0,0 +1,143 @@
+-- 0001_base_schema.sql
+-- Core HomeScout tables, reconstructed from the queries app.py runs.
+-- CREATE TABLE IF NOT EXISTS, so adopting an existing database is a no-op.
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(100) NOT NULL,
+    email VARCHAR(255) NULL,
+    phone VARCHAR(30) NULL,
+    password VARCHAR(255) NOT NULL,
+    role ENUM('admin','buyer','seller','employee','investor') NOT NULL DEFAULT 'buyer',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS buyers (
+    buyer_id INT NOT NULL PRIMARY KEY,
+    full_name VARCHAR(150) NULL,
+    CONSTRAINT fk_buyers_user FOREIGN KEY (buyer_id) REFERENCES users (user_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS sellers (
+    seller_id INT NOT NULL PRIMARY KEY,
+    full_name VARCHAR(150) NULL,
+    CONSTRAINT fk_sellers_user FOREIGN KEY (seller_id) REFERENCES users (user_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS employees (
+    employee_id INT NOT NULL PRIMARY KEY,
+    display_name VARCHAR(150) NULL,
+    status ENUM('Active','Inactive') NOT NULL DEFAULT 'Active',
+    CONSTRAINT fk_employees_user FOREIGN KEY (employee_id) REFERENCES users (user_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS investors (
+    investor_id INT NOT NULL PRIMARY KEY,
+    full_name VARCHAR(150) NULL,
+    total_invested DECIMAL(18,2) NOT NULL DEFAULT 0,
+    expected_return_rate DECIMAL(5,2) NULL,
+    CONSTRAINT fk_investors_user FOREIGN KEY (investor_id) REFERENCES users (user_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS seller_requests (
+    request_id INT AUTO_INCREMENT PRIMARY KEY,
+    seller_id INT NOT NULL,
+    approx_location VARCHAR(255) NULL,
+    approx_city VARCHAR(100) NULL,
+    approx_price DECIMAL(18,2) NULL,
+    approx_floor INT NULL,
+    approx_rooms INT NULL,
+    notes TEXT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'Pending',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_seller_requests_seller FOREIGN KEY (seller_id) REFERENCES sellers (seller_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS properties (
+    property_id INT AUTO_INCREMENT PRIMARY KEY,
+    seller_id INT NOT NULL,
+    listed_by_employee INT NULL,
+    title VARCHAR(255) NULL,
+    description TEXT NULL,
+    city VARCHAR(100) NULL,
+    location VARCHAR(255) NULL,
+    area_sqft INT NULL,
+    floor INT NULL,
+    total_rooms INT NULL,
+    bathrooms INT NULL,
+    balcony_count INT NULL,
+    facing VARCHAR(20) NULL,
+    has_lift TINYINT(1) NOT NULL DEFAULT 0,
+    open_kitchen TINYINT(1) NOT NULL DEFAULT 0,
+    parking_type VARCHAR(20) NOT NULL DEFAULT 'None',
+    base_price DECIMAL(18,2) NULL,
+    estimated_market_value DECIMAL(18,2) NULL,
+    lifecycle_status VARCHAR(20) NOT NULL DEFAULT 'Requested',
+    status VARCHAR(20) NOT NULL DEFAULT 'Inactive',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_properties_seller FOREIGN KEY (seller_id) REFERENCES sellers (seller_id) ON DELETE CASCADE,
+    CONSTRAINT fk_properties_employee FOREIGN KEY (listed_by_employee) REFERENCES employees (employee_id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS property_photos (
+    photo_id INT AUTO_INCREMENT PRIMARY KEY,
+    property_id INT NOT NULL,
+    photo_url VARCHAR(500) NOT NULL,
+    is_primary TINYINT(1) NOT NULL DEFAULT 0,
+    uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_property_photos_property FOREIGN KEY (property_id) REFERENCES properties (property_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS property_investments (
+    investment_id INT AUTO_INCREMENT PRIMARY KEY,
+    property_id INT NOT NULL,
+    investor_id INT NOT NULL,
+    invested_amount DECIMAL(18,2) NOT NULL,
+    expected_return_rate DECIMAL(5,2) NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'Active',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_property_investments_property FOREIGN KEY (property_id) REFERENCES properties (property_id) ON DELETE CASCADE,
+    CONSTRAINT fk_property_investments_investor FOREIGN KEY (investor_id) REFERENCES investors (investor_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS enquiries (
+    enquiry_id INT AUTO_INCREMENT PRIMARY KEY,
+    property_id INT NOT NULL,
+    buyer_id INT NOT NULL,
+    employee_id INT NULL,
+    enquiry_date DATE NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'Pending',
+    notes TEXT NULL,
+    CONSTRAINT fk_enquiries_property FOREIGN KEY (property_id) REFERENCES properties (property_id) ON DELETE CASCADE,
+    CONSTRAINT fk_enquiries_buyer FOREIGN KEY (buyer_id) REFERENCES buyers (buyer_id) ON DELETE CASCADE,
+    CONSTRAINT fk_enquiries_employee FOREIGN KEY (employee_id) REFERENCES employees (employee_id) ON DELETE SET NULL
+);
+
+-- money rows keep their history: users with sales can't be deleted
+CREATE TABLE IF NOT EXISTS sales (
+    sale_id INT AUTO_INCREMENT PRIMARY KEY,
+    property_id INT NOT NULL,
+    buyer_id INT NOT NULL,
+    seller_id INT NOT NULL,
+    employee_id INT NULL,
+    final_price DECIMAL(18,2) NOT NULL,
+    employee_commission DECIMAL(18,2) NOT NULL DEFAULT 0,
+    company_commission DECIMAL(18,2) NOT NULL DEFAULT 0,
+    sale_date DATE NOT NULL,
+    CONSTRAINT fk_sales_property FOREIGN KEY (property_id) REFERENCES properties (property_id),
+    CONSTRAINT fk_sales_buyer FOREIGN KEY (buyer_id) REFERENCES buyers (buyer_id),
+    CONSTRAINT fk_sales_seller FOREIGN KEY (seller_id) REFERENCES sellers (seller_id),
+    CONSTRAINT fk_sales_employee FOREIGN KEY (employee_id) REFERENCES employees (employee_id)
+);
+
+CREATE TABLE IF NOT EXISTS payments (
+    payment_id INT AUTO_INCREMENT PRIMARY KEY,
+    sale_id INT NOT NULL,
+    from_user_id INT NOT NULL,
+    to_user_id INT NULL,
+    payment_type VARCHAR(30) NOT NULL,
+    amount DECIMAL(18,2) NOT NULL,
+    notes VARCHAR(255) NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_payments_sale FOREIGN KEY (sale_id) REFERENCES sales (sale_id)
+);
@@ -0,0 +1,7 @@
+-- 0002_properties_updated_at.sql
+-- Change timestamp behind the ETag / Last-Modified validators (conditional.py).
+
+ALTER TABLE properties
+    ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP;
+
+ALTER TABLE properties ADD INDEX idx_properties_updated_at (updated_at);
@@ -0,0 +1,72 @@
+-- 0003_feature_tables.sql
+-- Tables of the feature modules: sales rollups (rollups.py), saved searches
+-- (matching.py), the job queue (jobs.py) and automated valuations
+-- (valuation.py). Later changes to them go in new numbered migrations.
+
+CREATE TABLE IF NOT EXISTS sales_by_agent (
+    employee_id INT NOT NULL PRIMARY KEY,
+    sales_count INT NOT NULL DEFAULT 0,
+    total_value DECIMAL(18,2) NOT NULL DEFAULT 0,
+    employee_commission DECIMAL(18,2) NOT NULL DEFAULT 0,
+    company_commission DECIMAL(18,2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS sales_by_month (
+    month CHAR(7) NOT NULL PRIMARY KEY,
+    sales_count INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(18,2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS sales_by_city (
+    city VARCHAR(100) NOT NULL PRIMARY KEY,
+    sales_count INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(18,2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS saved_searches (
+    search_id INT AUTO_INCREMENT PRIMARY KEY,
+    buyer_id INT NOT NULL,
+    city VARCHAR(100) NULL,
+    min_price DECIMAL(18,2) NULL,
+    max_price DECIMAL(18,2) NULL,
+    min_rooms INT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_saved_searches_buyer (buyer_id, created_at)
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(64) NOT NULL,
+    payload TEXT NOT NULL,
+    idempotency_key VARCHAR(191) NULL,
+    status ENUM('queued','running','done','failed') NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_after DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    finished_at DATETIME(6) NULL,
+    last_error TEXT NULL,
+    UNIQUE KEY uq_jobs_idempotency_key (idempotency_key),
+    INDEX idx_jobs_ready (status, run_after)
+);
+
+CREATE TABLE IF NOT EXISTS valuation_runs (
+    run_id INT AUTO_INCREMENT PRIMARY KEY,
+    mode VARCHAR(16) NOT NULL,
+    started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_sale_id INT NULL,
+    listings INT NOT NULL DEFAULT 0,
+    updated INT NOT NULL DEFAULT 0,
+    seconds DECIMAL(10,3) NULL
+);
+
+CREATE TABLE IF NOT EXISTS property_valuations (
+    property_id INT NOT NULL PRIMARY KEY,
+    run_id INT NOT NULL,
+    value DECIMAL(18,2) NOT NULL,
+    previous_value DECIMAL(18,2) NULL,
+    price_per_sqft DECIMAL(18,4) NOT NULL,
+    comps INT NOT NULL,
+    basis VARCHAR(16) NOT NULL,
+    INDEX idx_property_valuations_run (run_id)
+);
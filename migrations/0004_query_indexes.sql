@@ -0,0 +1,42 @@
+-- 0004_query_indexes.sql
+-- Composite / covering indexes for the access paths app.py uses.
+-- InnoDB appends the primary key to every secondary index, so keyset
+-- pagination on (x, property_id) is served by an index on x.
+-- Verify with:  python migrate.py check
+
+-- login / register: username OR email OR phone (index_merge union)
+ALTER TABLE users ADD UNIQUE INDEX uq_users_username (username);
+ALTER TABLE users ADD UNIQUE INDEX uq_users_email (email);
+ALTER TABLE users ADD UNIQUE INDEX uq_users_phone (phone);
+-- user_distribution: GROUP BY role from the index alone
+ALTER TABLE users ADD INDEX idx_users_role (role);
+
+-- /search with a city: equality prefix, then base_price order for the keyset
+ALTER TABLE properties ADD INDEX idx_properties_search (status, lifecycle_status, city, base_price);
+-- /search without a city; also property_status_stats (GROUP BY status)
+ALTER TABLE properties ADD INDEX idx_properties_listed_price (status, lifecycle_status, base_price);
+-- buyer dashboard: newest listings
+ALTER TABLE properties ADD INDEX idx_properties_listed_recent (status, lifecycle_status, created_at);
+-- seller and agent dashboards
+ALTER TABLE properties ADD INDEX idx_properties_seller (seller_id, created_at);
+ALTER TABLE properties ADD INDEX idx_properties_agent (listed_by_employee);
+-- /admin/properties keyset (created_at DESC, property_id DESC)
+ALTER TABLE properties ADD INDEX idx_properties_created (created_at);
+-- top_locations / district_properties / admin city counts: covering GROUP BY city
+ALTER TABLE properties ADD INDEX idx_properties_city_price (city, base_price);
+
+-- agent_dashboard: an agent's enquiries newest first
+ALTER TABLE enquiries ADD INDEX idx_enquiries_agent_date (employee_id, enquiry_date);
+-- saved-search leads: buyers already in touch about a listing
+ALTER TABLE enquiries ADD INDEX idx_enquiries_property_buyer (property_id, buyer_id);
+
+-- monthly revenue rebuilds, exports and valuation comparables by date
+ALTER TABLE sales ADD INDEX idx_sales_date (sale_date, final_price);
+
+ALTER TABLE property_photos ADD INDEX idx_property_photos_listing (property_id, is_primary, uploaded_at);
+ALTER TABLE seller_requests ADD INDEX idx_seller_requests_seller (seller_id, created_at);
+ALTER TABLE property_investments ADD INDEX idx_property_investments_investor (investor_id, created_at);
+ALTER TABLE employees ADD INDEX idx_employees_status (status);
+
+-- buyer dashboard lists saved searches newest first
+ALTER TABLE saved_searches DROP INDEX idx_saved_searches_buyer, ADD INDEX idx_saved_searches_buyer (buyer_id, created_at);
@@ -0,0 +1,5 @@
+-- 0005_listing_fulltext.sql
+-- Keyword search on /search?q= when the in-process index is off
+-- (KEYWORD_SEARCH=0): MATCH ... AGAINST instead of LIKE '%...%' scans.
+
+ALTER TABLE properties ADD FULLTEXT INDEX ft_properties_text (title, description);
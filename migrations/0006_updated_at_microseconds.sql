@@ -0,0 +1,9 @@
+-- 0006_updated_at_microseconds.sql
+-- properties.updated_at to the microsecond. The listing change feed
+-- (listing_sync.py) and the saved-search job keys (matching.py) tell versions
+-- of a listing apart by it; at second precision two changes within one
+-- second looked like one and the second was never applied.
+-- Rebuilds the table: on a large one, run it off-peak.
+
+ALTER TABLE properties
+    MODIFY COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
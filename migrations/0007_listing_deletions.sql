@@ -0,0 +1,11 @@
+-- 0007_listing_deletions.sql
+-- Tombstones for deleted listings. Deleting a user cascades to the seller's
+-- properties and leaves no row for the change feed (listing_sync.py) to
+-- find, so the deleting transaction records the ids here and every process
+-- drops them from its in-memory indexes on its next sync.
+
+CREATE TABLE IF NOT EXISTS listing_deletions (
+    property_id INT NOT NULL PRIMARY KEY,
+    deleted_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    INDEX idx_listing_deletions_deleted_at (deleted_at)
+);
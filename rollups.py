@@ -0,0 +1,46 @@
+# rollups.py
+# Sales aggregates maintained incrementally: sale_complete adds each sale to
+# them inside the sale's own transaction.
+# Backfill / repair from the raw sales table with:  python rollups.py rebuild
+import sys
+from db import transaction
+
+def record_sale(cur, employee_id, city, sale_date, final_price, employee_commission, company_commission):
+    """Add one sale to the rollups using the cursor of an open transaction."""
+    if employee_id is not None:
+        cur.execute("""INSERT INTO sales_by_agent (employee_id, sales_count, total_value, employee_commission, company_commission)
+                       VALUES (%s,1,%s,%s,%s)
+                       ON DUPLICATE KEY UPDATE sales_count=sales_count+1, total_value=total_value+VALUES(total_value),
+                       employee_commission=employee_commission+VALUES(employee_commission),
+                       company_commission=company_commission+VALUES(company_commission)""",
+                    (employee_id, final_price, employee_commission, company_commission))
+    cur.execute("""INSERT INTO sales_by_month (month, sales_count, revenue) VALUES (%s,1,%s)
+                   ON DUPLICATE KEY UPDATE sales_count=sales_count+1, revenue=revenue+VALUES(revenue)""",
+                (sale_date.strftime('%Y-%m'), final_price))
+    cur.execute("""INSERT INTO sales_by_city (city, sales_count, revenue) VALUES (%s,1,%s)
+                   ON DUPLICATE KEY UPDATE sales_count=sales_count+1, revenue=revenue+VALUES(revenue)""",
+                (city or '', final_price))
+
+def rebuild():
+    """Recompute every rollup from the raw sales rows."""
+    with transaction() as (conn, cur):
+        cur.execute('DELETE FROM sales_by_agent')
+        cur.execute('DELETE FROM sales_by_month')
+        cur.execute('DELETE FROM sales_by_city')
+        cur.execute("""INSERT INTO sales_by_agent (employee_id, sales_count, total_value, employee_commission, company_commission)
+                       SELECT employee_id, COUNT(*), COALESCE(SUM(final_price),0), COALESCE(SUM(employee_commission),0), COALESCE(SUM(company_commission),0)
+                       FROM sales WHERE employee_id IS NOT NULL GROUP BY employee_id""")
+        cur.execute("""INSERT INTO sales_by_month (month, sales_count, revenue)
+                       SELECT DATE_FORMAT(sale_date, '%Y-%m'), COUNT(*), COALESCE(SUM(final_price),0)
+                       FROM sales WHERE sale_date IS NOT NULL GROUP BY DATE_FORMAT(sale_date, '%Y-%m')""")
+        cur.execute("""INSERT INTO sales_by_city (city, sales_count, revenue)
+                       SELECT COALESCE(p.city,''), COUNT(*), COALESCE(SUM(s.final_price),0)
+                       FROM sales s LEFT JOIN properties p ON s.property_id=p.property_id
+                       GROUP BY COALESCE(p.city,'')""")
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['rebuild']:
+        print('usage: python rollups.py rebuild')
+        sys.exit(2)
+    rebuild()
+    print('Rollups rebuilt')
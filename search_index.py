@@ -0,0 +1,185 @@
+# search_index.py
+# In-process range index over Available/Enlisted listings for /search.
+# Enable with SEARCH_INDEX=1; when disabled (or a filter cannot be parsed)
+# search() returns None and the caller falls back to MySQL. Writes made by
+# other processes are picked up through listing_sync.
+import os
+import threading
+from bisect import bisect_left, bisect_right, insort
+from db import fetchone, iterate
+from listing_sync import ListingSync
+
+ENABLED = os.getenv("SEARCH_INDEX", "0") == "1"
+
+LISTED_SQL = "SELECT * FROM properties WHERE status='Available' AND lifecycle_status='Enlisted'"
+
+# MySQL sorts NULL before any value in ASC order
+NULL_PRICE = float('-inf')
+
+def city_key(city):
+    # approximate the default case/trailing-space insensitive collation
+    if city is None:
+        return None
+    return city.rstrip().casefold()
+
+def price_key(value):
+    return NULL_PRICE if value is None else float(value)
+
+def is_listed(row):
+    return row is not None and row.get('status') == 'Available' and row.get('lifecycle_status') == 'Enlisted'
+
+
+class Bucket:
+    """Listings of one city kept sorted by (base_price, property_id)."""
+
+    def __init__(self):
+        self.keys = []
+
+    def add(self, key):
+        insort(self.keys, key)
+
+    def remove(self, key):
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def price_range(self, min_price=None, max_price=None):
+        lo = 0 if min_price is None else bisect_left(self.keys, (min_price, float('-inf')))
+        hi = len(self.keys) if max_price is None else bisect_right(self.keys, (max_price, float('inf')))
+        return lo, hi
+
+
+class SearchIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loading = threading.Lock()
+        self.loaded = False
+        self.sync = ListingSync('*')
+        self.rows = {}
+        self.keys = {}
+        self.all = Bucket()
+        self.cities = {}
+
+    def load(self):
+        """Build a fresh index outside the lock and swap it in."""
+        self.sync.start()
+        fresh = SearchIndex()
+        for row in iterate(LISTED_SQL):
+            fresh._add(row)
+        with self.lock:
+            self.rows, self.keys = fresh.rows, fresh.keys
+            self.all, self.cities = fresh.all, fresh.cities
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self.loading:
+                if not self.loaded:
+                    self.load()
+        elif self.sync.due():
+            self.sync.apply(self.upsert, self.discard)
+
+    def catch_up(self, mark):
+        """Apply other processes' changes now unless the index is at mark (listing_sync.watermark())."""
+        if self.loaded and self.sync.behind(mark):
+            self.sync.apply(self.upsert, self.discard, wait=True, mark=mark)
+
+    def _add(self, row):
+        pid = row['property_id']
+        key = (price_key(row.get('base_price')), pid)
+        ck = city_key(row.get('city'))
+        self.rows[pid] = row
+        self.keys[pid] = (key, ck)
+        self.all.add(key)
+        self.cities.setdefault(ck, Bucket()).add(key)
+
+    def _remove(self, pid):
+        if pid not in self.rows:
+            return
+        key, ck = self.keys.pop(pid)
+        del self.rows[pid]
+        self.all.remove(key)
+        bucket = self.cities.get(ck)
+        if bucket:
+            bucket.remove(key)
+            if not bucket.keys:
+                del self.cities[ck]
+
+    def upsert(self, row):
+        with self.lock:
+            self._remove(row['property_id'])
+            if is_listed(row):
+                self._add(row)
+
+    def discard(self, property_id):
+        with self.lock:
+            self._remove(property_id)
+
+    def refresh(self, property_id):
+        """Re-read one listing after a write and patch the index."""
+        if not self.loaded:
+            return
+        row = fetchone('SELECT * FROM properties WHERE property_id=%s', (property_id,))
+        if row is None:
+            self.discard(property_id)
+        else:
+            self.upsert(row)
+
+    def search(self, city=None, min_price=None, max_price=None, min_rooms=None, limit=200, after=None):
+        self.ensure_loaded()
+        with self.lock:
+            bucket = self.cities.get(city_key(city)) if city else self.all
+            if bucket is None:
+                return []
+            lo, hi = bucket.price_range(min_price, max_price)
+            if min_price is not None or max_price is not None:
+                # NULL prices never satisfy a price predicate
+                lo = max(lo, bisect_right(bucket.keys, (NULL_PRICE, float('inf'))))
+            if after is not None:
+                lo = max(lo, bisect_right(bucket.keys, after))
+            out = []
+            for i in range(lo, hi):
+                row = self.rows[bucket.keys[i][1]]
+                if min_rooms is not None:
+                    rooms = row.get('total_rooms')
+                    if rooms is None or rooms < min_rooms:
+                        continue
+                out.append(row)
+                if len(out) >= limit:
+                    break
+            return out
+
+
+index = SearchIndex()
+
+def _number(value):
+    if value is None or value == '':
+        return None
+    return float(value)
+
+def search(city=None, min_price=None, max_price=None, min_rooms=None, limit=200, after=None):
+    """Answer a /search query from memory, or None to fall back to MySQL.
+
+    after is the (base_price, property_id) of the last row already shown.
+    """
+    if not ENABLED:
+        return None
+    try:
+        min_price, max_price, min_rooms = _number(min_price), _number(max_price), _number(min_rooms)
+        if after is not None:
+            after = (price_key(_number(after[0])), int(after[1]))
+    except (TypeError, ValueError):
+        return None
+    return index.search(city or None, min_price, max_price, min_rooms, limit, after)
+
+def catch_up(mark):
+    if ENABLED:
+        index.catch_up(mark)
+
+def refresh(property_id):
+    if ENABLED:
+        index.refresh(property_id)
+
+def discard(property_id):
+    if ENABLED:
+        index.discard(property_id)
@@ -0,0 +1,336 @@
+# session_store.py
+# Server-side sessions: an in-process LRU tier in front of a store shared by
+# every app process (SQLite by default; anything with the Store methods can
+# stand in). A session is only written back when its serialized contents
+# changed, or when its expiry is due for a refresh; expired rows are deleted
+# in small batches by a background thread.
+#   python session_store.py stats   # rows, expired rows, file size
+#   python session_store.py purge   # delete expired sessions now
+import os
+import sys
+import time
+import json
+import logging
+import sqlite3
+import secrets
+import threading
+from collections import OrderedDict
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+import metrics
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# sqlite:<path> (shared by the processes on one box) or memory (one process only)
+STORE = os.getenv("SESSION_STORE", "sqlite:" + os.path.join(BASE_DIR, "instance", "sessions.sqlite3"))
+CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+PURGE_SECONDS = float(os.getenv("SESSION_PURGE_SECONDS", "600"))
+PURGE_BATCH = 500
+# the stored expiry is pushed forward once this fraction of the lifetime has passed
+REFRESH_FRACTION = 0.1
+
+metrics.registry.describe('homescout_session_loads_total', 'counter', 'Session loads by the tier that answered')
+metrics.registry.describe('homescout_session_saves_total', 'counter', 'Session saves by outcome')
+metrics.registry.describe('homescout_sessions_purged_total', 'counter', 'Expired sessions deleted')
+
+serializer = TaggedJSONSerializer()
+
+
+class SqliteStore:
+    """Sessions in one SQLite file in WAL mode; one connection per thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # a throwaway connection, so a preloading parent holds none across fork()
+        conn = sqlite3.connect(path, timeout=5)
+        with conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                expires REAL NOT NULL
+            ) WITHOUT ROWID""")
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)')
+        conn.close()
+
+    def conn(self):
+        # connections must not cross a fork, so reopen in a child process
+        if getattr(self.local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+            self.local.data_version = None
+        return self.local.conn
+
+    def changed(self):
+        """False only if no other connection has committed since this thread last asked."""
+        version = self.conn().execute('PRAGMA data_version').fetchone()[0]
+        changed = version != self.local.data_version
+        self.local.data_version = version
+        return changed
+
+    def load(self, sid):
+        """(data, version, expires), or None when missing or expired."""
+        row = self.conn().execute('SELECT data, version, expires FROM sessions WHERE sid=? AND expires > ?',
+                                  (sid, time.time())).fetchone()
+        return tuple(row) if row else None
+
+    def version(self, sid):
+        row = self.conn().execute('SELECT version FROM sessions WHERE sid=? AND expires > ?',
+                                  (sid, time.time())).fetchone()
+        return row[0] if row else None
+
+    def save(self, sid, data, expires):
+        """Write a session; returns its new version."""
+        conn = self.conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute("""INSERT INTO sessions (sid, data, version, expires) VALUES (?,?,1,?)
+                            ON CONFLICT(sid) DO UPDATE SET data=excluded.data, version=version+1,
+                            expires=excluded.expires""", (sid, data, expires))
+            return conn.execute('SELECT version FROM sessions WHERE sid=?', (sid,)).fetchone()[0]
+
+    def delete(self, sid):
+        with self.conn() as conn:
+            conn.execute('DELETE FROM sessions WHERE sid=?', (sid,))
+
+    def purge(self, now=None, batch=PURGE_BATCH):
+        """Delete expired sessions a batch per transaction so writers never wait long."""
+        now = time.time() if now is None else now
+        conn = self.conn()
+        total = 0
+        while True:
+            with conn:
+                deleted = conn.execute("""DELETE FROM sessions WHERE sid IN
+                                          (SELECT sid FROM sessions WHERE expires <= ? LIMIT ?)""",
+                                       (now, batch)).rowcount
+            total += deleted
+            if deleted < batch:
+                return total
+            time.sleep(0.01)
+
+    def stats(self):
+        conn = self.conn()
+        rows = conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+        expired = conn.execute('SELECT COUNT(*) FROM sessions WHERE expires <= ?', (time.time(),)).fetchone()[0]
+        size = sum(os.path.getsize(p) for p in (self.path, self.path + '-wal') if os.path.exists(p))
+        return {'store': 'sqlite', 'path': self.path, 'sessions': rows, 'expired': expired, 'bytes': size}
+
+
+class MemoryStore:
+    """Sessions in a dict: for a single process (tests, the dev server)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = {}
+
+    def changed(self):
+        return False
+
+    def load(self, sid):
+        row = self.rows.get(sid)
+        return row if row and row[2] > time.time() else None
+
+    def version(self, sid):
+        row = self.load(sid)
+        return row[1] if row else None
+
+    def save(self, sid, data, expires):
+        with self.lock:
+            version = self.rows[sid][1] + 1 if sid in self.rows else 1
+            self.rows[sid] = (data, version, expires)
+            return version
+
+    def delete(self, sid):
+        with self.lock:
+            self.rows.pop(sid, None)
+
+    def purge(self, now=None, batch=PURGE_BATCH):
+        now = time.time() if now is None else now
+        with self.lock:
+            expired = [sid for sid, row in self.rows.items() if row[2] <= now]
+            for sid in expired:
+                del self.rows[sid]
+        return len(expired)
+
+    def stats(self):
+        return {'store': 'memory', 'sessions': len(self.rows)}
+
+
+def open_store(spec=STORE):
+    kind, _, arg = spec.partition(':')
+    if kind == 'sqlite':
+        return SqliteStore(arg)
+    if kind == 'memory':
+        return MemoryStore()
+    raise ValueError(f'unknown SESSION_STORE {spec!r}')
+
+
+class Tier:
+    """In-process LRU of decoded sessions in front of a shared store.
+
+    Another process may have changed a session since it was cached, so an
+    entry is trusted only while the store reports no foreign commits
+    (`epoch` has not moved since the entry was read); otherwise its version
+    is checked, which is cheaper than reading and decoding the data.
+    """
+
+    def __init__(self, store, size=CACHE_SIZE):
+        self.store = store
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # sid -> (data, version, expires, epoch)
+        self.epoch = 0
+
+    def _remember(self, sid, data, version, expires, epoch):
+        with self.lock:
+            self.entries[sid] = (data, version, expires, epoch)
+            self.entries.move_to_end(sid)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def load(self, sid):
+        """(data, expires) or None."""
+        if self.store.changed():
+            with self.lock:
+                self.epoch += 1
+        epoch = self.epoch
+        with self.lock:
+            entry = self.entries.get(sid)
+            if entry is not None:
+                self.entries.move_to_end(sid)
+        if entry is not None and entry[2] > time.time():
+            if entry[3] == epoch or self.store.version(sid) == entry[1]:
+                metrics.registry.inc('homescout_session_loads_total', tier='local')
+                self._remember(sid, entry[0], entry[1], entry[2], epoch)
+                return entry[0], entry[2]
+        row = self.store.load(sid)
+        if row is None:
+            self.forget(sid)
+            metrics.registry.inc('homescout_session_loads_total', tier='miss')
+            return None
+        metrics.registry.inc('homescout_session_loads_total', tier='store')
+        data, version, expires = row
+        self._remember(sid, data, version, expires, epoch)
+        return data, expires
+
+    def save(self, sid, data, expires):
+        epoch = self.epoch
+        version = self.store.save(sid, data, expires)
+        self._remember(sid, data, version, expires, epoch)
+
+    def forget(self, sid):
+        with self.lock:
+            self.entries.pop(sid, None)
+
+    def delete(self, sid):
+        self.forget(sid)
+        self.store.delete(sid)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, data=None, expires=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.data = data          # serialized form as loaded, None for a new session
+        self.expires = expires
+        self.modified = False
+
+
+class TieredSessionInterface(SessionInterface):
+    def __init__(self, tier):
+        self.tier = tier
+        self._purger = None
+        self._purger_lock = threading.Lock()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            found = self.tier.load(sid)
+            if found is not None:
+                data, expires = found
+                return ServerSession(serializer.loads(data), sid=sid, data=data, expires=expires)
+        return ServerSession(sid=secrets.token_urlsafe(32))
+
+    def rotate(self, session):
+        """Move session to a fresh sid, keeping its contents, and drop the old one.
+
+        Call on login so a sid planted before it (session fixation) never
+        becomes an authenticated session.
+        """
+        if session.data is not None:
+            self.tier.delete(session.sid)
+        session.sid = secrets.token_urlsafe(32)
+        # nothing stored under the new sid yet: save_session writes it and sets the cookie
+        session.data = None
+        session.modified = True
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session:
+            # flashing a message and popping it leaves nothing to keep
+            if session.data is not None:
+                self.tier.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+                metrics.registry.inc('homescout_session_saves_total', outcome='deleted')
+            return
+        data = serializer.dumps(dict(session))
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        stale = session.expires is not None and session.expires - now < lifetime * (1 - REFRESH_FRACTION)
+        if data == session.data and not stale:
+            metrics.registry.inc('homescout_session_saves_total', outcome='unchanged')
+            return
+        self.tier.save(session.sid, data, now + lifetime)
+        metrics.registry.inc('homescout_session_saves_total', outcome='refreshed' if data == session.data else 'written')
+        self._start_purger()
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def _start_purger(self):
+        # started on first use rather than at import, so it lives in the process that serves
+        if self._purger is not None and self._purger.is_alive():
+            return
+        with self._purger_lock:
+            if self._purger is None or not self._purger.is_alive():
+                self._purger = threading.Thread(target=self._purge_loop, name='session-purge', daemon=True)
+                self._purger.start()
+
+    def _purge_loop(self):
+        while True:
+            time.sleep(PURGE_SECONDS)
+            try:
+                metrics.registry.inc('homescout_sessions_purged_total', self.tier.store.purge())
+            except Exception as e:
+                log.warning('session purge failed: %s', e)
+
+
+def init_app(app, store=None):
+    """Install the tiered session interface on app."""
+    interface = TieredSessionInterface(Tier(store or open_store()))
+    app.session_interface = interface
+    return interface
+
+if __name__ == '__main__':
+    command = sys.argv[1:]
+    if command not in (['stats'], ['purge']):
+        print('usage: python session_store.py stats|purge')
+        sys.exit(2)
+    store = open_store()
+    if command == ['purge']:
+        print(f'{store.purge()} expired sessions deleted')
+    else:
+        print(json.dumps(store.stats(), indent=2))
@@ -0,0 +1,270 @@
+# similar.py
+# "Similar properties": k-nearest neighbours over a NumPy feature matrix of
+# Available/Enlisted listings. The matrix is built once per process and
+# patched row by row when a listing changes, here or (via listing_sync) in
+# another process. The neighbours found are re-read from MySQL, so a listing
+# sold since the last sync is never recommended.
+#   python similar.py bench      # query latency at 10k / 100k / 1M listings
+import os
+import sys
+import time
+import threading
+import numpy as np
+from db import fetchone, fetchall, iterate
+from listing_sync import ListingSync
+
+ENABLED = os.getenv("SIMILAR_LISTINGS", "1") == "1"
+
+LISTED_SQL = ("SELECT property_id, title, city, location, area_sqft, total_rooms, bathrooms, floor, base_price, has_lift, parking_type "
+              "FROM properties WHERE status='Available' AND lifecycle_status='Enlisted'")
+CHANGED_COLUMNS = ("property_id, title, city, location, area_sqft, total_rooms, bathrooms, floor, base_price, has_lift, "
+                   "parking_type, status, lifecycle_status, updated_at")
+# neighbours looked up beyond k, to make up for any found sold on re-check
+SPARE = 4
+
+NUMERIC = ('area_sqft', 'total_rooms', 'bathrooms', 'floor', 'base_price', 'has_lift')
+# per-feature weights on the standardized values; features are stored
+# multiplied by sqrt(weight) so a weighted distance is a plain dot product
+WEIGHTS = np.array([1.0, 1.0, 0.5, 0.3, 1.5, 0.3], dtype=np.float32)
+ROOT_WEIGHTS = np.sqrt(WEIGHTS)
+CITY_PENALTY = 4.0
+PARKING_PENALTY = 0.3
+
+
+def numeric_vector(row):
+    values = []
+    for col in NUMERIC:
+        v = row.get(col)
+        if v is None:
+            values.append(np.nan)
+        elif col == 'base_price':
+            values.append(np.log1p(max(float(v), 0.0)))
+        else:
+            values.append(float(v))
+    return np.array(values, dtype=np.float32)
+
+
+class SimilarityIndex:
+    def __init__(self, capacity=1024):
+        self.lock = threading.RLock()
+        self.loading = threading.Lock()
+        self.loaded = False
+        self.sync = ListingSync(CHANGED_COLUMNS)
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.raw = np.full((capacity, len(NUMERIC)), np.nan, dtype=np.float32)
+        # column-major (feature x listing) so a query is a few contiguous passes
+        self.features = np.zeros((len(NUMERIC), capacity), dtype=np.float32)
+        # squared norm of each feature row; inf marks a free slot
+        self.sqnorm = np.full(capacity, np.inf, dtype=np.float32)
+        self.city = np.full(capacity, -1, dtype=np.int32)
+        self.parking = np.full(capacity, -1, dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+        self.free = []
+        self.row_of = {}
+        self.codes = {}
+        self.mean = np.zeros(len(NUMERIC), dtype=np.float32)
+        self.scale = np.ones(len(NUMERIC), dtype=np.float32)
+
+    def _code(self, value):
+        key = (value or '').strip().casefold()
+        return self.codes.setdefault(key, len(self.codes))
+
+    def _grow(self):
+        capacity = len(self.alive) * 2
+        old = self.features
+        self.features = np.zeros((len(NUMERIC), capacity), dtype=np.float32)
+        self.features[:, :old.shape[1]] = old
+        for name in ('raw', 'sqnorm', 'city', 'parking', 'alive', 'ids'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            if name == 'alive':
+                new[len(old):] = False
+            elif name == 'sqnorm':
+                new[len(old):] = np.inf
+            setattr(self, name, new)
+
+    def _standardize(self, raw):
+        # missing values land on the mean (0 after scaling)
+        z = (raw - self.mean) / self.scale
+        return np.nan_to_num(z, nan=0.0) * ROOT_WEIGHTS
+
+    def load(self, rows=None):
+        """Build a fresh matrix, outside the lock, and swap it in."""
+        if rows is None:
+            self.sync.start()
+            rows = iterate(LISTED_SQL)
+        fresh = SimilarityIndex()
+        for row in rows:
+            fresh._place(row)
+        live = fresh.raw[:fresh.size][fresh.alive[:fresh.size]]
+        if len(live):
+            with np.errstate(all='ignore'):
+                mean = np.nanmean(live, axis=0)
+                std = np.nanstd(live, axis=0)
+            fresh.mean = np.nan_to_num(mean, nan=0.0).astype(np.float32)
+            fresh.scale = np.where(np.isnan(std) | (std == 0), 1.0, std).astype(np.float32)
+        n = fresh.size
+        fresh.features[:, :n] = fresh._standardize(fresh.raw[:n]).T
+        fresh.sqnorm[:n] = np.where(fresh.alive[:n], (fresh.features[:, :n] ** 2).sum(axis=0), np.inf)
+        with self.lock:
+            for name in STATE:
+                setattr(self, name, getattr(fresh, name))
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self.loading:
+                if not self.loaded:
+                    self.load()
+        elif self.sync.due():
+            self.sync.apply(self.upsert, self.discard)
+
+    def catch_up(self, mark):
+        """Apply other processes' changes now unless the index is at mark (listing_sync.watermark())."""
+        if self.loaded and self.sync.behind(mark):
+            self.sync.apply(self.upsert, self.discard, wait=True, mark=mark)
+
+    def _place(self, row):
+        pid = row['property_id']
+        i = self.row_of.get(pid)
+        if i is None:
+            if self.free:
+                i = self.free.pop()
+            else:
+                if self.size == len(self.alive):
+                    self._grow()
+                i = self.size
+                self.size += 1
+            self.row_of[pid] = i
+        self.raw[i] = numeric_vector(row)
+        self.city[i] = self._code(row.get('city'))
+        self.parking[i] = self._code('parking:' + (row.get('parking_type') or 'None'))
+        self.ids[i] = pid
+        self.alive[i] = True
+        return i
+
+    def upsert(self, row):
+        """Patch one listing in place; the scaling stats are kept from the last load."""
+        with self.lock:
+            if row.get('status', 'Available') != 'Available' or row.get('lifecycle_status', 'Enlisted') != 'Enlisted':
+                self._remove(row['property_id'])
+                return
+            i = self._place(row)
+            self.features[:, i] = self._standardize(self.raw[i])
+            self.sqnorm[i] = self.features[:, i] @ self.features[:, i]
+
+    def _remove(self, property_id):
+        i = self.row_of.pop(property_id, None)
+        if i is None:
+            return
+        self.alive[i] = False
+        self.sqnorm[i] = np.inf
+        self.free.append(i)
+
+    def discard(self, property_id):
+        with self.lock:
+            self._remove(property_id)
+
+    def refresh(self, property_id):
+        if not self.loaded:
+            return
+        row = fetchone('SELECT property_id, title, city, location, area_sqft, total_rooms, bathrooms, floor, base_price, has_lift, parking_type, status, lifecycle_status FROM properties WHERE property_id=%s', (property_id,))
+        if row is None:
+            self.discard(property_id)
+        else:
+            self.upsert(row)
+
+    def nearest(self, property_id, k=6):
+        """Property ids of the k listings closest to property_id, nearest first."""
+        with self.lock:
+            i = self.row_of.get(property_id)
+            if i is None:
+                return []
+            n = self.size
+            # |a-b|^2 = |a|^2 - 2a.b + |b|^2; |b|^2 is the same for every row
+            dist = (self.features[:, i] * np.float32(-2.0)) @ self.features[:, :n]
+            dist += self.sqnorm[:n]
+            dist += (self.city[:n] != self.city[i]) * np.float32(CITY_PENALTY)
+            dist += (self.parking[:n] != self.parking[i]) * np.float32(PARKING_PENALTY)
+            dist[i] = np.inf
+            k = min(k, len(self.row_of) - 1)
+            if k <= 0:
+                return []
+            top = np.argpartition(dist, k - 1)[:k]
+            top = top[np.argsort(dist[top], kind='stable')]
+            return [int(self.ids[j]) for j in top]
+
+
+# what load() builds and swaps in
+STATE = ('raw', 'features', 'sqnorm', 'city', 'parking', 'alive', 'ids', 'size', 'free', 'row_of', 'codes', 'mean', 'scale')
+
+index = SimilarityIndex()
+
+def similar(property_id, k=6):
+    """Up to k listings like property_id, nearest first, as they are in MySQL now."""
+    if not ENABLED:
+        return []
+    index.ensure_loaded()
+    ids = index.nearest(property_id, k + SPARE)
+    if not ids:
+        return []
+    rows = fetchall("SELECT property_id, title, city, location, base_price, total_rooms, area_sqft FROM properties "
+                    "WHERE property_id IN (%s) AND status='Available' AND lifecycle_status='Enlisted'"
+                    % ','.join(['%s'] * len(ids)), tuple(ids))
+    by_id = {r['property_id']: r for r in rows}
+    return [by_id[pid] for pid in ids if pid in by_id][:k]
+
+def catch_up(mark):
+    if ENABLED:
+        index.catch_up(mark)
+
+def refresh(property_id):
+    if ENABLED:
+        index.refresh(property_id)
+
+def discard(property_id):
+    if ENABLED:
+        index.discard(property_id)
+
+
+def synthetic_rows(n, seed=7):
+    rng = np.random.default_rng(seed)
+    cities = ['Dhaka', 'Chattogram', 'Sylhet', 'Khulna', 'Rajshahi', 'Barishal', 'Rangpur', 'Mymensingh', 'Cumilla', "Cox's Bazar"]
+    parking = ['None', 'Open', 'Covered', 'Garage']
+    area = rng.integers(500, 4000, n)
+    rooms = rng.integers(1, 7, n)
+    for i in range(n):
+        yield {'property_id': i + 1, 'title': f'Listing {i + 1}', 'city': cities[i % len(cities)], 'location': None,
+               'area_sqft': int(area[i]), 'total_rooms': int(rooms[i]), 'bathrooms': int(max(1, rooms[i] - 1)),
+               'floor': int(i % 15), 'base_price': float(area[i] * 6000), 'has_lift': i % 3 == 0,
+               'parking_type': parking[i % len(parking)]}
+
+def bench(sizes=(10_000, 100_000, 1_000_000), queries=200):
+    for n in sizes:
+        idx = SimilarityIndex()
+        started = time.perf_counter()
+        idx.load(list(synthetic_rows(n)))
+        build = time.perf_counter() - started
+        rng = np.random.default_rng(1)
+        samples = []
+        for pid in rng.integers(1, n + 1, queries):
+            t = time.perf_counter()
+            idx.nearest(int(pid), 6)
+            samples.append((time.perf_counter() - t) * 1000)
+        t = time.perf_counter()
+        idx.upsert(dict(next(synthetic_rows(1)), property_id=n + 1))
+        patch = (time.perf_counter() - t) * 1000
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        print(f'{n:>9,} listings  build {build:6.2f}s  query p50 {p50:6.2f}ms  p95 {p95:6.2f}ms  p99 {p99:6.2f}ms  patch {patch:.3f}ms')
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['bench']:
+        print('usage: python similar.py bench [N ...]')
+        sys.exit(2)
+    sizes = tuple(int(a) for a in sys.argv[2:]) or (10_000, 100_000, 1_000_000)
+    bench(sizes)
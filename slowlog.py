@@ -0,0 +1,112 @@
+# slowlog.py
+# Bounded log of statements slower than SLOW_QUERY_MS, with one EXPLAIN per
+# normalized statement.
+import os
+import re
+import time
+import threading
+from collections import deque, OrderedDict
+import metrics
+
+THRESHOLD = float(os.getenv("SLOW_QUERY_MS", "200")) / 1000.0
+LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "1000"))
+MAX_PLANS = 500
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%s")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+def normalize(sql):
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PARAM.sub('?', sql)
+    sql = _IN_LIST.sub('(?+)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+def params_shape(params):
+    if params is None:
+        return '()'
+    if isinstance(params, list) and params and isinstance(params[0], (tuple, list, dict)):
+        return f'{len(params)} x {params_shape(params[0])}'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in params.items()) + '}'
+    return '(' + ', '.join(type(p).__name__ for p in params) + ')'
+
+def explainable(sql):
+    return sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE')
+
+
+class SlowQueryLog:
+    def __init__(self, threshold=THRESHOLD, size=LOG_SIZE):
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.entries = deque(maxlen=size)
+        self.plans = OrderedDict()   # normalized sql -> explain rows (None while pending)
+
+    def record(self, sql, params, seconds, explain=None):
+        if seconds < self.threshold:
+            return
+        stats = metrics.current()
+        norm = normalize(sql)
+        entry = {
+            'sql': _SPACE.sub(' ', sql).strip(),
+            'normalized': norm,
+            'params': params_shape(params),
+            'seconds': seconds,
+            'route': stats.route if stats else 'background',
+            'at': time.time(),
+        }
+        with self.lock:
+            self.entries.append(entry)
+            need_plan = explain is not None and norm not in self.plans and explainable(sql)
+            if need_plan:
+                self.plans[norm] = None
+                while len(self.plans) > MAX_PLANS:
+                    self.plans.popitem(last=False)
+        if need_plan:
+            # plan capture must not add latency to the slow request itself
+            threading.Thread(target=self._capture_plan, args=(norm, sql, params, explain), daemon=True).start()
+
+    def _capture_plan(self, norm, sql, params, explain):
+        try:
+            plan = explain(sql, params)
+        except Exception as e:
+            plan = [{'error': str(e)}]
+        with self.lock:
+            if norm in self.plans:
+                self.plans[norm] = plan
+
+    def offenders(self):
+        """Slow statements grouped by normalized SQL, worst total time first."""
+        with self.lock:
+            entries = list(self.entries)
+            plans = dict(self.plans)
+        groups = {}
+        for e in entries:
+            g = groups.get(e['normalized'])
+            if g is None:
+                g = groups[e['normalized']] = {
+                    'normalized': e['normalized'], 'count': 0, 'total': 0.0, 'max': 0.0,
+                    'routes': set(), 'params': e['params'], 'example': e['sql'], 'last_seen': 0,
+                }
+            g['count'] += 1
+            g['total'] += e['seconds']
+            g['max'] = max(g['max'], e['seconds'])
+            g['routes'].add(e['route'])
+            g['last_seen'] = max(g['last_seen'], e['at'])
+        out = sorted(groups.values(), key=lambda g: g['total'], reverse=True)
+        for g in out:
+            g['avg'] = g['total'] / g['count']
+            g['routes'] = sorted(g['routes'])
+            g['plan'] = plans.get(g['normalized'])
+        return out
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.plans.clear()
+
+
+log = SlowQueryLog()
@@ -1,4 +1,6 @@
 ﻿# utils.py
+import json
+import base64
 
 def to_int(x):
     try:
@@ -17,3 +19,27 @@ def currency(x):
         return f"{float(x):,.2f}"
     except:
         return x
+
+# --- keyset pagination ---
+def encode_cursor(values):
+    raw = json.dumps(list(values), default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(token, size):
+    """Return the sort-key values of a cursor, or None if it is missing/invalid."""
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except:
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+def split_page(rows, page_size, key):
+    """rows holds up to page_size+1 items; return (page, next_cursor)."""
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, encode_cursor(key(rows[-1]))
+    return rows, None
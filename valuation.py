@@ -0,0 +1,142 @@
+# valuation.py
+# Batch automated valuation from comparable sales.
+#   python valuation.py                # revalue every enlisted listing
+#   python valuation.py --incremental  # only listings touched by new sales
+# Each listing is valued at area_sqft x the mean price per sqft of recent
+# sales with the same city and room count, falling back to the city and then
+# to all recent sales when there are fewer than MIN_COMPS comparables.
+# estimated_market_value is only replaced where it still holds the default
+# (NULL or base_price) or the previous automated value, never a figure an
+# agent typed in.
+import os
+import sys
+import time
+import numpy as np
+from db import fetchone, iterate, execute, execute_many, connection
+
+MONTHS = int(os.getenv("VALUATION_MONTHS", "24"))
+MIN_COMPS = int(os.getenv("VALUATION_MIN_COMPS", "3"))
+
+LISTINGS_SQL = ("SELECT p.property_id, p.city, p.total_rooms, p.area_sqft FROM properties p "
+                "WHERE p.status='Available' AND p.lifecycle_status='Enlisted' AND p.area_sqft > 0")
+
+def city_key(city):
+    return (city or '').strip().casefold()
+
+def group_stats(keys, values):
+    """Vectorized group-by: sorted unique keys, mean value and count per key."""
+    if len(keys) == 0:
+        return np.array([], dtype=keys.dtype), np.array([]), np.array([], dtype=np.int64)
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse)
+    means = np.bincount(inverse, weights=values) / counts
+    return uniq, means, counts
+
+def lookup(uniq, means, counts, keys):
+    """Per-key (mean, count), with count 0 where the key has no group."""
+    if len(uniq) == 0:
+        return np.zeros(len(keys)), np.zeros(len(keys), dtype=np.int64)
+    pos = np.clip(np.searchsorted(uniq, keys), 0, len(uniq) - 1)
+    hit = uniq[pos] == keys
+    return np.where(hit, means[pos], 0.0), np.where(hit, counts[pos], 0)
+
+def load_comparables(months=MONTHS):
+    cities, rooms, ppsf = [], [], []
+    for r in iterate("""SELECT p.city, p.total_rooms, s.final_price, p.area_sqft FROM sales s
+                        JOIN properties p ON s.property_id=p.property_id
+                        WHERE s.sale_date >= DATE_SUB(CURDATE(), INTERVAL %s MONTH)
+                        AND p.area_sqft > 0 AND s.final_price > 0""", (months,)):
+        cities.append(city_key(r['city']))
+        rooms.append(r['total_rooms'] if r['total_rooms'] is not None else -1)
+        ppsf.append(float(r['final_price']) / float(r['area_sqft']))
+    return np.array(cities, dtype=str), np.array(rooms, dtype=np.int64), np.array(ppsf, dtype=np.float64)
+
+def estimate(listing_cities, listing_rooms, listing_area, comp_cities, comp_rooms, comp_ppsf):
+    """Vectorized estimates: (value, price_per_sqft, comps, basis) arrays."""
+    n = len(listing_area)
+    comp_keys = np.char.add(np.char.add(comp_cities, '|'), comp_rooms.astype(str)) if len(comp_cities) else comp_cities
+    listing_keys = np.char.add(np.char.add(listing_cities, '|'), listing_rooms.astype(str))
+    by_group = lookup(*group_stats(comp_keys, comp_ppsf), listing_keys)
+    by_city = lookup(*group_stats(comp_cities, comp_ppsf), listing_cities)
+    ppsf = np.zeros(n)
+    comps = np.zeros(n, dtype=np.int64)
+    basis = np.full(n, '', dtype=object)
+    if len(comp_ppsf) >= MIN_COMPS:
+        ppsf[:] = comp_ppsf.mean()
+        comps[:] = len(comp_ppsf)
+        basis[:] = 'global'
+    # narrower comparables win when there are enough of them
+    for (mean, count), name in ((by_city, 'city'), (by_group, 'city_rooms')):
+        use = count >= MIN_COMPS
+        ppsf[use], comps[use], basis[use] = mean[use], count[use], name
+    return listing_area * ppsf, ppsf, comps, basis
+
+def affected_filter(last_sale_id):
+    """SQL fragment and params restricting listings to those new sales can move."""
+    cities = [r['city'] for r in iterate('SELECT DISTINCT p.city FROM sales s JOIN properties p ON s.property_id=p.property_id WHERE s.sale_id > %s', (last_sale_id,))]
+    clauses = ["p.property_id NOT IN (SELECT property_id FROM property_valuations)",
+               "p.property_id IN (SELECT property_id FROM property_valuations WHERE basis='global')"]
+    params = []
+    if cities:
+        clauses.append('p.city IN (%s)' % ','.join(['%s'] * len(cities)))
+        params += cities
+    return ' AND (' + ' OR '.join(clauses) + ')', params
+
+def run(incremental=False):
+    started = time.perf_counter()
+    mode = 'incremental' if incremental else 'full'
+    max_sale = fetchone('SELECT MAX(sale_id) as id FROM sales')['id']
+    # runs that crashed or are still going never set seconds: their sales aren't covered yet
+    last = fetchone('SELECT MAX(last_sale_id) as id FROM valuation_runs WHERE seconds IS NOT NULL')['id']
+    run_id = execute('INSERT INTO valuation_runs (mode, last_sale_id) VALUES (%s,%s)', (mode, max_sale))
+
+    sql, params = LISTINGS_SQL, []
+    if incremental and last is not None:
+        extra, params = affected_filter(last)
+        sql += extra
+    ids, cities, rooms, area = [], [], [], []
+    for r in iterate(sql, tuple(params)):
+        ids.append(r['property_id'])
+        cities.append(city_key(r['city']))
+        rooms.append(r['total_rooms'] if r['total_rooms'] is not None else -1)
+        area.append(float(r['area_sqft']))
+    loaded = time.perf_counter()
+
+    comp_cities, comp_rooms, comp_ppsf = load_comparables()
+    value, ppsf, comps, basis = estimate(np.array(cities, dtype=str), np.array(rooms, dtype=np.int64),
+                                         np.array(area, dtype=np.float64), comp_cities, comp_rooms, comp_ppsf)
+    valued = comps > 0
+    computed = time.perf_counter()
+
+    execute_many("""INSERT INTO property_valuations (property_id, run_id, value, price_per_sqft, comps, basis)
+                    VALUES (%s,%s,%s,%s,%s,%s)
+                    ON DUPLICATE KEY UPDATE previous_value=value, value=VALUES(value), run_id=VALUES(run_id),
+                    price_per_sqft=VALUES(price_per_sqft), comps=VALUES(comps), basis=VALUES(basis)""",
+                 ((ids[i], run_id, round(float(value[i]), 2), round(float(ppsf[i]), 4), int(comps[i]), basis[i])
+                  for i in np.flatnonzero(valued)), batch_size=5000)
+    # one set-based UPDATE for the whole run instead of a statement per listing;
+    # updated_at is left alone: no page shows the estimate from an in-memory
+    # index or behind an ETag, and bumping it would send every revalued row
+    # down each app process's change feed (listing_sync)
+    with connection() as (conn, cur):
+        cur.execute("""UPDATE properties p JOIN property_valuations v ON v.property_id=p.property_id
+                       SET p.estimated_market_value=v.value, p.updated_at=p.updated_at
+                       WHERE v.run_id=%s AND (p.estimated_market_value IS NULL
+                           OR p.estimated_market_value=p.base_price
+                           OR p.estimated_market_value=v.previous_value)""", (run_id,))
+        updated = cur.rowcount
+        conn.commit()
+    seconds = time.perf_counter() - started
+    execute('UPDATE valuation_runs SET listings=%s, updated=%s, seconds=%s WHERE run_id=%s',
+            (int(valued.sum()), updated, round(seconds, 3), run_id))
+    print(f'{mode} run {run_id}: {len(ids)} listings, {int(valued.sum())} valued from {len(comp_ppsf)} sales, '
+          f'{updated} estimates updated in {seconds:.2f}s '
+          f'(load {loaded - started:.2f}s, compute {computed - loaded:.2f}s, write {time.perf_counter() - computed:.2f}s)')
+    return run_id
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args not in ([], ['--incremental']):
+        print('usage: python valuation.py [--incremental]')
+        sys.exit(2)
+    run(incremental=bool(args))
@@ -0,0 +1,32 @@
+# wsgi.py
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+# gunicorn.conf.py sets preload_app, so this module is imported once in the
+# master. Routes are registered and every template is compiled there. The
+# workers are forked afterwards and share those pages copy-on-write. MySQL
+# pools, job threads and the in-memory listing indexes are per worker and
+# only built after the fork; the indexes follow each other's writes through
+# listing_sync.
+import gc
+import logging
+from app import create_app
+
+def preload(app):
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    # build the URL matcher now rather than on each worker's first request
+    app.url_map.bind('localhost').match('/')
+    gc.collect()
+    # keep the collector from writing to (and so un-sharing) preloaded objects
+    gc.freeze()
+    return app
+
+def use_gunicorn_logging():
+    # warnings from db, jobs and session_store go to gunicorn's error log
+    errors = logging.getLogger('gunicorn.error')
+    if errors.handlers:
+        root = logging.getLogger()
+        root.handlers = errors.handlers
+        root.setLevel(errors.level)
+
+use_gunicorn_logging()
+app = preload(create_app())